@@ -9,6 +9,7 @@ __version__ = "0.1.8"
 from . import (
     abc,
     analysis,
+    cache,
     classfile,
     constants,
     environment,
@@ -21,7 +22,9 @@ from . import (
     verifier,
 )
 from ._helper import *
+from ._parallel import *
 from .analysis import *
+from .cache import *
 from .classfile import *
 from .environment import *
 from .error import *
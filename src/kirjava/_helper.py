@@ -13,6 +13,7 @@ from io import BytesIO
 from typing import IO
 
 from .analysis import InsnGraph, Trace
+from .cache import method_key, Cache
 from .classfile import ClassFile, MethodInfo
 
 
@@ -48,12 +49,16 @@ def dump(classfile: ClassFile, file_or_stream: str | IO[bytes]) -> None:
     classfile.write(file_or_stream)
 
 
-def disassemble(method: MethodInfo, ignore_flags: bool = False, **kwargs: bool) -> InsnGraph:
+def disassemble(
+        method: MethodInfo, ignore_flags: bool = False, cache: Cache | None = None, **kwargs: bool,
+) -> InsnGraph:
     """
     Disassembles the provided method. If the method has multiple Code attributes, the first is chosen.
 
     :param method: The method to disassemble.
     :param ignore_flags: Skip checking if the method is abstract or native and try to disassemble anyway.
+    :param cache: A cache to look up/store the graph in. Graphs refer to live objects, so this can't be a persistent
+                  cache (i.e. a DiskCache), use trace_all() with those instead.
     :param kwargs: Any extra arguments to pass to the disassemble method (see InsnGraph.disassemble()).
     :return: The disassembled instruction graph.
     """
@@ -67,24 +72,61 @@ def disassemble(method: MethodInfo, ignore_flags: bool = False, **kwargs: bool)
         if method.is_native:
             raise ValueError("Method %r is native, cannot disassemble." % str(method))
 
+    if cache is not None and cache.persistent:
+        raise TypeError("Graphs cannot be stored in persistent cache %r." % cache)
+
     if method.code is None:
         return InsnGraph(method)  # Just create an empty instruction graph
-    return InsnGraph.disassemble(method, **kwargs)
+    if cache is None:
+        return InsnGraph.disassemble(method, **kwargs)
+
+    # Disassemblies that hit the budget raise, so aren't cached, meaning the budget doesn't need to be part of the key.
+    key = method_key(method, "graph", sorted((name, value) for name, value in kwargs.items() if name != "budget"))
+    graph = cache.get(key)
+    if graph is None:
+        graph = InsnGraph.disassemble(method, **kwargs)
+        cache.put(key, graph.copy())  # The copy is kept pristine, in case the caller modifies this graph.
+        return graph
 
+    graph = graph.copy()
+    graph.method = method
+    return graph
 
-def trace(method_or_graph: MethodInfo | InsnGraph, **kwargs: bool) -> Trace:
+
+def trace(method_or_graph: MethodInfo | InsnGraph, cache: Cache | None = None, **kwargs: bool) -> Trace:
     """
     Traces the provided graph or method and prints the results to stdout.
 
     :param method_or_graph: The method or graph to trace.
+    :param cache: A cache to look up/store the trace in, only used for methods. Cached traces are shared, so neither
+                  they nor their graphs should be modified. As with disassemble(), this can't be a persistent cache.
     :param kwargs: Any extra arguments to pass to the trace method (see Trace.from_graph()).
     """
 
+    if cache is not None and cache.persistent:
+        raise TypeError("Traces cannot be stored in persistent cache %r." % cache)
+
     if isinstance(method_or_graph, MethodInfo):
-        method_or_graph = disassemble(method_or_graph)
+        if cache is None or method_or_graph.code is None:
+            return Trace.from_graph(disassemble(method_or_graph, cache=cache), **kwargs)
+
+        # Unlike graphs, traces aren't copied on a hit, so they're only shared by the same method (i.e. if its class is
+        # read again), otherwise the graph would belong to the wrong method. As with graphs, the budget isn't keyed on.
+        class_ = method_or_graph.class_
+        key = method_key(
+            method_or_graph, "trace", class_.name if class_ is not None else None, method_or_graph.name,
+            sorted((name, value) for name, value in kwargs.items() if name != "budget"),
+        )
+        trace_ = cache.get(key)
+        if trace_ is None:
+            trace_ = Trace.from_graph(disassemble(method_or_graph, cache=cache), **kwargs)
+            cache.put(key, trace_)
+        elif trace_.graph.method is not method_or_graph:
+            trace_.graph.method = method_or_graph
+        return trace_
 
     if not isinstance(method_or_graph, InsnGraph):
-        raise TypeError("Expected type %r or %r, got %r." % (MethodInfo, InsnGraph, type(graph_or_method)))
+        raise TypeError("Expected type %r or %r, got %r." % (MethodInfo, InsnGraph, type(method_or_graph)))
 
     return Trace.from_graph(method_or_graph, **kwargs)
 
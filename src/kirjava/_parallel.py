@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+
+__all__ = (
+    "MethodSummary",
+    "trace_all",
+)
+
+"""
+Tracing many methods at once, across multiple processes.
+"""
+
+import logging
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Any, IO, Iterator
+
+from .analysis import Budget, InsnGraph, Trace
+from .cache import method_key, Cache
+from .classfile import ClassFile, MethodInfo
+from .error import BudgetExceededError
+from .types import descriptor
+
+logger = logging.getLogger("kirjava._parallel")
+
+
+class MethodSummary:
+    """
+    A compact, picklable summary of the trace of a single method.
+    """
+
+    __slots__ = (
+        "class_name", "name", "descriptor",
+        "max_stack", "max_locals",
+        "conflicts", "subroutines",
+        "pre_liveness", "post_liveness",
+        "blocks", "passes",
+        "elapsed", "exceeded", "error",
+    )
+
+    def __init__(self, class_name: str, name: str | None = None, descriptor_: str | None = None) -> None:
+        """
+        :param class_name: The name of the class the method is in (or the name of the file, if the class couldn't be
+                           read, in which case the method name is None).
+        :param name: The name of the method.
+        :param descriptor_: The method's descriptor.
+        """
+
+        self.class_name = class_name
+        self.name = name
+        self.descriptor = descriptor_
+
+        self.max_stack = 0
+        self.max_locals = 0
+
+        self.conflicts: tuple[str, ...] = ()
+        self.subroutines: tuple[str, ...] = ()
+        # Block labels to the live locals at the start/end of the block.
+        self.pre_liveness:  dict[int, frozenset[int]] = {}
+        self.post_liveness: dict[int, frozenset[int]] = {}
+
+        self.blocks = 0
+        self.passes = 0
+
+        self.elapsed = 0.0
+        self.exceeded: str | None = None  # The budget limit that was hit, if any.
+        self.error: str | None = None
+
+    def __repr__(self) -> str:
+        if self.error is not None:
+            return "<MethodSummary(class=%r, name=%r, descriptor=%r, error=%r) at %x>" % (
+                self.class_name, self.name, self.descriptor, self.error, id(self),
+            )
+        return (
+            "<MethodSummary(class=%r, name=%r, descriptor=%r, max_stack=%i, max_locals=%i, conflicts=%i, "
+            "subroutines=%i) at %x>"
+        ) % (
+            self.class_name, self.name, self.descriptor, self.max_stack, self.max_locals,
+            len(self.conflicts), len(self.subroutines), id(self),
+        )
+
+    def __str__(self) -> str:
+        if self.name is None:
+            return self.class_name
+        return "%s#%s%s" % (self.class_name, self.name, self.descriptor)
+
+    @property
+    def timed_out(self) -> bool:
+        """
+        :return: Did the trace run out of time?
+        """
+
+        return self.exceeded == "time"
+
+    def __getstate__(self) -> tuple[Any, ...]:
+        return tuple(getattr(self, slot) for slot in MethodSummary.__slots__)
+
+    def __setstate__(self, state: tuple[Any, ...]) -> None:
+        for slot, value in zip(MethodSummary.__slots__, state):
+            setattr(self, slot, value)
+
+    def copy(self, class_name: str, name: str | None, descriptor_: str | None) -> "MethodSummary":
+        """
+        Creates a copy of this summary for another method (with identical code).
+
+        :param class_name: The name of the class the other method is in.
+        :param name: The name of the other method.
+        :param descriptor_: The other method's descriptor.
+        :return: The copied summary.
+        """
+
+        summary = MethodSummary.__new__(MethodSummary)
+        summary.__setstate__(self.__getstate__())
+        summary.class_name = class_name
+        summary.name = name
+        summary.descriptor = descriptor_
+        return summary
+
+
+# ---------------------------------------- Workers ---------------------------------------- #
+
+def _trace_method(method: MethodInfo, summary: MethodSummary, kwargs: dict[str, Any]) -> None:
+    """
+    Disassembles and traces a single method, filling in the provided summary.
+    """
+
+    start = time.perf_counter()
+    try:
+        graph = InsnGraph.disassemble(method)
+        trace = Trace.from_graph(graph, **kwargs)
+    except BudgetExceededError as error:
+        summary.exceeded = error.limit
+        summary.error = "%s: %s" % (type(error).__name__, error)
+        return
+    except Exception as error:
+        summary.error = "%s: %s" % (type(error).__name__, error)
+        return
+    finally:
+        summary.elapsed = time.perf_counter() - start
+
+    summary.max_stack = trace.max_stack
+    summary.max_locals = trace.max_locals
+    summary.conflicts = tuple(sorted(map(str, trace.conflicts)))
+    summary.subroutines = tuple(map(str, trace.subroutines))
+    summary.pre_liveness = {block.label: frozenset(live) for block, live in trace.pre_liveness.items()}
+    summary.post_liveness = {block.label: frozenset(live) for block, live in trace.post_liveness.items()}
+    summary.blocks = len(graph._blocks)
+    summary.passes = trace.passes
+
+
+def _trace_class(
+        name: str, class_file: ClassFile | bytes, kwargs: dict[str, Any], skip: frozenset[int],
+) -> list[MethodSummary]:
+    """
+    Traces all the methods in a class.
+
+    :param name: The name of the file the class came from, for error reporting.
+    :param class_file: The class file or its raw data.
+    :param kwargs: Arguments to pass to Trace.from_graph().
+    :param skip: The indices of methods not to trace (as they've already been found in a cache).
+    :return: The summaries of each method with code that wasn't skipped.
+    """
+
+    if type(class_file) is bytes:
+        try:
+            class_file = ClassFile.read(BytesIO(class_file))
+        except Exception as error:
+            summary = MethodSummary(name)
+            summary.error = "%s: %s" % (type(error).__name__, error)
+            return [summary]
+
+    summaries = []
+    for index, method in enumerate(class_file.methods):
+        if method.code is None or index in skip:
+            continue
+        summary = MethodSummary(class_file.name, method.name, _descriptor(method))
+        _trace_method(method, summary, kwargs)
+        summaries.append(summary)
+
+    return summaries
+
+
+def _trace_class_job(job: tuple[str, bytes, dict[str, Any], frozenset[int]]) -> list[MethodSummary]:
+    return _trace_class(*job)
+
+
+def _descriptor(method: MethodInfo) -> str:
+    return descriptor.to_descriptor(method.argument_types, method.return_type)
+
+
+# ---------------------------------------- API ---------------------------------------- #
+
+def _iter_classes(classfile_or_jar: ClassFile | str | bytes | IO[bytes]) -> Iterator[tuple[str, ClassFile | bytes]]:
+    """
+    Yields the name and data of each class in the input.
+    """
+
+    if isinstance(classfile_or_jar, ClassFile):
+        yield classfile_or_jar.name, classfile_or_jar
+        return
+
+    if type(classfile_or_jar) is str:
+        name = classfile_or_jar
+        with open(classfile_or_jar, "rb") as stream:
+            data = stream.read()
+    elif type(classfile_or_jar) is bytes:
+        name = "<bytes>"
+        data = classfile_or_jar
+    else:
+        name = getattr(classfile_or_jar, "name", "<stream>")
+        data = classfile_or_jar.read()
+
+    if not data.startswith(b"PK"):  # Not a zip file, so assume it's a single class.
+        yield name, data
+        return
+
+    with zipfile.ZipFile(BytesIO(data)) as zip_file:
+        for info in zip_file.infolist():
+            if info.is_dir() or not info.filename.endswith(".class"):
+                continue
+            try:
+                yield info.filename, zip_file.read(info)
+            except Exception as error:  # Obfuscated jars can have some pretty broken entries.
+                logger.debug("Couldn't read %r from jar: %r" % (info.filename, error))
+
+
+def trace_all(
+        classfile_or_jar: ClassFile | str | bytes | IO[bytes],
+        workers: int | None = None,
+        timeout: float | None = None,
+        cache: Cache | None = None,
+        **kwargs: Any,
+) -> list[MethodSummary]:
+    """
+    Disassembles and traces every method in a class or jar file, using a pool of processes.
+
+    :param classfile_or_jar: A classfile, or the path to/data of/stream containing a class or jar file.
+    :param workers: The number of worker processes to use, None for the number of CPUs. With 1 or less, everything is
+                    traced in this process.
+    :param timeout: The maximum time to spend tracing any one method, in seconds. Ignored if a budget is passed.
+    :param cache: A cache to look up/store the summaries in. Lookups are done in this process, so only methods that
+                  aren't in the cache are sent to the workers.
+    :param kwargs: Any extra arguments to pass to the trace method (see Trace.from_graph()).
+    :return: The summaries for each method with code, in the order the classes and methods were found in.
+    """
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    # Frames aren't needed for the summaries, so there's no point in holding onto them while tracing.
+    kwargs.setdefault("retain", Trace.RETAIN_CONFLICTS)
+    if timeout is not None:
+        kwargs.setdefault("budget", Budget(timeout=timeout))
+    # Summaries that hit the budget aren't cached, so the budget doesn't need to be part of the key.
+    cache_options = sorted((key, value) for key, value in kwargs.items() if key != "budget")
+
+    classes = list(_iter_classes(classfile_or_jar))
+    logger.debug("Tracing %i class(es) with %i worker(s)." % (len(classes), workers))
+
+    # The summaries for each class. If a cache is being used, methods that missed are None until they've been traced,
+    # otherwise the whole list is None.
+    results: list[list[MethodSummary | None] | None] = []
+    jobs: list[tuple[int, str, ClassFile | bytes, frozenset[int], list[str]]] = []
+    cached = 0
+
+    for name, class_file in classes:
+        if cache is None:
+            jobs.append((len(results), name, class_file, frozenset(), []))
+            results.append(None)
+            continue
+
+        parsed = class_file
+        if type(parsed) is bytes:
+            try:
+                parsed = ClassFile.read(BytesIO(class_file))
+            except Exception:  # The worker will report the error.
+                jobs.append((len(results), name, class_file, frozenset(), []))
+                results.append(None)
+                continue
+
+        result = []
+        skip = set()
+        keys = []
+
+        for index, method in enumerate(parsed.methods):
+            if method.code is None:
+                continue
+            key = method_key(method, "summary", cache_options)
+            summary = cache.get(key)
+            if summary is not None:
+                result.append(summary.copy(parsed.name, method.name, _descriptor(method)))
+                skip.add(index)
+                cached += 1
+            else:
+                result.append(None)
+                keys.append(key)
+
+        if keys:
+            jobs.append((len(results), name, class_file if workers > 1 else parsed, frozenset(skip), keys))
+        results.append(result)
+
+    if cache is not None:
+        logger.debug(" - %i method(s) found in cache, %i class(es) left to trace." % (cached, len(jobs)))
+
+    if workers <= 1 or len(jobs) <= 1:
+        outputs = [_trace_class(name, class_file, kwargs, skip) for _, name, class_file, skip, _ in jobs]
+    else:
+        work = []
+        for _, name, class_file, skip, _ in jobs:
+            if isinstance(class_file, ClassFile):
+                buffer = BytesIO()
+                class_file.write(buffer)
+                class_file = buffer.getvalue()
+            work.append((name, class_file, kwargs, skip))
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Small chunks so that one slow class doesn't hold up a whole batch.
+            chunksize = max(1, len(work) // (workers * 8))
+            outputs = list(executor.map(_trace_class_job, work, chunksize=chunksize))
+
+    for (index, _, _, _, keys), output in zip(jobs, outputs):
+        result = results[index]
+        if result is None:
+            results[index] = output
+            continue
+
+        missing = iter(output)
+        for position, summary in enumerate(result):
+            if summary is None:
+                result[position] = next(missing)
+        for key, summary in zip(keys, output):
+            if summary.exceeded is None:  # Might not hit the budget next time.
+                cache.put(key, summary)
+
+    summaries: list[MethodSummary] = []
+    for result in results:
+        summaries.extend(result)
+    return summaries
@@ -168,6 +168,8 @@ class Graph:
         "method",
         "entry_block", "return_block", "rethrow_block",
         "_blocks", "_forward_edges", "_backward_edges", "_opaque_edges",
+        "_out_cache", "_in_cache",
+        "_analyses",
     )
 
     @property
@@ -211,6 +213,14 @@ class Graph:
         self._backward_edges: dict[Block, set[Edge]] = defaultdict(set)  # Blocks to their in edges
         self._opaque_edges: set[Edge] = set()  # Edges whose jump targets we don't know yet
 
+        # The out/in edges and successors/predecessors of blocks, as tuples. These are invalidated per block when its
+        # edges change, so that querying them doesn't require allocating a new tuple every time.
+        self._out_cache: dict[Block, tuple[tuple[Edge, ...], tuple[Block | None, ...]]] = {}
+        self._in_cache:  dict[Block, tuple[tuple[Edge, ...], tuple[Block, ...]]] = {}
+        # Cached analyses of the graph's structure (i.e. adjacency, dominance), these are discarded whenever the graph is
+        # modified.
+        self._analyses: dict[str, Any] = {}
+
     def __iter__(self) -> Iterator[Block]:
         return iter(self._blocks.values())
 
@@ -275,6 +285,7 @@ class Graph:
                 raise ValueError("Cannot add rethrow block %r to this graph." % block)
 
         self._blocks[block.label] = block
+        self._analyses.clear()
         # self._forward_edges[block] = set()
         # self._backward_edges[block] = set()
 
@@ -296,17 +307,17 @@ class Graph:
 
         if block is self.entry_block:
             self.entry_block = None
-
-        try:
-            for edge in self._backward_edges.pop(block):
-                self.disconnect(edge)
-        except KeyError:
-            ...
-        try:
-            for edge in self._forward_edges.pop(block):
-                self.disconnect(edge)
-        except KeyError:
-            ...
+        self._out_cache.pop(block, None)
+        self._in_cache.pop(block, None)
+        self._analyses.clear()
+
+        # The edges are disconnected before the block's edge sets are removed, as disconnect() needs them.
+        for edge in tuple(self._backward_edges.get(block, ())):
+            self.disconnect(edge)
+        for edge in tuple(self._forward_edges.get(block, ())):
+            self.disconnect(edge)
+        self._backward_edges.pop(block, None)
+        self._forward_edges.pop(block, None)
 
     def connect(self, edge: Edge, overwrite: bool = False, *, check: bool = True) -> None:
         """
@@ -353,8 +364,11 @@ class Graph:
 
         if edge.to is not None:
             self._backward_edges[edge.to].add(edge)
+            self._in_cache.pop(edge.to, None)
         else:
             self._opaque_edges.add(edge)
+        self._out_cache.pop(edge.from_, None)
+        self._analyses.clear()
 
     def disconnect(self, edge: Edge) -> None:
         """
@@ -373,8 +387,11 @@ class Graph:
 
         if edge.to is not None:
             self._backward_edges[edge.to].discard(edge)
+            self._in_cache.pop(edge.to, None)
         else:
             self._opaque_edges.discard(edge)
+        self._out_cache.pop(edge.from_, None)
+        self._analyses.clear()
 
     def is_opaque(self, edge: Edge) -> bool:
         """
@@ -386,6 +403,20 @@ class Graph:
 
         return edge in self._opaque_edges
 
+    def _out(self, block: Block) -> tuple[tuple[Edge, ...], tuple[Block | None, ...]]:
+        out = self._out_cache.get(block)
+        if out is None:
+            edges = tuple(self._forward_edges.get(block, ()))
+            out = self._out_cache[block] = (edges, tuple(edge.to for edge in edges))
+        return out
+
+    def _in(self, block: Block) -> tuple[tuple[Edge, ...], tuple[Block, ...]]:
+        in_ = self._in_cache.get(block)
+        if in_ is None:
+            edges = tuple(self._backward_edges.get(block, ()))
+            in_ = self._in_cache[block] = (edges, tuple(edge.from_ for edge in edges))
+        return in_
+
     def successors(self, block: Block) -> tuple[Block, ...]:
         """
         Gets the successors for a given block.
@@ -394,7 +425,7 @@ class Graph:
         :return: The block's successors.
         """
 
-        return tuple(edge.to for edge in self._forward_edges[block])
+        return self._out(block)[1]
 
     def successors_iter(self, block: Block) -> Iterator[Block]:
         """
@@ -403,8 +434,7 @@ class Graph:
         :param block: The block in question.
         """
 
-        for edge in self._forward_edges[block]:
-            yield edge.to
+        return iter(self._out(block)[1])
 
     def predecessors(self, block: Block) -> tuple[Block, ...]:
         """
@@ -414,7 +444,7 @@ class Graph:
         :return: The block's predecessors.
         """
 
-        return tuple(edge.from_ for edge in self._backward_edges[block])
+        return self._in(block)[1]
 
     def predecessors_iter(self, block: Block) -> Iterator[Block]:
         """
@@ -423,8 +453,7 @@ class Graph:
         :param block: The block in question.
         """
 
-        for edge in self._backward_edges[block]:
-            yield edge.from_
+        return iter(self._in(block)[1])
 
     def out_edges(self, block: Block) -> tuple[Edge, ...]:
         """
@@ -434,7 +463,7 @@ class Graph:
         :return: The out edges for that block.
         """
 
-        return tuple(self._forward_edges[block])
+        return self._out(block)[0]
 
     def out_edges_iter(self, block: Block) -> Iterator[Edge]:
         """
@@ -443,8 +472,7 @@ class Graph:
         :param block: The block in question.
         """
 
-        for edge in self._forward_edges[block]:
-            yield edge
+        return iter(self._out(block)[0])
 
     def in_edges(self, block: Block) -> tuple[Edge, ...]:
         """
@@ -454,7 +482,7 @@ class Graph:
         :return: The in edges for that block.
         """
 
-        return tuple(self._backward_edges[block])
+        return self._in(block)[0]
 
     def in_edges_iter(self, block: Block) -> Iterator[Edge]:
         """
@@ -463,5 +491,428 @@ class Graph:
         :param block: The block in question.
         """
 
-        for edge in self._backward_edges[block]:
-            yield edge
+        return iter(self._in(block)[0])
+
+    def adjacency(self) -> "Graph.Adjacency":
+        """
+        Gets a compact, integer indexed view of the edges in this graph. This is cached until the graph is next modified.
+
+        :return: The adjacency information.
+        """
+
+        adjacency = self._analyses.get("adjacency")
+        if adjacency is None:
+            adjacency = self._analyses["adjacency"] = Graph.Adjacency(self)
+        return adjacency
+
+    class Adjacency:
+        """
+        The edges in a graph, stored in compressed sparse row form over dense block indices. The successors of the block
+        at index i are successors[successor_offsets[i]:successor_offsets[i + 1]] (and likewise for predecessors), which
+        can be iterated over via range() without creating any new lists.
+        Opaque edges and edges to blocks that aren't in the graph aren't included.
+        """
+
+        __slots__ = (
+            "blocks", "indices",
+            "successor_offsets", "successors", "successor_edges",
+            "predecessor_offsets", "predecessors", "predecessor_edges",
+        )
+
+        def __init__(self, graph: "Graph") -> None:
+            """
+            :param graph: The graph to compute the adjacency of.
+            """
+
+            self.blocks: list[Block] = list(graph._blocks.values())
+            self.indices: dict[Block, int] = {block: index for index, block in enumerate(self.blocks)}
+
+            indices = self.indices
+            forward_edges = graph._forward_edges
+            in_degrees = [0] * len(self.blocks)
+
+            self.successor_offsets: list[int] = [0]
+            self.successors: list[int] = []
+            self.successor_edges: list[Edge] = []
+
+            for block in self.blocks:
+                for edge in forward_edges.get(block, ()):
+                    to = indices.get(edge.to)
+                    if to is not None:
+                        self.successors.append(to)
+                        self.successor_edges.append(edge)
+                        in_degrees[to] += 1
+                self.successor_offsets.append(len(self.successors))
+
+            # Predecessors are found by counting sort over the successors, so they're in a deterministic order too.
+            offsets = [0]
+            for in_degree in in_degrees:
+                offsets.append(offsets[-1] + in_degree)
+            positions = offsets[:-1]
+
+            self.predecessor_offsets: list[int] = offsets
+            self.predecessors: list[int] = [0] * len(self.successors)
+            self.predecessor_edges: list[Edge | None] = [None] * len(self.successors)
+
+            successor_offsets = self.successor_offsets
+            for from_ in range(len(self.blocks)):
+                for position in range(successor_offsets[from_], successor_offsets[from_ + 1]):
+                    to = self.successors[position]
+                    self.predecessors[positions[to]] = from_
+                    self.predecessor_edges[positions[to]] = self.successor_edges[position]
+                    positions[to] += 1
+
+        def __repr__(self) -> str:
+            return "<Graph.Adjacency(blocks=%i, edges=%i) at %x>" % (len(self.blocks), len(self.successors), id(self))
+
+    # ------------------------------ Dominance ------------------------------ #
+
+    def invalidate(self) -> None:
+        """
+        Discards any cached analyses of this graph. This is done automatically by add(), remove(), connect() and
+        disconnect(), but needs to be called manually if the edges are modified directly.
+        """
+
+        self._out_cache.clear()
+        self._in_cache.clear()
+        self._analyses.clear()
+
+    def _dominance(self) -> tuple[list[Block], list[int], list[int]]:
+        """
+        Computes the immediate dominators of each block reachable from the entry block.
+
+        :return: The blocks, the indices of the reachable blocks in reverse postorder and the index of the immediate
+                 dominator of each block (-1 if the block isn't reachable, the entry block dominates itself).
+        """
+
+        dominance = self._analyses.get("dominance")
+        if dominance is not None:
+            return dominance
+
+        adjacency = self.adjacency()
+        reverse_postorder, idoms = _immediate_dominators(
+            len(adjacency.blocks), adjacency.indices.get(self.entry_block, -1),
+            adjacency.successor_offsets, adjacency.successors,
+            adjacency.predecessor_offsets, adjacency.predecessors,
+        )
+        dominance = self._analyses["dominance"] = (adjacency.blocks, reverse_postorder, idoms)
+        return dominance
+
+    def _post_dominance(self) -> tuple[list[Block | None], list[int], list[int]]:
+        """
+        Computes the immediate post dominators of each block that can reach an exit. The exits are the return and
+        rethrow blocks, as well as any other blocks with no out edges.
+
+        :return: The blocks (with None as the last, virtual exit block), the indices of the blocks in reverse postorder
+                 (of the reversed graph) and the index of the immediate post dominator of each block.
+        """
+
+        dominance = self._analyses.get("post_dominance")
+        if dominance is not None:
+            return dominance
+
+        adjacency = self.adjacency()
+        blocks: list[Block | None] = adjacency.blocks + [None]
+        exit_ = len(adjacency.blocks)
+        successor_offsets = adjacency.successor_offsets
+        predecessor_offsets = adjacency.predecessor_offsets
+
+        # The reversed graph is the same as the original, with the successors and predecessors swapped, but we need to
+        # add the virtual exit block, which is done by rebuilding the arrays.
+        exits = [
+            index for index in range(exit_) if successor_offsets[index] == successor_offsets[index + 1]
+        ]
+        reversed_successor_offsets = predecessor_offsets + [predecessor_offsets[-1] + len(exits)]
+        reversed_successors = adjacency.predecessors + exits
+
+        reversed_predecessor_offsets = [0]
+        reversed_predecessors = []
+        exit_position = 0
+        for index in range(exit_):
+            reversed_predecessors.extend(adjacency.successors[successor_offsets[index]:successor_offsets[index + 1]])
+            if exit_position < len(exits) and exits[exit_position] == index:
+                reversed_predecessors.append(exit_)
+                exit_position += 1
+            reversed_predecessor_offsets.append(len(reversed_predecessors))
+        reversed_predecessor_offsets.append(len(reversed_predecessors))
+
+        reverse_postorder, idoms = _immediate_dominators(
+            len(blocks), exit_,
+            reversed_successor_offsets, reversed_successors,
+            reversed_predecessor_offsets, reversed_predecessors,
+        )
+        dominance = self._analyses["post_dominance"] = (blocks, reverse_postorder, idoms)
+        return dominance
+
+    def dominators(self) -> dict[Block, Block | None]:
+        """
+        Computes the immediate dominator of each block. This is cached until the graph is next modified.
+
+        :return: The immediate dominators of each block reachable from the entry block, None for the entry block.
+        """
+
+        blocks, reverse_postorder, idoms = self._dominance()
+        dominators = {}
+        for index in reverse_postorder:
+            idom = idoms[index]
+            dominators[blocks[index]] = blocks[idom] if idom != index else None
+        return dominators
+
+    def post_dominators(self) -> dict[Block, Block | None]:
+        """
+        Computes the immediate post dominator of each block. This is cached until the graph is next modified.
+
+        :return: The immediate post dominators of each block that can reach an exit, None for blocks that are only
+                 post dominated by the (virtual) exit.
+        """
+
+        blocks, reverse_postorder, idoms = self._post_dominance()
+        post_dominators = {}
+        for index in reverse_postorder:
+            block = blocks[index]
+            if block is not None:
+                post_dominators[block] = blocks[idoms[index]]
+        return post_dominators
+
+    def dominates(self, block: Block, other: Block) -> bool:
+        """
+        Checks if a block dominates another block (all blocks dominate themselves).
+
+        :param block: The (potentially) dominating block.
+        :param other: The (potentially) dominated block.
+        :return: Does the block dominate the other block? False if either block isn't reachable.
+        """
+
+        intervals = self._analyses.get("dominator_tree")
+        if intervals is None:
+            blocks, reverse_postorder, idoms = self._dominance()
+            children: list[list[int]] = [[] for _ in blocks]
+            for index in reverse_postorder:
+                if idoms[index] != index:
+                    children[idoms[index]].append(index)
+
+            # Pre/post numbering of the dominator tree, a block dominates another if its interval contains the other's.
+            intervals = {}
+            if reverse_postorder:
+                root = reverse_postorder[0]
+                entered = {root: 0}
+                counter = 1
+                stack = [(root, iter(children[root]))]
+                while stack:
+                    index, children_ = stack[-1]
+                    for child in children_:
+                        entered[child] = counter
+                        counter += 1
+                        stack.append((child, iter(children[child])))
+                        break
+                    else:
+                        stack.pop()
+                        intervals[blocks[index]] = (entered[index], counter)
+                        counter += 1
+            self._analyses["dominator_tree"] = intervals
+
+        interval = intervals.get(block)
+        other_interval = intervals.get(other)
+        if interval is None or other_interval is None:
+            return False
+        return interval[0] <= other_interval[0] and other_interval[1] <= interval[1]
+
+    def dominance_frontier(self) -> dict[Block, set[Block]]:
+        """
+        Computes the dominance frontier of each block. This is cached until the graph is next modified.
+
+        :return: The dominance frontier of each block reachable from the entry block.
+        """
+
+        frontier = self._analyses.get("dominance_frontier")
+        if frontier is None:
+            blocks, reverse_postorder, idoms = self._dominance()
+            adjacency = self.adjacency()
+            offsets = adjacency.predecessor_offsets
+            predecessors = adjacency.predecessors
+            frontier = {blocks[index]: set() for index in reverse_postorder}
+
+            for index in reverse_postorder:
+                start, end = offsets[index], offsets[index + 1]
+                if end - start < 2:
+                    continue
+                block = blocks[index]
+                idom = idoms[index]
+                for position in range(start, end):
+                    runner = predecessors[position]
+                    if idoms[runner] < 0:  # Unreachable predecessor.
+                        continue
+                    while runner != idom:
+                        frontier[blocks[runner]].add(block)
+                        runner = idoms[runner]
+
+            self._analyses["dominance_frontier"] = frontier
+
+        return {block: set(frontier_) for block, frontier_ in frontier.items()}
+
+    def loops(self) -> tuple["Graph.Loop", ...]:
+        """
+        Computes the natural loop nesting forest of this graph. Irreducible loops (those with multiple entries) aren't
+        natural loops, and so aren't included. This is cached until the graph is next modified.
+
+        :return: The outermost loops, nested loops are found via their parents' children.
+        """
+
+        loops = self._analyses.get("loops")
+        if loops is not None:
+            return loops
+
+        # Find the back edges, those whose target dominates their source, and group them by the target (the header).
+        back_edges: dict[Block, list[Edge]] = {}
+        for edges in self._forward_edges.values():
+            for edge in edges:
+                if edge.to is not None and self.dominates(edge.to, edge.from_):
+                    back_edges.setdefault(edge.to, []).append(edge)
+
+        all_loops: list[Graph.Loop] = []
+        for header, edges in back_edges.items():
+            # The body of the loop is every block that can reach a back edge without passing through the header.
+            body = {header}
+            stack = [edge.from_ for edge in edges]
+            while stack:
+                block = stack.pop()
+                if block in body:
+                    continue
+                body.add(block)
+                for edge in self._backward_edges.get(block, ()):
+                    if not edge.from_ in body:
+                        stack.append(edge.from_)
+            all_loops.append(Graph.Loop(header, body, edges))
+
+        # Natural loops are either disjoint or nested, so the parent of a loop is the smallest other loop containing its
+        # header.
+        all_loops.sort(key=lambda loop: len(loop.blocks))
+        roots = []
+        for index, loop in enumerate(all_loops):
+            for parent in all_loops[index + 1:]:
+                if loop.header in parent.blocks and parent is not loop:
+                    loop.parent = parent
+                    parent.children.append(loop)
+                    break
+            else:
+                roots.append(loop)
+
+        for loop in reversed(all_loops):  # Outermost first, so the parents' depths are known.
+            if loop.parent is not None:
+                loop.depth = loop.parent.depth + 1
+
+        loops = self._analyses["loops"] = tuple(roots)
+        return loops
+
+    class Loop:
+        """
+        A natural loop in a graph.
+        """
+
+        __slots__ = ("header", "blocks", "back_edges", "parent", "children", "depth")
+
+        def __init__(self, header: Block, blocks: set[Block], back_edges: list[Edge]) -> None:
+            """
+            :param header: The header of the loop, which dominates all the blocks in it.
+            :param blocks: All the blocks in the loop, including those in nested loops.
+            :param back_edges: The edges back to the header.
+            """
+
+            self.header = header
+            self.blocks = blocks
+            self.back_edges = back_edges
+
+            self.parent: Graph.Loop | None = None
+            self.children: list[Graph.Loop] = []
+            self.depth = 1
+
+        def __repr__(self) -> str:
+            return "<Graph.Loop(header=%s, blocks=%i, back_edges=%i, depth=%i) at %x>" % (
+                self.header, len(self.blocks), len(self.back_edges), self.depth, id(self),
+            )
+
+        def __contains__(self, item: Any) -> bool:
+            return item in self.blocks
+
+
+def _immediate_dominators(
+        count: int, root: int,
+        successor_offsets: list[int], successors: list[int],
+        predecessor_offsets: list[int], predecessors: list[int],
+) -> tuple[list[int], list[int]]:
+    """
+    Computes the immediate dominators of a graph over integer node indices, using the algorithm described by Cooper,
+    Harvey and Kennedy in "A Simple, Fast Dominance Algorithm". This is quadratic in the worst case, but is faster than
+    Lengauer-Tarjan in practice for graphs of the sizes we deal with.
+
+    :param count: The number of nodes.
+    :param root: The index of the root node, or -1 if there isn't one.
+    :param successor_offsets: The offsets into the successors for each node (see Graph.Adjacency).
+    :param successors: The successors of all the nodes.
+    :param predecessor_offsets: The offsets into the predecessors for each node.
+    :param predecessors: The predecessors of all the nodes.
+    :return: The reachable nodes in reverse postorder and the immediate dominator of each node (-1 if unreachable).
+    """
+
+    idoms = [-1] * count
+    if root < 0:
+        return [], idoms
+
+    postorder = []
+    visited = [False] * count
+    visited[root] = True
+    # The DFS stack stores the next position in the successors for each node, rather than an iterator.
+    stack = [root]
+    positions = [successor_offsets[root]]
+    while stack:
+        node = stack[-1]
+        position = positions[-1]
+        end = successor_offsets[node + 1]
+        while position < end:
+            successor = successors[position]
+            position += 1
+            if not visited[successor]:
+                visited[successor] = True
+                positions[-1] = position
+                stack.append(successor)
+                positions.append(successor_offsets[successor])
+                break
+        else:
+            stack.pop()
+            positions.pop()
+            postorder.append(node)
+
+    rank = [-1] * count
+    for index, node in enumerate(postorder):
+        rank[node] = index
+    reverse_postorder = postorder[::-1]
+
+    idoms[root] = root
+    changed = True
+    while changed:
+        changed = False
+        for node in reverse_postorder:
+            if node == root:
+                continue
+            new_idom = -1
+            for position in range(predecessor_offsets[node], predecessor_offsets[node + 1]):
+                predecessor = predecessors[position]
+                if idoms[predecessor] < 0:  # Unreachable or not yet processed.
+                    continue
+                if new_idom < 0:
+                    new_idom = predecessor
+                    continue
+                # Intersect, walking up the dominator tree via the postorder ranks.
+                finger_a = predecessor
+                finger_b = new_idom
+                while finger_a != finger_b:
+                    while rank[finger_a] < rank[finger_b]:
+                        finger_a = idoms[finger_a]
+                    while rank[finger_b] < rank[finger_a]:
+                        finger_b = idoms[finger_b]
+                new_idom = finger_a
+            if idoms[node] != new_idom:
+                idoms[node] = new_idom
+                changed = True
+
+    return reverse_postorder, idoms
@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 
 __all__ = (
-    "frame", "graph",
+    "budget", "frame", "graph",
+    "Budget", "CancellationToken",
     "Generifier",
-    "Entry", "Frame",
+    "Entry", "Delta", "Frame",
     "InsnBlock", "InsnReturnBlock", "InsnRethrowBlock",
     "FallthroughEdge", "JumpEdge",
     "JsrJumpEdge", "JsrFallthroughEdge", "RetEdge",
@@ -18,10 +19,11 @@ Bytecode analysis stuff.
 
 import typing
 from collections import defaultdict
-from typing import Any, Iterator
+from typing import Any, Callable, Iterable, Iterator, Optional
 
-from . import frame
+from . import budget, frame
 from ._generify import *
+from .budget import *
 from .frame import *
 from ..abc import Method, Source
 from ..types import reserved_t, Type
@@ -30,6 +32,17 @@ if typing.TYPE_CHECKING:
     from .graph import InsnBlock, InsnGraph, JsrJumpEdge, RetEdge
 
 
+def _source_block(source: Source | None) -> Optional["InsnBlock"]:
+    """
+    :return: The block that a source is in, if it's in one. Edge sources are in the block they come from.
+    """
+
+    block = getattr(source, "block", None)
+    if block is None:
+        block = getattr(source, "from_", None)
+    return block
+
+
 class Trace:
     """
     Trace information for a given method.
@@ -43,8 +56,25 @@ class Trace:
         "subroutines",
         "pre_liveness", "post_liveness",
         "max_stack", "max_locals",
+        "summaries",
+        "deltas",
+        "retain",
+        "passes", "blocks_traced", "blocks_retraced",
+        "_options", "_cursor",
+        "_uses", "_defs", "_records",
     )
 
+    # Retention policies, these determine what trace information is kept once the trace is complete.
+    RETAIN_ENTRIES   = 0x01  # The entry frames for each block.
+    RETAIN_EXITS     = 0x02  # The exit frames for each block.
+    RETAIN_CONFLICTS = 0x04  # The type conflicts.
+    RETAIN_SUMMARIES = 0x08  # The merged summaries for each block.
+    RETAIN_DELTAS    = 0x10  # The frame deltas for each instruction, requires RETAIN_ENTRIES to be useful.
+
+    RETAIN_ALL = RETAIN_ENTRIES | RETAIN_EXITS | RETAIN_CONFLICTS
+    # The entries and exits are both needed to update the trace without retracing the whole graph.
+    _RETAIN_UPDATE = RETAIN_ENTRIES | RETAIN_EXITS
+
     @classmethod
     def from_graph(
             cls, graph: "InsnGraph",
@@ -52,6 +82,9 @@ class Trace:
             do_raise: bool = True,
             merge_non_live: bool = True,
             make_params_live: bool = False,
+            retain: int = RETAIN_ALL,
+            callback: Callable[["Trace.Summary"], None] | None = None,
+            budget: Budget | None = None,
     ) -> "Trace":
         """
         Creates a trace from an instruction graph.
@@ -63,11 +96,22 @@ class Trace:
                                behaviour in some samples).
         :param make_params_live: Makes the parameters appear live in the initial frame. This is useful for generating
                                  stackmap frames, though may not be entirely accurate.
+        :param retain: The retention policy, i.e. which trace information to keep (see Trace.RETAIN_*). The maxes,
+                       liveness and subroutines are always kept.
+        :param callback: Called with the summary of each block as soon as it has been traced fully (i.e. while the trace
+                         is still running), the block's frames are then released if they aren't being retained.
+        :param budget: Limits on the amount of work the trace can do, a BudgetExceededError is raised if they're hit.
         :return: The trace information.
         """
 
         self = cls(graph)
-        trace(self, graph, do_raise, merge_non_live, make_params_live)
+        self.retain = retain
+        self._options = (do_raise, merge_non_live, make_params_live, budget)
+        if retain & Trace._RETAIN_UPDATE != Trace._RETAIN_UPDATE:
+            self._records = None
+        trace(self, graph, do_raise, merge_non_live, make_params_live, budget, callback=callback)
+        if not retain & Trace.RETAIN_CONFLICTS:
+            self.conflicts.clear()
         return self
 
     def __init__(self, graph: "InsnGraph") -> None:
@@ -90,11 +134,194 @@ class Trace:
         self.max_stack = 0
         self.max_locals = 0
 
+        self.summaries: dict["InsnBlock", Trace.Summary] = {}
+        # The deltas for each instruction in a block, per entry frame (in the same order as the entries).
+        self.deltas: dict["InsnBlock", list[list[Delta]]] = defaultdict(list)
+        self.retain = Trace.RETAIN_ALL
+
+        # Some statistics about the trace itself.
+        self.passes = 0
+        self.blocks_traced = 0
+        self.blocks_retraced = 0
+
+        self._options = (True, True, False, None)
+        # The last frame computed by frame_at, as (block, entry frame, index, frame), so that queries at nearby
+        # instructions only need to apply a few deltas.
+        self._cursor: tuple["InsnBlock", Frame, int, Frame] | None = None
+
+        # The local uses and definitions for each block, as bitsets, and per-block information needed by update().
+        self._uses: dict["InsnBlock", int] = defaultdict(int)
+        self._defs: dict["InsnBlock", int] = defaultdict(int)
+        self._records: dict["InsnBlock", Trace._Record] | None = {}
+
     def __repr__(self) -> str:
         return "<Trace(entries=%i, exits=%i, conflicts=%i, subroutines=%i, max_stack=%i, max_locals=%i) at %x>" % (
             len(self.entries), len(self.exits), len(self.conflicts), len(self.subroutines), self.max_stack, self.max_locals, id(self),
         )
 
+    def update(self, changed: Iterable["InsnBlock"]) -> bool:
+        """
+        Updates this trace in place after the given blocks in the graph were modified (or added/removed).
+
+        Only the blocks reachable from the changed blocks are retraced, starting from the exit frames of the blocks that
+        lead into them, and liveness is only recomputed for those blocks and the blocks that lead to them. The whole
+        graph is retraced instead if:
+         - the entries or exits weren't retained,
+         - the method has subroutines or the entry block was changed,
+         - the liveness of a block outside of the retraced blocks, where frames were merged, has changed (as this
+           changes which locals are merged there).
+
+        The frames, liveness, conflicts and maxes are the same as a full trace of the graph would give. Note though that
+        entries created outside of the retraced blocks may still be merged with entries from the old code, as merges
+        can't be undone (any constraints and consumers from the old code are removed though). The statistics (passes
+        and blocks traced) are for the update only.
+
+        :param changed: The blocks that were modified, including any blocks whose edges were changed.
+        :return: Were any blocks retraced?
+        """
+
+        graph = self.graph
+        records = self._records
+        self._cursor = None
+
+        if records is None or self.subroutines:
+            self._retrace()
+            return True
+
+        changed = set(changed)
+        for block in self.pre_liveness.keys() | records.keys():
+            if not block in graph:
+                changed.add(block)
+
+        # The blocks that can receive frames from the changed blocks, both before and after the changes.
+        affected = set()
+        stack = list(changed)
+        while stack:
+            block = stack.pop()
+            if block in affected:
+                continue
+            affected.add(block)
+            record = records.get(block)
+            if record is not None:
+                stack.extend(record.successors)
+            if not block in graph:
+                continue
+            for edge in (*graph.in_edges(block), *graph.out_edges(block)):
+                if type(edge) in (JsrJumpEdge, JsrFallthroughEdge, RetEdge):
+                    self._retrace()
+                    return True
+            for edge in graph.out_edges(block):
+                if edge.to is not None:
+                    stack.append(edge.to)
+
+        if graph.entry_block in affected:
+            self._retrace()
+            return True
+
+        # And the blocks whose liveness may have changed, which are those that lead to the affected blocks.
+        predecessors: dict["InsnBlock", set["InsnBlock"]] = defaultdict(set)
+        for block, record in records.items():
+            for successor in record.successors:
+                predecessors[successor].add(block)
+
+        stale = set()
+        stack = list(affected)
+        while stack:
+            block = stack.pop()
+            if block in stale:
+                continue
+            stale.add(block)
+            stack.extend(predecessors.get(block, ()))
+            if block in graph:
+                stack.extend(edge.from_ for edge in graph.in_edges(block))
+
+        # Liveness only affects how frames are merged into blocks that were entered more than once.
+        merged: dict["InsnBlock", set[int] | None] = {}
+        for block in stale - affected:
+            if len(self.entries.get(block, ())) > 1 or len(graph.in_edges(block)) > 1:
+                merged[block] = self.pre_liveness.get(block)
+
+        for block in affected:
+            self.entries.pop(block, None)
+            self.exits.pop(block, None)
+            self.summaries.pop(block, None)
+            self.deltas.pop(block, None)
+            self._uses.pop(block, None)
+            self._defs.pop(block, None)
+            records.pop(block, None)
+        for block in stale:
+            self.pre_liveness.pop(block, None)
+            self.post_liveness.pop(block, None)
+
+        self.conflicts = {conflict for conflict in self.conflicts if not _source_block(conflict.source) in affected}
+
+        # The old code will have recorded constraints and consumers on the entries that flowed into the affected blocks,
+        # and these would stop the same constraints (and any conflicts with them) from being recorded again.
+        roots = set()
+        for block in predecessors.keys() & affected:
+            for predecessor in predecessors[block]:
+                for frame in self.exits.get(predecessor, ()):
+                    for entry in frame._stack:
+                        roots.add(entry._find())
+                    for entry in frame._locals.values():
+                        roots.add(entry._find())
+                    if frame._copy is not None:
+                        for entry in frame._copy.copies.values():
+                            roots.add(entry._find())
+        for root in roots:
+            if root._constraints:
+                root._constraints = {
+                    constraint for constraint in root._constraints if not _source_block(constraint.source) in affected
+                }
+                root._inferences = None
+            if root._consumers:
+                root._consumers = [source for source in root._consumers if not _source_block(source) in affected]
+
+        self.passes = 0
+        self.blocks_traced = 0
+        self.blocks_retraced = 0
+
+        # The return and rethrow blocks never have any live locals.
+        stale = {block for block in stale if block in graph} - {graph.return_block, graph.rethrow_block}
+        trace(self, graph, *self._options, affected=affected, stale=stale)
+
+        for block, live in merged.items():
+            if self.pre_liveness.get(block) != live:
+                self._retrace()
+                return True
+
+        initial = Frame.initial(graph.method)
+        self.max_stack = 0
+        self.max_locals = initial.max_locals
+        self.returned = set()
+        for record in records.values():
+            if record.max_stack > self.max_stack:
+                self.max_stack = record.max_stack
+            if record.max_locals > self.max_locals:
+                self.max_locals = record.max_locals
+            self.returned.update(record.returned)
+
+        if not self.retain & Trace.RETAIN_CONFLICTS:
+            self.conflicts.clear()
+        return bool(self.blocks_traced)
+
+    def _retrace(self) -> None:
+        """
+        Recomputes this trace from scratch, with the same options.
+        """
+
+        retain = self.retain
+        options = self._options
+        records = self._records
+        self.__init__(self.graph)
+        self.retain = retain
+        self._options = options
+        if records is None:
+            self._records = None
+        trace(self, self.graph, *options)
+        if not retain & Trace.RETAIN_CONFLICTS:
+            self.conflicts.clear()
+
     def retrace(self, block: "InsnBlock", frame: Frame, *, do_raise: bool = True) -> Iterator["Context"]:
         """
         Retraces a block, yielding the contextual trace information at each instruction.
@@ -104,7 +331,7 @@ class Trace:
         :param do_raise: Raises an exception if an error occurs.
         """
 
-        # TODO: Improve the retrace API via frame deltas.
+        # Note: if the deltas were recorded, frame_at() is a lot faster if only the frames are needed.
 
         entries = self.entries.get(block)
         if entries is None:
@@ -116,6 +343,54 @@ class Trace:
         context.frame = frame
         yield from block.trace_iter(context)
 
+    def frame_at(self, block: "InsnBlock", index: int, frame: Frame | None = None) -> Frame:
+        """
+        Gets the frame before an instruction in a block, using the recorded deltas (see Trace.RETAIN_DELTAS).
+        Consecutive queries in the same block only need to apply the deltas between the two instructions.
+
+        :param block: The block that the instruction is in.
+        :param index: The index of the instruction in the block, the length of the block gives the exit frame.
+        :param frame: The entry frame to start from, defaults to the first entry frame for the block.
+        :return: A copy of the frame before the instruction.
+        """
+
+        entries = self.entries.get(block)
+        if not entries:
+            raise ValueError("Block %r was not traced." % block)
+
+        if frame is None:
+            which = 0
+            frame = entries[0]
+        else:
+            for which, entry in enumerate(entries):
+                if entry is frame:
+                    break
+            else:
+                raise ValueError("Frame %r was not traced for block %r." % (frame, block))
+
+        deltas = self.deltas.get(block)
+        if deltas is None or which >= len(deltas):
+            raise ValueError("Deltas were not recorded for block %r." % block)
+        deltas = deltas[which]
+        if not 0 <= index <= len(deltas):
+            raise IndexError("Instruction index %i out of range for block %r." % (index, block))
+
+        cursor = self._cursor
+        if cursor is not None and cursor[0] is block and cursor[1] is frame:
+            current, at = cursor[3], cursor[2]
+        else:
+            current, at = frame.copy(deep=False), 0
+
+        while at < index:
+            current.add(deltas[at])
+            at += 1
+        while at > index:
+            at -= 1
+            current.sub(deltas[at])
+
+        self._cursor = (block, frame, at, current)
+        return current.copy(deep=False)
+
     class Conflict:
         """
         A type conflict.
@@ -149,6 +424,72 @@ class Trace:
         def __hash__(self) -> int:
             return self._hash
 
+    class Summary:
+        """
+        Summarised trace information for a single block, with all of its entry frames merged.
+
+        Summaries are created as soon as a block has been traced fully, before the liveness is known, so all the locals
+        are summarised (see Trace.pre_liveness for which are live). Entries can still be merged with others later on in
+        the trace, so the inferred types are the ones known at that point.
+        """
+
+        __slots__ = ("block", "frames", "stack", "locals", "conflicts")
+
+        def __init__(
+                self,
+                block: "InsnBlock",
+                entries: list[Frame],
+                conflicts: Iterable["Trace.Conflict"],
+        ) -> None:
+            """
+            :param block: The block that was traced.
+            :param entries: The entry frames for the block.
+            :param conflicts: Any type conflicts that occurred in the block (or its edges).
+            """
+
+            self.block = block
+            self.frames = len(entries)
+            self.conflicts = tuple(conflicts)
+
+            # Frames with differing stack depths are invalid anyway, so we'll just go with the most common stack depth.
+            stack_depths = [len(frame.stack) for frame in entries]
+            stack_depth = max(set(stack_depths), key=stack_depths.count, default=0)
+
+            stack = [set() for index in range(stack_depth)]
+            locals_: dict[int, set[Type]] = {}
+
+            for frame in entries:
+                if len(frame.stack) != stack_depth:
+                    continue
+                for index, entry in enumerate(frame.stack):
+                    stack[index].update(entry.inference(as_vtypes=False))
+                for index, entry in frame.locals.items():
+                    locals_.setdefault(index, set()).update(entry.inference(as_vtypes=False))
+
+            self.stack = tuple(stack)
+            self.locals = locals_
+
+        def __repr__(self) -> str:
+            return "<Trace.Summary(block=%s, frames=%i, stack=[%s], locals={%s}, conflicts=%i) at %x>" % (
+                self.block, self.frames,
+                ", ".join("|".join(map(str, types)) for types in self.stack),
+                ", ".join("%i=%s" % (index, "|".join(map(str, types))) for index, types in sorted(self.locals.items())),
+                len(self.conflicts), id(self),
+            )
+
+    class _Record:
+        """
+        Information about a traced block that is needed to update the trace.
+        """
+
+        __slots__ = ("successors", "returned", "max_stack", "max_locals")
+
+        def __init__(self) -> None:
+            self.successors: set["InsnBlock"] = set()
+            self.returned: set[Entry] = set()
+            self.max_stack = 0
+            self.max_locals = 0
+
     class Subroutine:
         """
         Information about a subroutine.
@@ -256,15 +597,18 @@ class Context:
                 entry = Entry(constraint.as_vtype(), self.source, entry)
 
         # The same behaviour as `self.frame.push`, but it's much faster to just implement it here.
-        self.frame.stack.append(entry)
-        self.frame.tracked.add(entry)
+        frame = self.frame
+        stack = frame._own_stack()
+        tracked = frame._own_tracked()
+        stack.append(entry)
+        tracked.add(entry)
         if type_.wide:
             reserved = Entry(reserved_t, self.source)
-            self.frame.stack.append(reserved)
-            self.frame.tracked.add(reserved)
+            stack.append(reserved)
+            tracked.add(reserved)
 
-        if len(self.frame.stack) > self.frame.max_stack:
-            self.frame.max_stack = len(self.frame.stack)
+        if len(stack) > frame.max_stack:
+            frame.max_stack = len(stack)
 
         return entry
 
@@ -277,18 +621,34 @@ class Context:
         :param as_tuple: Whether to return a tuple of entries or a single entry.
         """
 
-        # We'll use a faster path here because we know that this method will only really be called by instructions.
-        if count == 1 and self.frame.stack:
-            entries = [self.frame.stack.pop()]
-        # TODO: Faster equivalent for a count of 2?
-        else:
-            entries = self.frame.pop(count)
+        # We'll use faster paths for popping one or two entries here because we know that this method will only really
+        # be called by instructions, which don't tend to pop any more than that.
+        frame = self.frame
+        if count == 1 and frame._stack:
+            entry = frame._translate_stack(frame._own_stack().pop())
+            if self.source is not None and entry is not Frame.TOP:
+                entry.consume(self.source)
+            if as_tuple:
+                return (entry,)
+            return entry
+
+        elif count == 2 and len(frame._stack) >= 2:
+            stack = frame._own_stack()
+            entry_a = frame._translate_stack(stack.pop())
+            entry_b = frame._translate_stack(stack.pop())
+            if self.source is not None and entry_a is not Frame.TOP:
+                entry_a.consume(self.source)
+                if entry_b is not Frame.TOP:
+                    entry_b.consume(self.source)
+            return entry_a, entry_b
+
+        entries = frame.pop(count)
 
         if self.source is not None:
             for entry in entries:
                 if entry is Frame.TOP:
                     break
-                entry._consumers.append(self.source)
+                entry.consume(self.source)
 
         if count == 1 and not as_tuple:
             return entries[0]
@@ -320,19 +680,22 @@ class Context:
                 self.conflicts.add(Trace.Conflict(entry, constraint, self.source))
                 entry = Entry(constraint.as_vtype(), self.source, entry)
 
-        self.frame.locals[index] = entry
-        self.frame.tracked.add(entry)
+        frame = self.frame
+        locals_ = frame._own_locals()
+        tracked = frame._own_tracked()
+        locals_[index] = entry
+        tracked.add(entry)
         self.local_defs.add(index)
 
         if type_.wide:
             index += 1
             reserved = Entry(reserved_t, self.source)
-            self.frame.locals[index] = reserved
-            self.frame.tracked.add(reserved)
+            locals_[index] = reserved
+            tracked.add(reserved)
             self.local_defs.add(index)
 
-        if index >= self.frame.max_locals:
-            self.frame.max_locals = index + 1
+        if index >= frame.max_locals:
+            frame.max_locals = index + 1
 
     def get(self, index: int) -> Entry:
         """
@@ -345,7 +708,7 @@ class Context:
         if entry is Frame.TOP:
             return Frame.TOP
         if self.source is not None:
-            entry._consumers.append(self.source)
+            entry.consume(self.source)
 
         # If the local has already been overwritten then don't add it to the reads. The better solution would be storing
         # an actual use-def chain, but using sets is much faster. My thinking behind this is that since we're working
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+__all__ = (
+    "TRACERS",
+)
+
+"""
+Specialised trace functions for the most common (and simplest) instructions.
+"""
+
+import typing
+from typing import Callable
+
+from .frame import Entry, Frame
+from .. import instructions
+from ..instructions import *
+from ..types import int_t, reserved_t, Reference, ReturnAddress, Type
+
+if typing.TYPE_CHECKING:
+    from . import Context
+
+# Note: these all have the exact same behaviour as the instruction's own trace method, they just skip over the generic
+# Context methods (and the tuples/kwargs that they involve) where possible. Any uncommon cases, such as popping tops,
+# missing locals and type mismatches, are delegated back to the generic methods.
+
+_STACK = Frame._STACK
+_LOCALS = Frame._LOCALS
+_TOP = Frame.TOP
+
+
+def _constant(class_: type[ConstantInstruction]) -> Callable[[ConstantInstruction, "Context"], None]:
+    fixed = issubclass(class_, FixedConstantInstruction)
+    fallback = class_.trace
+
+    def trace(instruction: ConstantInstruction, context: "Context") -> None:
+        type_ = instruction.constant.type
+        if type_ is None:
+            fallback(instruction, context)
+            return
+
+        source = context.source
+        frame = context.frame
+        stack = frame._own_stack()
+        tracked = frame._own_tracked()
+
+        entry = Entry(type_.as_vtype(), source)
+        stack.append(entry)
+        tracked.add(entry)
+        if entry.generic.wide:
+            reserved = Entry(reserved_t, source)
+            stack.append(reserved)
+            tracked.add(reserved)
+        if len(stack) > frame.max_stack:
+            frame.max_stack = len(stack)
+
+        if type_ is not entry.generic and type_ != entry.generic:
+            context.constrain(entry, type_, original=True)
+
+    if fixed and class_.constant.type is not None:  # Don't need to check the constant type every time for these.
+        type_ = class_.constant.type
+        vtype = type_.as_vtype()
+        if not vtype.wide and Entry._generify(vtype)[1] is None and type_ == vtype:
+            def trace(instruction: ConstantInstruction, context: "Context") -> None:
+                frame = context.frame
+                stack = frame._own_stack()
+                entry = Entry(vtype, context.source)
+                stack.append(entry)
+                frame._own_tracked().add(entry)
+                if len(stack) > frame.max_stack:
+                    frame.max_stack = len(stack)
+
+    return trace
+
+
+def _load_local(class_: type[LoadLocalInstruction]) -> Callable[[LoadLocalInstruction, "Context"], None]:
+    type_ = class_.type
+    fallback = class_.trace
+
+    def trace(instruction: LoadLocalInstruction, context: "Context") -> None:
+        frame = context.frame
+        index = instruction.index
+        entry = frame._locals.get(index)
+        if entry is None or entry is _TOP:
+            fallback(instruction, context)
+            return
+        if frame._pending & _LOCALS:
+            entry = frame._copy.translate(entry)
+        generic = entry.generic
+        if generic.wide:  # Need to check the reserved half.
+            fallback(instruction, context)
+            return
+
+        source = context.source
+        if source is not None:
+            entry.consume(source)
+        if not index in context.local_defs:
+            context.local_uses.add(index)
+
+        if generic is not type_ and generic != type_:
+            context.push(entry, type_)
+            return
+
+        stack = frame._own_stack()
+        stack.append(entry)
+        frame._own_tracked().add(entry)
+        if len(stack) > frame.max_stack:
+            frame.max_stack = len(stack)
+
+    return trace
+
+
+def _store_local(class_: type[StoreLocalInstruction]) -> Callable[[StoreLocalInstruction, "Context"], None]:
+    type_ = class_.type
+    fallback = class_.trace
+
+    def trace(instruction: StoreLocalInstruction, context: "Context") -> None:
+        frame = context.frame
+        stack = frame._stack
+        if not stack or stack[-1] is _TOP:
+            fallback(instruction, context)
+            return
+
+        entry = frame._own_stack().pop()
+        if frame._pending & _STACK:
+            entry = frame._copy.translate(entry)
+        source = context.source
+        if source is not None:
+            entry.consume(source)
+
+        index = instruction.index
+        generic = entry.generic
+        if generic is not type_ and generic != type_:
+            # Includes the special case for return addresses too.
+            if isinstance(type_, Reference) and type(generic) is ReturnAddress:
+                context.set(index, entry)
+            else:
+                context.constrain(entry, type_)
+                context.set(index, entry, type_)
+            return
+
+        frame._own_locals()[index] = entry
+        frame._own_tracked().add(entry)
+        context.local_defs.add(index)
+        if index >= frame.max_locals:
+            frame.max_locals = index + 1
+
+    return trace
+
+
+def _increment_local(class_: type[IncrementLocalInstruction]) -> Callable[[IncrementLocalInstruction, "Context"], None]:
+    fallback = class_.trace
+
+    def trace(instruction: IncrementLocalInstruction, context: "Context") -> None:
+        frame = context.frame
+        index = instruction.index
+        entry = frame._locals.get(index)
+        if entry is None or entry is _TOP:
+            fallback(instruction, context)
+            return
+        if frame._pending & _LOCALS:
+            entry = frame._copy.translate(entry)
+        generic = entry.generic
+        if generic.wide:
+            fallback(instruction, context)
+            return
+
+        source = context.source
+        if source is not None:
+            entry.consume(source)
+        if not index in context.local_defs:
+            context.local_uses.add(index)
+        if generic is not int_t and generic != int_t:
+            context.constrain(entry, int_t)
+
+        entry = Entry(int_t, source)
+        frame._own_locals()[index] = entry
+        frame._own_tracked().add(entry)
+        context.local_defs.add(index)
+        if index >= frame.max_locals:
+            frame.max_locals = index + 1
+
+    return trace
+
+
+def _unary_operation(type_: Type, fallback: Callable) -> Callable[[Instruction, "Context"], None]:
+    def trace(instruction: Instruction, context: "Context") -> None:
+        frame = context.frame
+        stack = frame._stack
+        if not stack or stack[-1] is _TOP:
+            fallback(instruction, context)
+            return
+
+        stack = frame._own_stack()
+        entry = stack.pop()
+        if frame._pending & _STACK:
+            entry = frame._copy.translate(entry)
+        if context.source is not None:
+            entry.consume(context.source)
+
+        generic = entry.generic
+        if generic is not type_ and generic != type_:
+            context.constrain(entry, type_)
+            context.push(entry, type_)
+            return
+
+        stack.append(entry)
+        frame._own_tracked().add(entry)
+
+    return trace
+
+
+def _binary_operation(type_a: Type, type_b: Type, type_out: Type, fallback: Callable) -> Callable[[Instruction, "Context"], None]:
+    def trace(instruction: Instruction, context: "Context") -> None:
+        frame = context.frame
+        stack = frame._stack
+        if len(stack) < 2 or stack[-1] is _TOP or stack[-2] is _TOP:
+            fallback(instruction, context)
+            return
+
+        stack = frame._own_stack()
+        entry_a = stack.pop()
+        entry_b = stack.pop()
+        if frame._pending & _STACK:
+            translate = frame._copy.translate
+            entry_a = translate(entry_a)
+            entry_b = translate(entry_b)
+
+        source = context.source
+        if source is not None:
+            entry_a.consume(source)
+            entry_b.consume(source)
+
+        generic = entry_a.generic
+        if generic is not type_a and generic != type_a:
+            context.constrain(entry_a, type_a)
+        generic = entry_b.generic
+        if generic is not type_b and generic != type_b:
+            context.constrain(entry_b, type_b)
+
+        entry = Entry(type_out, source)
+        stack.append(entry)
+        frame._own_tracked().add(entry)
+
+    return trace
+
+
+# The trace functions for each instruction class (rather than opcode, so that any custom subclasses of instructions
+# still use their own trace methods).
+TRACERS: dict[type[Instruction], Callable[[Instruction, "Context"], None]] = {}
+
+# Only instructions that haven't overridden the trace method of their base class are specialised. Wide types are also
+# left to the generic trace methods as they're not as common.
+for _class in instructions.INSTRUCTIONS:
+    _trace = _class.trace
+
+    if _trace is ConstantInstruction.trace:
+        if issubclass(_class, (FixedConstantInstruction, IntegerConstantInstruction)):
+            TRACERS[_class] = _constant(_class)
+
+    elif _trace is LoadLocalInstruction.trace:
+        if not _class.type.wide:
+            TRACERS[_class] = _load_local(_class)
+    elif _trace is StoreLocalInstruction.trace:
+        if not _class.type.wide:
+            TRACERS[_class] = _store_local(_class)
+    elif _trace is IncrementLocalInstruction.trace:
+        TRACERS[_class] = _increment_local(_class)
+
+    elif _trace is ComparisonInstruction.trace:
+        if not _class.type.wide:
+            TRACERS[_class] = _binary_operation(_class.type, _class.type, int_t, _trace)
+    elif _trace is BinaryOperationInstruction.trace:
+        if not _class.type_a.wide and not _class.type_b.wide:
+            TRACERS[_class] = _binary_operation(_class.type_a, _class.type_b, _class.type_b, _trace)
+    elif _trace is UnaryOperationInstruction.trace:
+        if not _class.type.wide:
+            TRACERS[_class] = _unary_operation(_class.type, _trace)
+
+del _class, _trace
@@ -10,22 +10,200 @@ The actual code that computes trace information.
 
 import logging
 from collections import defaultdict, deque
+from heapq import heappop, heappush
+from itertools import count
+from typing import Callable, Iterable
 
 from . import Context, Trace
+from .budget import Budget
 from .frame import Frame
 from .graph import *
-from ..error import MergeError
+from ..error import BudgetExceededError, MergeError
 
 logger = logging.getLogger("kirjava.analysis._trace")
 
 
-def trace(trace: Trace, graph: InsnGraph, do_raise: bool, merge_non_live: bool, make_params_live: bool) -> None:
+def _to_set(mask: int) -> set[int]:
+    """
+    Converts a bitset of local indices to a set.
+    """
+
+    indices = set()
+    while mask:
+        bit = mask & -mask
+        indices.add(bit.bit_length() - 1)
+        mask ^= bit
+    return indices
+
+
+def _to_mask(indices: Iterable[int]) -> int:
+    """
+    Converts local indices to a bitset.
+    """
+
+    mask = 0
+    for index in indices:
+        mask |= 1 << index
+    return mask
+
+
+def _postorder(graph: InsnGraph) -> list[InsnBlock]:
+    """
+    Computes the (DFS) postorder of the blocks in a graph, starting from the entry block.
+    """
+
+    postorder = []
+    visited = {graph.entry_block}
+    stack = [(graph.entry_block, iter(graph.out_edges(graph.entry_block)))]
+
+    while stack:
+        block, edges = stack[-1]
+        for edge in edges:
+            if edge.to is None or edge.to in visited:
+                continue
+            visited.add(edge.to)
+            stack.append((edge.to, iter(graph.out_edges(edge.to))))
+            break
+        else:
+            stack.pop()
+            postorder.append(block)
+
+    return postorder
+
+
+def _settled(frame: Frame, constraint: Frame, check_depth: bool) -> bool:
+    """
+    Checks if a frame will merge with a constraint regardless of which locals turn out to be live, meaning that the merge
+    can't cause a retrace later on. Nothing is merged.
+    """
+
+    # The raw entries are used, as copied entries have the same types and we don't want to translate them here.
+    stack_a = frame._stack
+    stack_b = constraint._stack
+    if check_depth and len(stack_a) != len(stack_b):
+        return False
+    for entry_a, entry_b in zip(stack_a, stack_b):
+        if not entry_a.generic.mergeable(entry_b.generic):
+            return False
+
+    locals_b = constraint._locals
+    for index, entry_a in frame._locals.items():
+        entry_b = locals_b.get(index)
+        if entry_b is None or not entry_a.generic.mergeable(entry_b.generic):
+            return False
+
+    return True
+
+
+def _latest_ancestors(graph: InsnGraph, reverse_postorder: dict[InsnBlock, int]) -> dict[InsnBlock, int]:
+    """
+    Computes the latest position in the reverse postorder of any block that can reach each block (including the block
+    itself). Once the trace has moved past this position, the block can't be given any more frames.
+    """
+
+    # Tarjan's algorithm, the strongly connected components are found in reverse topological order.
+    index: dict[InsnBlock, int] = {}
+    low: dict[InsnBlock, int] = {}
+    stack: list[InsnBlock] = []
+    on_stack: set[InsnBlock] = set()
+    components: list[list[InsnBlock]] = []
+
+    def _successors(block: InsnBlock) -> Iterable[InsnBlock]:
+        return (edge.to for edge in graph.out_edges(block) if edge.to is not None)
+
+    for root in reverse_postorder:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(_successors(root)))]
+
+        while work:
+            block, successors = work[-1]
+            for successor in successors:
+                if not successor in index:
+                    index[successor] = low[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(_successors(successor))))
+                    break
+                elif successor in on_stack and index[successor] < low[block]:
+                    low[block] = index[successor]
+            else:
+                work.pop()
+                if work and low[block] < low[work[-1][0]]:
+                    low[work[-1][0]] = low[block]
+                if low[block] == index[block]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member is block:
+                            break
+                    components.append(component)
+
+    latest = {block: reverse_postorder.get(block, len(reverse_postorder)) for block in index}
+    for component in reversed(components):
+        position = max(latest[block] for block in component)
+        for block in component:
+            latest[block] = position
+        for block in component:
+            for successor in _successors(block):
+                if latest[successor] < position:
+                    latest[successor] = position
+
+    return latest
+
+
+_DEFAULT_BUDGET = Budget()
+
+
+def trace(
+        trace: Trace, graph: InsnGraph,
+        do_raise: bool, merge_non_live: bool, make_params_live: bool,
+        budget: Budget | None,
+        affected: set[InsnBlock] | None = None,
+        stale: set[InsnBlock] | None = None,
+        callback: Callable[[Trace.Summary], None] | None = None,
+) -> None:
+    """
+    Computes the trace information for a graph, or resumes an existing trace.
+
+    Blocks are summarised (and their entries released, if they aren't being retained) as soon as they can't be given
+    any more frames, which keeps the memory used by the trace bounded on large methods.
+
+    :param affected: If resuming, the blocks to retrace. These are traced from the exits of the blocks leading into
+                     them, so any existing trace information for them must have been discarded.
+    :param stale: If resuming, the blocks whose liveness needs recomputing, their liveness must also have been discarded.
+    :param callback: Called with the summary of each block.
+    """
+
     logger.debug("Computing trace information for %s:" % graph.method)
 
+    if budget is None:
+        budget = _DEFAULT_BUDGET
+    budget = budget.start()
+    # Only the passes are limited by default, so we can skip the other checks entirely in that case.
+    limited = budget.limited
+    count_entries = budget.max_entries is not None
+    tracked = 0
+
     context = Context(graph.method, graph, do_raise)
 
     entries = trace.entries
     exits = trace.exits
+    # The entries are needed to merge frames while tracing, but the exits aren't, so they aren't kept unless needed.
+    retain_exits = trace.retain & Trace.RETAIN_EXITS
+    retain_deltas = trace.retain & Trace.RETAIN_DELTAS
+    deltas = trace.deltas
+    records = trace._records
+
+    retain_entries = trace.retain & Trace.RETAIN_ENTRIES
+    retain_summaries = trace.retain & Trace.RETAIN_SUMMARIES
+    summaries = trace.summaries
+    summarise = callback is not None or retain_summaries
 
     conflicts = trace.conflicts
     subroutines = trace.subroutines
@@ -33,34 +211,152 @@ def trace(trace: Trace, graph: InsnGraph, do_raise: bool, merge_non_live: bool,
     pre_liveness = trace.pre_liveness
     post_liveness = trace.post_liveness
 
-    trace_stack: deque[tuple[Frame, InsnBlock, InsnEdge | None]] = deque()
-    liveness_stack: deque[InsnEdge] = deque()
+    # Blocks are traced in reverse postorder (where possible), meaning that we'll have traced all the forward predecessors
+    # of a block before tracing it, so any merges happen before its successors are traced. Ties are broken by the order
+    # of the blocks the frames came from, and then the order in which they were queued, so that resuming a trace merges
+    # frames in the same order as a full trace would.
+    trace_queue: list[tuple[int, int, int, Frame, InsnBlock, InsnEdge | None]] = []
     branches: deque[tuple[Frame, InsnBlock, InsnEdge]] = []
     retraces: list[tuple[Frame, InsnBlock, InsnEdge]] = []
 
-    uses: dict[InsnBlock, set[int]] = defaultdict(set)
-    defs: dict[InsnBlock, set[int]] = defaultdict(set)
-
-    initial = Frame.initial(graph.method)
-    trace.max_locals = initial.max_locals
-    trace_stack.append((initial, graph.entry_block, None))
+    # Local uses, definitions and liveness are all stored as bitsets of local indices, which is considerably faster than
+    # using sets for methods with many locals.
+    uses = trace._uses
+    defs = trace._defs
+
+    # Any liveness information that already exists is still valid if we're resuming.
+    pre_masks: dict[InsnBlock, int] = {block: _to_mask(live) for block, live in pre_liveness.items()}
+    post_masks: dict[InsnBlock, int] = {block: _to_mask(live) for block, live in post_liveness.items()}
+    changed: set[InsnBlock] = set()
+
+    postorder_blocks = _postorder(graph)
+    postorder = {block: index for index, block in enumerate(postorder_blocks)}
+    reverse_postorder = {block: index for index, block in enumerate(reversed(postorder_blocks))}
+    counter = count()
+    worklist: list[int] = []
+    scheduled: set[InsnBlock] = set()
+
+    def _schedule(block: InsnBlock) -> None:
+        if block in scheduled:
+            return
+        index = postorder.get(block)
+        if index is None:  # Not reachable from the entry block, so we'll just add it at the end.
+            index = postorder[block] = len(postorder_blocks)
+            postorder_blocks.append(block)
+        scheduled.add(block)
+        heappush(worklist, index)
+
+    def _queue(frame: Frame, block: InsnBlock, edge: InsnEdge | None) -> None:
+        # Blocks that aren't reachable from the entry block are ordered last.
+        index = reverse_postorder.get(block, len(reverse_postorder))
+        from_index = -1 if edge is None else reverse_postorder.get(edge.from_, len(reverse_postorder))
+        heappush(trace_queue, (index, from_index, next(counter), frame, block, edge))
+
+    # The blocks that have been traced but not yet released (summarised and/or had their entries discarded), in the order
+    # they were first traced in, and the conflicts in each of them.
+    unreleased: dict[InsnBlock, None] = {}
+    block_conflicts: dict[InsnBlock, set[Trace.Conflict]] = defaultdict(set)
+    # The indices of the branches to each block, so that they can be merged (and their frames dropped) when the block is
+    # released.
+    block_branches: dict[InsnBlock, list[int]] = defaultdict(list)
+
+    def _release(block: InsnBlock) -> None:
+        del unreleased[block]
+        if summarise:
+            summary = Trace.Summary(block, entries[block], block_conflicts.pop(block, ()))
+            if retain_summaries:
+                summaries[block] = summary
+            if callback is not None:
+                callback(summary)
+
+        # The branches to this block are all settled (so can't cause a retrace), and are merged now rather than at the
+        # end of the pass, as the block's entries may not be kept until then. This is done whether they're kept or not,
+        # so that the types seen by any later summaries don't depend on what's being retained.
+        constraints = entries[block]
+        live_locals = _to_set(uses[block] | pre_masks.get(block, 0))
+        for index in block_branches.pop(block, ()):
+            frame, _, edge = branches[index]
+            check_depth = edge.to is not graph.return_block and edge.to is not graph.rethrow_block
+            for constraint in constraints:
+                try:
+                    frame.merge(constraint, edge, live_locals, check_depth, merge_non_live)
+                except MergeError as error:
+                    if do_raise:
+                        raise error
+            if not retain_entries:
+                branches[index] = (None, block, edge)
+
+        if not retain_entries:
+            del entries[block]
+            deltas.pop(block, None)
+
+    # Blocks are released early if they don't need to be kept, once the trace has moved past all the blocks that can
+    # reach them. Blocks that can reach themselves via subroutines aren't known about in advance though, so these aren't.
+    track = summarise or not retain_entries
+    release = track and not any(
+        type(edge) in (JsrJumpEdge, RetEdge) for edges in graph._forward_edges.values() for edge in edges
+    )
+    latest: dict[InsnBlock, int] = {}
+    releasable: list[tuple[int, int, InsnBlock]] = []
+    # Blocks that may be given more frames this pass, due to merges that need to be checked or conflicts.
+    pending: set[InsnBlock] = set()
+    deferred: list[InsnBlock] = []
+
+    if release:
+        latest = _latest_ancestors(graph, reverse_postorder)
+
+    def _pend(block: InsnBlock) -> None:
+        # Any blocks that this block can reach may be retraced, so they have to be kept until the next pass.
+        if block in pending:
+            return
+        pending.add(block)
+        stack = [block]
+        while stack:
+            for edge in graph.out_edges(stack.pop()):
+                if edge.to is not None and not edge.to in pending:
+                    pending.add(edge.to)
+                    stack.append(edge.to)
+
+    if affected is None:
+        initial = Frame.initial(graph.method)
+        trace.max_locals = initial.max_locals
+        _queue(initial, graph.entry_block, None)
+
+        if make_params_live:
+            uses[graph.entry_block] = _to_mask(initial.locals.keys())
 
-    if make_params_live:
-        uses[graph.entry_block] = set(initial.locals.keys())
+    else:
+        # Resuming, so the frames are queued from the exits of the blocks leading into the affected blocks, in the order
+        # that they would have been traced in.
+        for block in sorted(exits.keys() - affected, key=lambda block: reverse_postorder.get(block, len(postorder))):
+            out_edges = [edge for edge in graph.out_edges(block) if edge.to in affected]
+            if not out_edges:
+                continue
+            for frame in exits[block]:
+                for edge in out_edges:
+                    # The exits are the frames that were passed along all the other edges, it's only exception edges that
+                    # create new ones.
+                    if type(edge) is ExceptionEdge:
+                        context.frame = frame
+                        handler_frame, _ = edge.trace(context)
+                        _queue(handler_frame, edge.to, edge)
+                    else:
+                        _queue(frame, edge.to, edge)
 
     # Not actually sure how many passes are needed for some methods, most tend to be 1 to 2 and some cleverly crafted
-    # methods (mainly using subroutines) cause up to 5, but I'll put this to a max of 100 to be on the safe side.
-    for pass_ in range(100):
+    # methods (mainly using subroutines) cause up to 5, but the default budget puts this to a max of 100 to be on the
+    # safe side.
+    for pass_ in range(budget.max_passes):
 
     # ------------------------------------------------------------ #
-    #                           DFS trace                          #
+    #                           RPO trace                          #
     # ------------------------------------------------------------ #
 
         traced = 0
         retraced = 0
 
-        while trace_stack:
-            frame, block, edge = trace_stack.pop()
+        while trace_queue:
+            *_, frame, block, edge = heappop(trace_queue)
             constraints = entries[block]
 
             # Special check for subroutines too because we want to record those.
@@ -84,7 +380,8 @@ def trace(trace: Trace, graph: InsnGraph, do_raise: bool, merge_non_live: bool,
                 # which is why some retraces are done later.
 
                 can_merge = False
-                live_locals = uses[block]
+                # Any liveness from previous passes is used too, as it allows us to detect more merge conflicts.
+                live_locals = _to_set(uses[block] | pre_masks.get(block, 0))
                 # We can return with multiple stack depths so we can ignore checking that.
                 check_depth = (
                     edge is not None and
@@ -92,12 +389,14 @@ def trace(trace: Trace, graph: InsnGraph, do_raise: bool, merge_non_live: bool,
                     edge.to is not graph.rethrow_block
                 )
 
+                settled = False
                 for constraint in constraints:
                     try:
                         # Note: probably due to a retrace(?) so won't merge non-live locals on this pass.
                         # FIXME: Verify this is actually the correct way of doing things.
                         if frame.merge(constraint, edge, live_locals, check_depth, False):
                             can_merge = True
+                            settled = release and _settled(frame, constraint, check_depth)
                             # We'll break early for performance reasons. Any further entry merges will be done later in
                             # the retrace stage.
                             break
@@ -106,11 +405,18 @@ def trace(trace: Trace, graph: InsnGraph, do_raise: bool, merge_non_live: bool,
                             raise error
 
                 if can_merge:  # If we can merge this frame, add it to the branches and we'll check constraints again later.
+                    if track:
+                        block_branches[block].append(len(branches))
                     branches.append((frame, block, edge))
+                    # If the merge is valid whatever the liveness, this block won't be retraced because of it.
+                    if release and not settled:
+                        _pend(block)
                     continue
                 retraced += 1
 
             traced += 1
+            if limited:
+                budget.check(trace.blocks_traced + traced, tracked)
 
             initial = frame
 
@@ -126,36 +432,93 @@ def trace(trace: Trace, graph: InsnGraph, do_raise: bool, merge_non_live: bool,
 
             entries[block].append(frame.copy(deep=False))
             context.frame = frame
+            if count_entries:
+                # Entries shared with the predecessor (or yet to be copied from it) are charged too, as they're kept
+                # alive by this block's entry frame, otherwise only the entries this block creates would count.
+                tracked += len(frame._stack) + len(frame._locals)
+                before = len(frame._tracked)
             # Note: performance is similar to ` = set()`.
             context.conflicts.clear()
             context.local_uses.clear()
             context.local_defs.clear()
 
-            block.trace(context)
+            if retain_deltas:
+                # Slower as we need to compare the frame before and after every instruction, but means that the frames
+                # at each instruction can be recovered quickly later on.
+                block_deltas = []
+                before = frame.copy(deep=False)
+                for _ in block.trace_iter(context):
+                    block_deltas.append(before.delta(context.frame))
+                    before = context.frame.copy(deep=False)
+                deltas[block].append(block_deltas)
+            else:
+                block.trace(context)
+
+            record = None
+            if records is not None:
+                record = records.get(block)
+                if record is None:
+                    record = records[block] = Trace._Record()
 
             for out_edge in graph.out_edges(block):
                 frame, to = out_edge.trace(context)
                 if frame is None or to is None:
                     continue
-                trace_stack.append((frame, to, out_edge))
+                _queue(frame, to, out_edge)
 
                 if frame.max_stack > trace.max_stack:
                     trace.max_stack = frame.max_stack
                 if frame.max_locals > trace.max_locals:
                     trace.max_locals = frame.max_locals
+                if record is not None:
+                    record.successors.add(to)
+                    if frame.max_stack > record.max_stack:
+                        record.max_stack = frame.max_stack
+                    if frame.max_locals > record.max_locals:
+                        record.max_locals = frame.max_locals
+
+            if context.returned:
+                trace.returned.update(context.returned)
+                if record is not None:
+                    record.returned.update(context.returned)
+                context.returned.clear()
 
             if context.conflicts:
                 retraces.append((initial, block, edge))
                 conflicts.update(context.conflicts)
-
-            uses[block].update(context.local_uses)
-            defs[block].update(context.local_defs)
-            exits[block].append(context.frame)
-
-        if not traced:  # Nothing more to do at this point.
-            return
-
-        trace.returned.update(context.returned)
+                if summarise:
+                    block_conflicts[block].update(context.conflicts)
+                if release:
+                    _pend(block)
+
+            uses[block] |= _to_mask(context.local_uses)
+            defs[block] |= _to_mask(context.local_defs)
+            if count_entries:
+                tracked += len(context.frame._tracked) - before
+            if retain_exits:
+                exits[block].append(context.frame)
+
+            if track and not block in unreleased:
+                unreleased[block] = None
+                position = latest.get(block)
+                if position is not None:
+                    heappush(releasable, (position, reverse_postorder[block], block))
+            if release:
+                # Nothing in the queue can reach these blocks anymore.
+                position = trace_queue[0][0] if trace_queue else len(reverse_postorder) + 1
+                while releasable and releasable[0][0] < position:
+                    *_, ready = heappop(releasable)
+                    if ready in pending:
+                        deferred.append(ready)
+                    else:
+                        _release(ready)
+
+        trace.passes = pass_ + 1
+        trace.blocks_traced += traced
+        trace.blocks_retraced += retraced
+
+        if not traced and not stale:  # Nothing more to do at this point.
+            break
 
         logger.debug(" - (pass %i) traced %i block(s), %i were retraced." % (pass_ + 1, traced, retraced))
         if branches:
@@ -168,24 +531,30 @@ def trace(trace: Trace, graph: InsnGraph, do_raise: bool, merge_non_live: bool,
     # ------------------------------------------------------------ #
 
         # Since the return/rethrow blocks cannot access locals, we know that their pre-liveness is empty.
-        pre_liveness[graph.return_block] = set()
-        pre_liveness[graph.rethrow_block] = set()
+        pre_masks[graph.return_block] = 0
+        pre_masks[graph.rethrow_block] = 0
 
-        liveness_stack.extendleft(graph.in_edges(graph.return_block))
-        liveness_stack.extendleft(graph.in_edges(graph.rethrow_block))
-
-        # The graph doesn't know about any resolved subroutines, and we need these for the liveness stack, so we'll record
-        # the exit blocks in a dictionary for fast lookup.
-        subroutine_exits: dict[InsnBlock, set[RetEdge]] = defaultdict(set)
+        # The graph doesn't know about any resolved subroutines, and we need these for the liveness worklist, so we'll
+        # record the exit blocks in a dictionary for fast lookup (they're effectively extra edges in the graph).
+        subroutine_exits: dict[InsnBlock, set[InsnBlock]] = defaultdict(set)
+        subroutine_entries: dict[InsnBlock, set[InsnBlock]] = defaultdict(set)
 
         for subroutine in subroutines:
-            ret_edge = subroutine.ret_edge.copy(to=subroutine.exit_block, deep=False)
-
-            subroutine_exits[subroutine.exit_block].add(ret_edge)
-            liveness_stack.append(ret_edge)
-
-        # On top of having edges to the return and rethrow blocks on the liveness stack, we also need to account for things
-        # like infinite loops, a contrived example:
+            subroutine_exits[subroutine.exit_block].add(subroutine.ret_edge.from_)
+            subroutine_entries[subroutine.ret_edge.from_].add(subroutine.exit_block)
+            _schedule(subroutine.ret_edge.from_)
+
+        for edge in graph.in_edges(graph.return_block):
+            _schedule(edge.from_)
+        for edge in graph.in_edges(graph.rethrow_block):
+            _schedule(edge.from_)
+        if stale:
+            for block in stale:
+                _schedule(block)
+            stale = None
+
+        # On top of having the blocks going to the return and rethrow blocks in the worklist, we also need to account
+        # for things like infinite loops, a contrived example:
         # entry:
         #   aload_0
         #   arraylength
@@ -198,49 +567,61 @@ def trace(trace: Trace, graph: InsnGraph, do_raise: bool, merge_non_live: bool,
         # exit:
         #   return
         # In this case we won't trace backwards from the loop block as it never reaches the return or rethrow block,
-        # as it is itself still a leaf node. The solution to this is adding the "to-visit" branches to the liveness
-        # stack. This works as the DFS will visit the loop entry, but not the cyclic edge, which is excellent as we
-        # can just trace backwards from the cyclic edge and end up having visited the entire loop.
-        for frame, to, edge in branches:
-            if frame is None or to is None:
+        # as it is itself still a leaf node. The solution to this is adding the "to-visit" branches to the worklist.
+        # This works as the DFS will visit the loop entry, but not the cyclic edge, which is excellent as we can just
+        # trace backwards from the cyclic edge and end up having visited the entire loop.
+        for _, to, edge in branches:
+            if to is None:
                 continue
-            liveness_stack.append(edge)
+            _schedule(edge.from_)
 
-        while liveness_stack:
-            edge = liveness_stack.popleft()
-            if edge.to is None:  # Opaque edge, ignore.
-                continue
+        # Liveness is a backwards problem, so the worklist is ordered by the postorder of the blocks, meaning that we'll
+        # (ideally) visit all successors of a block before we visit the block itself.
+        while worklist:
+            if limited:
+                budget.check(trace.blocks_traced, tracked)
 
-            # Yes, the naming isn't the best but oh well.
-            prev_pre = pre_liveness.get(edge.to) or set()
+            block = postorder_blocks[heappop(worklist)]
+            scheduled.discard(block)
 
-            old_post = post_liveness.get(edge.from_)
-            old_pre = pre_liveness.get(edge.from_)
+            old_post = post_masks.get(block)
+            old_pre = pre_masks.get(block)
 
-            new_post = (old_post or set()).union(prev_pre)
-            new_pre = (old_pre or set()).union(uses[edge.from_])
+            new_post = old_post or 0
+            handlers = 0
 
-            # Exception edges assume that the exception could have been thrown from anywhere within the block, so we
-            # can't assume that any redefinitions occurred and we'll instead just copy the liveness state at the
-            # handler's entry to the entry of this block.
-            if type(edge) is ExceptionEdge:
-                new_pre.update(prev_pre)
-            else:
-                new_pre.update(new_post.difference(defs[edge.from_]))
-
-            post_changed = old_post != new_post
-            pre_changed = old_pre != new_pre
-
-            if post_changed:
-                post_liveness[edge.from_] = new_post
-            if pre_changed:
-                pre_liveness[edge.from_] = new_pre
+            for edge in graph.out_edges(block):
+                if edge.to is None:  # Opaque edge, ignore.
+                    continue
+                pre = pre_masks.get(edge.to, 0)
+                new_post |= pre
+                # Exception edges assume that the exception could have been thrown from anywhere within the block, so
+                # we can't assume that any redefinitions occurred and we'll instead just copy the liveness state at the
+                # handler's entry to the entry of this block.
+                if type(edge) is ExceptionEdge:
+                    handlers |= pre
+            for exit_block in subroutine_entries.get(block, ()):
+                new_post |= pre_masks.get(exit_block, 0)
+
+            new_pre = (old_pre or 0) | uses[block] | handlers | (new_post & ~defs[block])
+
+            if old_post != new_post or old_pre != new_pre:
+                post_masks[block] = new_post
+                pre_masks[block] = new_pre
+                # Record the changes so that we only need to update the public liveness views for these blocks.
+                changed.add(block)
+
+                for edge in graph.in_edges(block):
+                    _schedule(edge.from_)
+                for ret_block in subroutine_exits.get(block, ()):
+                    _schedule(ret_block)
 
-            if post_changed or pre_changed:
-                liveness_stack.extendleft(graph.in_edges(edge.from_))
-                ret_edges = subroutine_exits.get(edge.from_)
-                if ret_edges is not None:
-                    liveness_stack.extendleft(ret_edges)
+        pre_liveness[graph.return_block] = set()
+        pre_liveness[graph.rethrow_block] = set()
+        for block in changed:
+            pre_liveness[block] = _to_set(pre_masks[block])
+            post_liveness[block] = _to_set(post_masks[block])
+        changed.clear()
 
         # for block in graph:
         #     print(block, pre_liveness.get(block), post_liveness.get(block))
@@ -250,7 +631,8 @@ def trace(trace: Trace, graph: InsnGraph, do_raise: bool, merge_non_live: bool,
     # ------------------------------------------------------------ #
 
         for frame, block, edge in branches:
-            constraints = entries[block]
+            constraints = entries.get(block)
+            # The block has already been released, which is only done if all the branches to it were settled.
             if constraints is None:
                 continue
 
@@ -274,18 +656,28 @@ def trace(trace: Trace, graph: InsnGraph, do_raise: bool, merge_non_live: bool,
 
         if not retraces:
             logger.debug("Trace for %s done in %i pass(es)." % (graph.method, pass_ + 1))
-            return  # Yay!!! The code is valid up until this point (minus the type checking).
+            break  # Yay!!! The code is valid up until this point (minus the type checking).
 
         logger.debug(" - %i branch(es) need to be retraced." % len(retraces))
 
-        trace_stack.extendleft(retraces)
+        for frame, block, edge in retraces:
+            _queue(frame, block, edge)
         branches.clear()
+        block_branches.clear()
         retraces.clear()
 
-        # This is valid to do as the uses is a subset of the pre liveness by definition. The extra liveness information
-        # allows us to detect more merge conflicts.
-        for block, liveness in pre_liveness.items():
-            uses[block].update(liveness)
+        # The deferred blocks can be released next pass, if they aren't retraced.
+        pending.clear()
+        for block in deferred:
+            heappush(releasable, (latest[block], reverse_postorder[block], block))
+        deferred.clear()
 
     else:
-        raise ValueError("Failed to trace %s after 100 passes." % graph.method)
+        raise BudgetExceededError(
+            "passes", budget.max_passes,
+            message="Failed to trace %s after %i passes." % (graph.method, budget.max_passes),
+        )
+
+    block_branches.clear()  # These have all been checked already.
+    for block in tuple(unreleased):
+        _release(block)
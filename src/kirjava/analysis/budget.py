@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+__all__ = (
+    "Budget", "CancellationToken",
+)
+
+"""
+Limits on how much work an analysis may do.
+"""
+
+import time
+
+from ..error import BudgetExceededError, CancelledError
+
+
+class CancellationToken:
+    """
+    Allows an analysis to be cancelled from elsewhere (i.e. another thread).
+    """
+
+    __slots__ = ("cancelled",)
+
+    def __init__(self) -> None:
+        self.cancelled = False
+
+    def __repr__(self) -> str:
+        return "<CancellationToken(cancelled=%s) at %x>" % (self.cancelled, id(self))
+
+    def cancel(self) -> None:
+        """
+        Cancels any analyses using this token, they'll stop at the next opportunity.
+        """
+
+        self.cancelled = True
+
+
+class Budget:
+    """
+    Limits for a trace (or an assemble), a BudgetExceededError is raised when any of them are hit.
+    """
+
+    __slots__ = ("max_passes", "max_blocks", "max_entries", "timeout", "deadline", "token")
+
+    def __init__(
+            self,
+            *,
+            max_passes: int = 100,
+            max_blocks: int | None = None,
+            max_entries: int | None = None,
+            timeout: float | None = None,
+            deadline: float | None = None,
+            token: CancellationToken | None = None,
+    ) -> None:
+        """
+        :param max_passes: The maximum number of trace passes.
+        :param max_blocks: The maximum number of blocks that can be traced (including retraces).
+        :param max_entries: The maximum number of entries that can be tracked, summed across all traced blocks. This is
+                            a rough proxy for the memory used by the trace.
+        :param timeout: The maximum time to spend, in seconds, from when the analysis starts (see start()).
+        :param deadline: An absolute deadline, as given by time.monotonic(). Useful for sharing a deadline between
+                         multiple analyses.
+        :param token: A cancellation token to check.
+        """
+
+        self.max_passes = max_passes
+        self.max_blocks = max_blocks
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.deadline = deadline
+        self.token = token
+
+    def __repr__(self) -> str:
+        return (
+            "<Budget(max_passes=%i, max_blocks=%s, max_entries=%s, timeout=%s, deadline=%s, token=%r) at %x>"
+        ) % (
+            self.max_passes, self.max_blocks, self.max_entries, self.timeout, self.deadline, self.token, id(self),
+        )
+
+    @property
+    def limited(self) -> bool:
+        """
+        :return: Is there anything other than the passes that needs checking while tracing?
+        """
+
+        return (
+            self.max_blocks is not None or
+            self.max_entries is not None or
+            self.timeout is not None or
+            self.deadline is not None or
+            self.token is not None
+        )
+
+    def start(self) -> "Budget":
+        """
+        Starts the clock on this budget, if it has a timeout.
+
+        :return: A copy of this budget with the timeout converted into a deadline, or this budget if there's no timeout.
+        """
+
+        if self.timeout is None:
+            return self
+        deadline = time.monotonic() + self.timeout
+        if self.deadline is not None and self.deadline < deadline:
+            deadline = self.deadline
+        return Budget(
+            max_passes=self.max_passes,
+            max_blocks=self.max_blocks,
+            max_entries=self.max_entries,
+            deadline=deadline,
+            token=self.token,
+        )
+
+    def check(self, blocks: int = 0, entries: int = 0) -> None:
+        """
+        Checks that none of the limits have been hit. The timeout isn't checked, only the deadline, see start().
+
+        :param blocks: The number of blocks traced so far.
+        :param entries: The number of entries tracked so far.
+        """
+
+        if self.token is not None and self.token.cancelled:
+            raise CancelledError()
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise BudgetExceededError("time", self.deadline, message="Budget exceeded: ran out of time.")
+        if self.max_blocks is not None and blocks > self.max_blocks:
+            raise BudgetExceededError("blocks", self.max_blocks)
+        if self.max_entries is not None and entries > self.max_entries:
+            raise BudgetExceededError("entries", self.max_entries)
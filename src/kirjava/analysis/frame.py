@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
 __all__ = (
-    "Entry", "Frame",
+    "Entry", "Delta", "Frame",
 )
 
 """
@@ -28,7 +28,10 @@ class Entry:
     A type entry in a stack frame.
     """
 
-    __slots__ = ("generic", "merges", "parent", "source", "_consumers", "_constraints")
+    __slots__ = (
+        "generic", "parent", "source",
+        "_root", "_members", "_consumers", "_constraints", "_inferences",
+    )
 
     @property
     def type(self) -> Type:
@@ -48,7 +51,17 @@ class Entry:
         :return: All adjacent entries (also called merges) to this entry.
         """
 
-        return tuple(self._iter_merges())
+        root = self._find()
+        return tuple(entry for entry in root._members or (root,) if entry is not self)
+
+    @property
+    def merges(self) -> frozenset["Entry"]:
+        """
+        :return: All the entries that this entry has been merged with, directly or indirectly. Read-only, use merge() to
+                 merge entries.
+        """
+
+        return frozenset(self.adjacent)
 
     @property
     def parents(self) -> tuple["Entry", ...]:
@@ -56,8 +69,9 @@ class Entry:
         :return: All the parents of this entry.
         """
 
-        parents = set(self._iter_parents())
-        for entry in self._iter_merges():
+        root = self._find()
+        parents = set()
+        for entry in root._members or (root,):
             parents.update(entry._iter_parents())
 
         # Although it is slower to copy this to a tuple, sets are more annoying to work with in an interactive shell.
@@ -70,10 +84,14 @@ class Entry:
         :return: All type constraints for this entry. Note: this is not necessarily all the types this entry could be.
         """
 
-        constraints = self._constraints.copy()
+        root = self._find()
+        constraints = set()
+        if root._constraints is not None:
+            constraints.update(root._constraints)
 
-        for entry in self._iter_merges_and_parents():
-            constraints.update(entry._constraints)
+        for parent in self._iter_parent_roots(root):
+            if parent._constraints is not None:
+                constraints.update(parent._constraints)
 
         return tuple(constraints)
 
@@ -83,15 +101,8 @@ class Entry:
         :return: All the sources that "produced" this entry.
         """
 
-        producers = []
-
-        for entry in self._iter_merges():
-            if entry.source is not None:
-                producers.append(entry.source)
-        if self.source is not None:
-            producers.append(self.source)
-
-        return tuple(producers)
+        root = self._find()
+        return tuple(entry.source for entry in root._members or (root,) if entry.source is not None)
 
     @property
     def consumers(self) -> tuple[Source, ...]:
@@ -99,11 +110,12 @@ class Entry:
         :return: All the sources that "consumed" this entry.
         """
 
+        root = self._find()
         consumers = []
 
-        for entry in self._iter_merges_and_parents():
-            consumers.extend(entry._consumers)
-        consumers.extend(self._consumers)
+        for parent in self._iter_parent_roots(root):
+            consumers.extend(parent._consumers)
+        consumers.extend(root._consumers)
 
         return tuple(consumers)
 
@@ -128,17 +140,17 @@ class Entry:
     #     return any(parent.nullable for parent in self.parents)
 
     @classmethod
-    def _generify(cls, type_: Type) ->tuple[Verification, set[Type]]:
+    def _generify(cls, type_: Type) -> tuple[Verification, Type | None]:
         # We can generify all reference types (except uninitialized types) to java/lang/Object. The idea is that the
         # type will be inferred from constraints, later on.
         if isinstance(type_, Reference) and not isinstance(type_, Uninitialized):
-            return object_t, {type_}
+            return object_t, type_
 
         vtype = type_.as_vtype()
         if type_ != vtype:
-            return vtype, {type_}
+            return vtype, type_
 
-        return vtype, set()
+        return vtype, None
 
     def __init__(self, type_: Type, source: Source | None = None, parent: Optional["Entry"] = None) -> None:
         """
@@ -147,15 +159,23 @@ class Entry:
         :param parent: The parent entry.
         """
 
-        self.generic, constraints = self._generify(type_)
-
-        self.merges: set[Entry] = set()
+        self.generic, constraint = self._generify(type_)
 
         self.parent = parent
         self.source = source
-        self._consumers: list[Source] = []
 
-        self._constraints = set(Entry.Constraint(constraint, source, original=True) for constraint in constraints)
+        # Merged entries are stored as a disjoint set (union-find), the root of which holds the members, consumers and
+        # constraints for all the entries it represents. These are set to None on any entries that aren't the root.
+        # Note: the root and members are None for unmerged entries, to avoid creating reference cycles, and the
+        # constraints are None until there are any, as most entries don't have any.
+        self._root: Entry | None = None
+        self._members: list[Entry] | None = None
+        self._consumers: list[Source] | None = []
+        self._constraints: set[Entry.Constraint] | None = None
+        if constraint is not None:
+            self._constraints = {Entry.Constraint(constraint, source, original=True)}
+        # Memoized type inference results for the whole set, only valid on the root and reset when the set changes.
+        self._inferences: dict[tuple[Type, bool, bool], set[Type]] | None = None
 
         # self._hash = hash((self.type, self.origin))
 
@@ -174,25 +194,25 @@ class Entry:
     def __str__(self) -> str:
         return str(self.type)
 
-    def _iter_merges(self) -> Iterator["Entry"]:
+    def _find(self) -> "Entry":
         """
-        Non-recursive iterator for all merges of this entry.
+        Finds the root entry of the set of entries this entry has been merged with, compressing the path to it.
         """
 
-        visited = {self}
-        stack = [iter(self.merges)]
+        root = self._root
+        if root is None:
+            return self
+        elif root._root is None:  # Fast path, most merged entries are direct children of the root.
+            return root
 
-        while stack:
-            merges = stack[-1]
-            for entry in merges:
-                if entry in visited:
-                    continue
-                visited.add(entry)
-                stack.append(iter(entry.merges))
-                yield entry
-                break
-            else:
-                stack.pop()
+        while root._root is not None:
+            root = root._root
+
+        entry = self
+        while entry._root is not root:
+            entry._root, entry = root, entry._root
+
+        return root
 
     def _iter_parents(self) -> Iterator["Entry"]:
         """
@@ -204,36 +224,21 @@ class Entry:
             entry = entry.parent
             yield entry
 
-    def _iter_merges_and_parents(self) -> Iterator["Entry"]:
+    def _iter_parent_roots(self, root: "Entry") -> Iterator["Entry"]:
         """
-        A non-recursive iterator for all merges, parents and parents of merges.
+        An iterator for the roots of all parents (and parents of merges) of this entry, not including its own root.
         """
 
-        visited = {self}
-        stack = [iter(self.merges)]
-
-        # Too lazy to copy-paste code from right above :p. How much slower can it really be?
-        yield from self._iter_parents()
-
-        while stack:
-            merges = stack[-1]
-            for entry in merges:
-                if entry in visited:
-                    continue
-                visited.add(entry)
-                stack.append(iter(entry.merges))
-                yield entry
-
-                while entry.parent is not None:
-                    entry = entry.parent
-                    if entry in visited:
-                        break
-                    # visited.add(entry)
-                    yield entry
+        visited = {root}
 
-                break
-            else:
-                stack.pop()
+        for entry in root._members or (root,):
+            while entry.parent is not None:
+                entry = entry.parent
+                parent = entry._find()
+                if parent in visited:
+                    break
+                visited.add(parent)
+                yield parent
 
     # ------------------------------ Public API ------------------------------ #
 
@@ -246,19 +251,24 @@ class Entry:
         :return: A set of types this entry could be.
         """
 
+        root = self._find()
+        key = (self.generic, as_vtypes, no_nullable)
+
+        if root._inferences is None:
+            root._inferences = {}
+        else:
+            types = root._inferences.get(key)
+            if types is not None:
+                return types.copy()
+
         types = {self.generic}
 
         # Apparently generators are slower, or is it set.update that's slower? Either way, using a for loop is faster,
         # which is why I'm using it here.
         # types.update(constraint.type for constraint in self._constraints if constraint.original)
-        for constraint in self._constraints:
+        for constraint in root._constraints or ():
             if constraint.original:
                 types.add(constraint.type)
-        for entry in self._iter_merges():
-            # types.update(constraint.type for constraint in entry._constraints if constraint.original)
-            for constraint in entry._constraints:
-                if constraint.original:
-                    types.add(constraint.type)
 
         if as_vtypes:
             types = {type_.as_vtype() for type_ in types}
@@ -279,10 +289,61 @@ class Entry:
         if all_refs and no_nullable and len(types) > 1:
             types.discard(null_t)
 
-        return types
+        root._inferences[key] = types
+        return types.copy()
 
     # ------------------------------ Trace methods ------------------------------ #
 
+    def merge(self, other: "Entry") -> bool:
+        """
+        Merges this entry with another, meaning that they are (in a way) the same entry.
+
+        :param other: The entry to merge with.
+        :return: Were the entries not already merged?
+        """
+
+        root_a = self._find()
+        root_b = other._find()
+        if root_a is root_b:
+            return False
+
+        # Union by size, so that the fewest members need to be moved.
+        members_a = root_a._members or [root_a]
+        members_b = root_b._members or (root_b,)
+        if len(members_a) < len(members_b):
+            root_a, root_b = root_b, root_a
+            members_a, members_b = members_b, members_a
+
+        root_b._root = root_a
+        members_a.extend(members_b)
+        root_a._members = members_a
+        root_a._consumers.extend(root_b._consumers)
+        if root_b._constraints is not None:
+            if root_a._constraints is None:
+                root_a._constraints = root_b._constraints
+            else:
+                root_a._constraints.update(root_b._constraints)
+        root_a._inferences = None
+
+        root_b._members = None
+        root_b._consumers = None
+        root_b._constraints = None
+        root_b._inferences = None
+
+        return True
+
+    def consume(self, source: Source) -> None:
+        """
+        Marks this entry as consumed by the given source.
+        """
+
+        root = self._root
+        if root is None:
+            root = self
+        elif root._root is not None:
+            root = self._find()
+        root._consumers.append(source)
+
     def constrain(self, type_: Type, source: Source | None = None, *, original: bool = False) -> bool:
         """
         Adds a type constraint to this entry.
@@ -295,9 +356,20 @@ class Entry:
         if type_ == self.generic:
             return False
         constraint = Entry.Constraint(type_, source, original=original)
-        if constraint in self._constraints:
+        root = self._root
+        if root is None:
+            root = self
+        elif root._root is not None:
+            root = self._find()
+        constraints = root._constraints
+        if constraints is None:
+            root._constraints = {constraint}
+        elif constraint in constraints:
             return False
-        self._constraints.add(constraint)
+        else:
+            constraints.add(constraint)
+        if original:
+            root._inferences = None
         return True
 
     def cast(self, type_: Type, source: Source | None = None) -> "Entry":
@@ -321,7 +393,10 @@ class Entry:
             # A note with checkcast instructions: we can't actually confirm that the class we're trying to cast to is a
             # valid subtype nor can we verify if the class exists, so we'll add it as a constraint (which are meant to
             # be taken with a grain of salt).
-            self._constraints.add(Entry.Constraint(type_, source))
+            root = self._find()
+            if root._constraints is None:
+                root._constraints = set()
+            root._constraints.add(Entry.Constraint(type_, source))
 
         return entry
 
@@ -428,15 +503,103 @@ class Delta:
             return "id=%i" % self.id
 
 
+class _DeepCopy:
+    """
+    Lazily creates the entries for a deep copy of a frame, as they are accessed. The entries are only ever created once
+    per original entry, so frames that share the same deep copy (i.e. shallow copies of it) will see the same entries.
+    """
+
+    __slots__ = ("stack", "locals", "parent", "depth", "copies", "_originals")
+
+    # The longest chain of deep copies that is allowed to build up. Every deep copy in a chain is kept alive by the frames
+    # at the end of it, so the entries are created once a chain gets this long.
+    MAX_DEPTH = 16
+
+    def __init__(self, stack: list[Entry], locals_: dict[int, Entry], parent: Optional["_DeepCopy"]) -> None:
+        """
+        :param stack: The stack of the frame that was copied.
+        :param locals_: The locals of the frame that was copied.
+        :param parent: The deep copy that the copied frame was itself created from, if its entries weren't all created.
+        """
+
+        self.stack = stack
+        self.locals = locals_
+        self.parent = parent
+        self.depth = 0 if parent is None else parent.depth + 1
+
+        self.copies: dict[Entry, Entry] = {}
+        self._originals: set[Entry] | None = None
+
+    def _is_original(self, entry: Entry) -> bool:
+        if self._originals is None:
+            self._originals = {*self.stack, *self.locals.values()}
+            self._originals.discard(Frame.TOP)  # This must always remain the exact same.
+        return entry in self._originals
+
+    def translate(self, entry: Entry) -> Entry:
+        """
+        :param entry: An entry that is in the copied frame (or any other entry).
+        :return: The copy of the entry, if it is an original entry, otherwise the entry itself.
+        """
+
+        copy = self.copies.get(entry)
+        if copy is not None:
+            return copy
+        elif not self._is_original(entry):
+            return entry
+
+        # Long chains of deep copies can build up if some locals aren't accessed for a while, so this isn't recursive.
+        chain = [self]
+        copy = entry
+        parent = self.parent
+        while parent is not None:
+            copy = parent.copies.get(entry)
+            if copy is not None:
+                break
+            copy = entry
+            if not parent._is_original(entry):
+                break
+            chain.append(parent)
+            parent = parent.parent
+
+        for deep_copy in reversed(chain):
+            deep_copy.copies[entry] = new = Entry(copy.generic, None)
+            new.merge(copy)
+            copy = new
+
+        return copy
+
+    def translate_all(self) -> Iterable[Entry]:
+        """
+        Creates the copies of all the original entries.
+
+        :return: All the copied entries.
+        """
+
+        if self._originals is None:
+            self._is_original(Frame.TOP)
+        for entry in self._originals:
+            self.translate(entry)
+        return self.copies.values()
+
+
 class Frame:
     """
     A stack frame.
+
+    Frames are copy-on-write, copying them is cheap as the stack, locals and tracked entries are shared until they are
+    modified. Deep copies also only create their new entries once they're accessed.
     """
 
-    __slots__ = ("stack", "locals", "tracked", "max_stack", "max_locals")
+    __slots__ = ("max_stack", "max_locals", "_stack", "_locals", "_tracked", "_shared", "_pending", "_copy")
 
     TOP = Entry(top_t)
 
+    # Flags for the containers that are shared with other frames / that may still contain entries to copy.
+    _STACK   = 1
+    _LOCALS  = 2
+    _TRACKED = 4
+
     @classmethod
     def initial(cls, method: Method) -> "Frame":
         """
@@ -470,10 +633,60 @@ class Frame:
 
         return frame
 
+    @property
+    def stack(self) -> list[Entry]:
+        """
+        :return: The entries on the stack, the top of the stack being the last entry.
+        """
+
+        if self._pending & Frame._STACK:
+            self._stack = [self._copy.translate(entry) for entry in self._stack]
+            self._pending &= ~Frame._STACK
+            self._shared &= ~Frame._STACK
+        elif self._shared & Frame._STACK:
+            self._stack = self._stack.copy()
+            self._shared &= ~Frame._STACK
+        return self._stack
+
+    @property
+    def locals(self) -> dict[int, Entry]:
+        """
+        :return: The entries in the locals, mapped by their index.
+        """
+
+        if self._pending & Frame._LOCALS:
+            translate = self._copy.translate
+            self._locals = {index: translate(entry) for index, entry in self._locals.items()}
+            self._pending &= ~Frame._LOCALS
+            self._shared &= ~Frame._LOCALS
+        elif self._shared & Frame._LOCALS:
+            self._locals = self._locals.copy()
+            self._shared &= ~Frame._LOCALS
+        return self._locals
+
+    @property
+    def tracked(self) -> set[Entry]:
+        """
+        :return: All the entries that this frame has seen since it was last deep copied.
+        """
+
+        if self._pending & Frame._TRACKED:
+            self._tracked = self._tracked.union(self._copy.translate_all())
+            self._pending &= ~Frame._TRACKED
+            self._shared &= ~Frame._TRACKED
+        elif self._shared & Frame._TRACKED:
+            self._tracked = self._tracked.copy()
+            self._shared &= ~Frame._TRACKED
+        return self._tracked
+
     def __init__(self) -> None:
-        self.stack: list[Entry] = []
-        self.locals: dict[int, Entry] = {}
-        self.tracked: set[Entry] = set()
+        self._stack: list[Entry] = []
+        self._locals: dict[int, Entry] = {}
+        self._tracked: set[Entry] = set()
+
+        self._shared = 0
+        self._pending = 0
+        self._copy: _DeepCopy | None = None
 
         self.max_stack = 0
         self.max_locals = 0
@@ -506,6 +719,48 @@ class Frame:
         else:
             raise TypeError("Unsupported operand type(s) for -: %r and %r." % (Frame, type(other)))
 
+    # ------------------------------ Internal ------------------------------ #
+
+    def _own_stack(self) -> list[Entry]:
+        """
+        :return: The stack, copied if it is shared. May still contain entries that need to be translated.
+        """
+
+        if self._shared & Frame._STACK:
+            self._stack = self._stack.copy()
+            self._shared &= ~Frame._STACK
+        return self._stack
+
+    def _own_locals(self) -> dict[int, Entry]:
+        """
+        :return: The locals, copied if they are shared. May still contain entries that need to be translated.
+        """
+
+        if self._shared & Frame._LOCALS:
+            self._locals = self._locals.copy()
+            self._shared &= ~Frame._LOCALS
+        return self._locals
+
+    def _own_tracked(self) -> set[Entry]:
+        """
+        :return: The tracked entries, copied if they are shared. May not contain the entries that are yet to be copied.
+        """
+
+        if self._shared & Frame._TRACKED:
+            self._tracked = self._tracked.copy()
+            self._shared &= ~Frame._TRACKED
+        return self._tracked
+
+    def _translate_stack(self, entry: Entry) -> Entry:
+        if self._pending & Frame._STACK:
+            return self._copy.translate(entry)
+        return entry
+
+    def _translate_local(self, entry: Entry) -> Entry:
+        if self._pending & Frame._LOCALS:
+            return self._copy.translate(entry)
+        return entry
+
     # ------------------------------ Misc operations ------------------------------ #
 
     def copy(self, *, deep: bool = True) -> "Frame":
@@ -513,30 +768,35 @@ class Frame:
         Copies this frame.
         """
 
-        frame = Frame()
+        frame = Frame.__new__(Frame)
 
-        if deep:
-            copied: dict[Entry, Entry] = {}
-            for old_entry in self.tracked:
-                copied[old_entry] = new_entry = Entry(old_entry.generic, None)
-                new_entry.merges.add(old_entry)
-                old_entry.merges.add(new_entry)
+        if deep and self._pending & (Frame._STACK | Frame._LOCALS) and self._copy.depth >= _DeepCopy.MAX_DEPTH:
+            self.stack  # Creates the entries, so the new deep copy won't need the chain.
+            self.locals
 
-            # Just in case this is in the tracked entries, we'll make sure that it remains the exact same.
-            copied[self.TOP] = self.TOP
+        frame._stack = self._stack
+        frame._locals = self._locals
+        self._shared |= Frame._STACK | Frame._LOCALS
 
-            frame.stack.extend(copied[entry] for entry in self.stack)
-            frame.locals.update({index: copied[entry] for index, entry in self.locals.items()})
+        if deep:
+            # The new entries are created lazily, and only for the entries that are still on the stack or in the locals,
+            # this acts to stop build up of unused entries.
+            frame._tracked = set()
+            frame._shared = Frame._STACK | Frame._LOCALS
+            frame._pending = Frame._STACK | Frame._LOCALS | Frame._TRACKED
+            frame._copy = _DeepCopy(
+                self._stack, self._locals, self._copy if self._pending & (Frame._STACK | Frame._LOCALS) else None,
+            )
 
-            # We'll only update the tracked entries of the new frame with ones that we know are still on the stack or in
-            # the locals, this acts to stop build up of unused entries.
-            frame.tracked.update(frame.stack)
-            frame.tracked.update(frame.locals.values())
+            frame.max_stack = 0
+            frame.max_locals = 0
 
         else:
-            frame.stack.extend(self.stack)
-            frame.locals.update(self.locals)
-            frame.tracked.update(self.tracked)
+            frame._tracked = self._tracked
+            self._shared |= Frame._TRACKED
+            frame._shared = Frame._STACK | Frame._LOCALS | Frame._TRACKED
+            frame._pending = self._pending
+            frame._copy = self._copy
 
             frame.max_stack = self.max_stack
             frame.max_locals = self.max_locals
@@ -563,49 +823,53 @@ class Frame:
         """
 
         if live_locals is None:
-            live_locals = self.locals.keys()
+            live_locals = self._locals.keys()
 
         valid = True
+        stack_a = self.stack
+        stack_b = other.stack
+        # Locals are accessed individually so that we don't create copies of entries in locals that we aren't checking.
+        locals_a = self._locals
+        locals_b = other._locals
 
         # Basic preconditions checks to see if the frame merge is immediately invalid.
-        if check_depth and len(self.stack) != len(other.stack):
-            raise MergeDepthError(edge, len(other.stack), len(self.stack))
+        if check_depth and len(stack_a) != len(stack_b):
+            raise MergeDepthError(edge, len(stack_b), len(stack_a))
 
-        for entry_a, entry_b in zip(self.stack, other.stack):
+        for entry_a, entry_b in zip(stack_a, stack_b):
             if not entry_a.generic.mergeable(entry_b.generic):
                 valid = False
                 break
 
         for index in live_locals:
-            entry_a, entry_b = self.locals[index], other.locals.get(index)
+            entry_a, entry_b = locals_a[index], locals_b.get(index)
             if entry_b is None:
-                raise MergeMissingLocalError(edge, index, entry_a.type)
+                raise MergeMissingLocalError(edge, index, self._translate_local(entry_a).type)
             elif not entry_a.generic.mergeable(entry_b.generic):
                 valid = False
 
         if not valid:
             return False
 
-        for entry_a, entry_b in zip(self.stack, other.stack):
-            # They are in a way, the same entry, which is why we're doing this.
-            entry_a.merges.add(entry_b)
-            entry_b.merges.add(entry_a)
+        top = self.TOP
+        for entry_a, entry_b in zip(stack_a, stack_b):
+            # They are in a way, the same entry, which is why we're doing this. Tops are shared between all frames
+            # though, so merging them would make every entry merged with one the same entry.
+            if entry_a is not top and entry_b is not top:
+                entry_a.merge(entry_b)
 
         # It's useful to try this because it can actually provide extra insight into entries that would otherwise be
         # deemed "incorrect". When assembling, we don't really care about non-live locals as those will be written as 
         # tops anyway, but for more in-depth analysis this may be useful.
         if merge_non_live:
-            for index in self.locals.keys() - live_locals:
-                entry_a, entry_b = self.locals[index], other.locals.get(index)
+            for index in locals_a.keys() - live_locals:
+                entry_a, entry_b = locals_a[index], locals_b.get(index)
                 if entry_b is None or not entry_a.generic.mergeable(entry_b.generic):
                     continue
-                entry_a.merges.add(entry_b)
-                entry_b.merges.add(entry_a)
+                self._translate_local(entry_a).merge(other._translate_local(entry_b))
         else:
             for index in live_locals:
-                entry_a, entry_b = self.locals[index], other.locals[index]
-                entry_a.merges.add(entry_b)
-                entry_b.merges.add(entry_a)
+                self._translate_local(locals_a[index]).merge(other._translate_local(locals_b[index]))
 
         return True
 
@@ -614,14 +878,18 @@ class Frame:
         Adds a frame delta to this frame, in place.
         """
 
-        if len(delta.pops) > len(self.stack):
+        stack = self.stack
+        locals_ = self.locals
+
+        base = len(stack) - len(delta.pops)
+        if base < 0:
             raise ValueError("Delta %r cannot be applied to frame %r." % (delta, self))
 
         identities = {}
 
         for index, entry in enumerate(delta.pops):
-            actual = self.stack[-index]
-            if actual == entry:
+            actual = stack[base + index]
+            if actual is entry:
                 continue
             elif type(entry) is Delta.Identity and (entry.expect is None or entry.expect == actual.type):
                 identities[entry.id] = actual
@@ -629,44 +897,56 @@ class Frame:
             raise ValueError("Delta %r cannot be applied to frame %r." % (delta, self))
 
         for index, old, new in delta.overwrites:
-            actual = self.locals.get(index)
-            if actual == old:
+            actual = locals_.get(index)
+            if actual is old:
                 continue
             elif type(old) is Delta.Identity and actual is not None and (old.expect is None or old.expect == actual.type):
                 identities[old.id] = actual
                 continue
             raise ValueError("Delta %r cannot be applied to frame %r." % (delta, self))
 
-        for entry in delta.pops:
-            self.stack.pop()
+        tracked = self.tracked
 
-        for index, entry in enumerate(delta.pushes):
+        del stack[base:]
+        for entry in delta.pushes:
             if type(entry) is Delta.Identity:
-                self.stack.append(identities[entry.id])
-            else:
-                self.stack.append(entry)
+                entry = identities[entry.id]
+            stack.append(entry)
+            tracked.add(entry)
 
         for index, old, new in delta.overwrites:
             if new is None:
-                self.locals.pop(index)
+                locals_.pop(index, None)
+                continue
             elif type(new) is Delta.Identity:
-                self.locals[index] = identities[new.id]
-            else:
-                self.locals[index] = new
+                new = identities[new.id]
+            locals_[index] = new
+            tracked.add(new)
+
+        if len(stack) > self.max_stack:
+            self.max_stack = len(stack)
+        if locals_:
+            max_locals = max(locals_) + 1
+            if max_locals > self.max_locals:
+                self.max_locals = max_locals
 
     def sub(self, delta: Delta) -> None:
         """
         Subtracts a frame delta from this frame, in place.
         """
 
-        if len(delta.pushes) > len(self.stack):
+        stack = self.stack
+        locals_ = self.locals
+
+        base = len(stack) - len(delta.pushes)
+        if base < 0:
             raise ValueError("Delta %r cannot be applied to frame %r." % (delta, self))
 
         identities = {}
 
         for index, entry in enumerate(delta.pushes):
-            actual = self.stack[-index]
-            if actual == entry:
+            actual = stack[base + index]
+            if actual is entry:
                 continue
             elif type(entry) is Delta.Identity and (entry.expect is None or entry.expect == actual.type):
                 identities[entry.id] = actual
@@ -674,31 +954,27 @@ class Frame:
             raise ValueError("Delta %r cannot be applied to frame %r." % (delta, self))
 
         for index, old, new in delta.overwrites:
-            actual = self.locals.get(index)
-            if actual == new:
+            actual = locals_.get(index)
+            if actual is new:
                 continue
             elif type(new) is Delta.Identity and actual is not None and (new.expect is None or new.expect == actual.type):
                 identities[new.id] = actual
                 continue
             raise ValueError("Delta %r cannot be applied to frame %r." % (delta, self))
 
-        for entry in delta.pushes:
-            self.stack.pop()
-
+        del stack[base:]
         for entry in delta.pops:
             if type(entry) is Delta.Identity:
-                self.stack.append(identities[entry.id])
-            else:
-                self.stack.append(entry)
+                entry = identities[entry.id]
+            stack.append(entry)
 
         for index, old, new in delta.overwrites:
             if old is None:
-                self.locals.pop(index)
+                locals_.pop(index, None)
                 continue
             elif type(old) is Delta.Identity:
                 old = identities[old.id]
-            else:
-                self.locals[index] = old
+            locals_[index] = old
 
     def delta(self, other: "Frame") -> Delta:
         """
@@ -711,23 +987,34 @@ class Frame:
         pops = []
         overwrites = []
 
-        index = 0
-        for index, (entry_a, entry_b) in enumerate(zip(self.stack, other.stack)):
-            # Direct comparison because == checks for parents too, which may not be what we want in all cases
-            if entry_a is not entry_b and entry_a != self.TOP and entry_b != self.TOP:
-                break
+        # Frames that were copied from one another may still share their stack and/or locals, in which case there can't
+        # be any differences, so we can skip comparing them.
+        pending = (self._pending ^ other._pending) | (Frame._STACK | Frame._LOCALS if self._copy is not other._copy else 0)
+
+        if self._stack is not other._stack or pending & Frame._STACK:
+            stack_a = self.stack
+            stack_b = other.stack
+
+            # Direct comparison as entries are only ever the same if they're the exact same object.
+            index = 0
+            for entry_a, entry_b in zip(stack_a, stack_b):
+                if entry_a is not entry_b:
+                    break
+                index += 1
+
+            pops.extend(stack_a[index:])
+            pushes.extend(stack_b[index:])
 
-        for entry in self.stack[index:]:
-            pops.append(entry)
-        for entry in other.stack[index:]:
-            pushes.append(entry)
+        if self._locals is not other._locals or pending & Frame._LOCALS:
+            locals_a = self.locals
+            locals_b = other.locals
 
-        for index, entry in other.locals.items():
-            if not index in self.locals or entry != self.locals[index]:
-                overwrites.append((index, self.locals.get(index), entry))
-        for index, entry in self.locals.items():
-            if not index in other.locals:
-                overwrites.append((index, entry, None))
+            for index, entry in locals_b.items():
+                if locals_a.get(index) is not entry:
+                    overwrites.append((index, locals_a.get(index), entry))
+            for index, entry in locals_a.items():
+                if not index in locals_b:
+                    overwrites.append((index, entry, None))
 
         return Delta(pushes, pops, overwrites)
 
@@ -740,10 +1027,11 @@ class Frame:
         :param entry: The entry to push.
         """
 
-        self.stack.append(entry)
-        self.tracked.add(entry)
-        if len(self.stack) > self.max_stack:
-            self.max_stack = len(self.stack)
+        stack = self._own_stack()
+        stack.append(entry)
+        self._own_tracked().add(entry)
+        if len(stack) > self.max_stack:
+            self.max_stack = len(stack)
 
     def pop(self, count: int = 1) -> list[Entry]:
         """
@@ -752,16 +1040,23 @@ class Frame:
         :param count: The number of entries to pop.
         """
 
+        stack = self._own_stack()
         popped = []
 
-        if count < len(self.stack):  # Optimisations?
+        if count < len(stack):  # Optimisations?
             for index in range(count):
-                popped.append(self.stack.pop())
-            return popped
+                popped.append(stack.pop())
+        else:
+            popped.extend(reversed(stack))
+            popped.extend(self.TOP for index in range(count - len(popped)))
+            stack.clear()
+
+        if self._pending & Frame._STACK:
+            translate = self._copy.translate
+            popped = [translate(entry) for entry in popped]
+            if not stack:  # Nothing left to copy.
+                self._pending &= ~Frame._STACK
 
-        popped.extend(reversed(self.stack))
-        popped.extend(self.TOP for index in range(count - len(popped)))
-        self.stack.clear()
         return popped
 
     def dup(self, count: int = 1, displace: int = 0) -> None:
@@ -775,11 +1070,15 @@ class Frame:
         entries = self.stack[-count:]
         entries.extend(self.TOP for index in range(count - len(entries)))
 
+        stack = self.stack
         if not displace:
-            self.stack.extend(entries)
-            return
-        for index, entry in enumerate(reversed(entries)):
-            self.stack.insert(-count - displace - index, entry)
+            stack.extend(entries)
+        else:
+            for index, entry in enumerate(reversed(entries)):
+                stack.insert(-count - displace - index, entry)
+
+        if len(stack) > self.max_stack:
+            self.max_stack = len(stack)
 
     def swap(self) -> None:
         """
@@ -790,6 +1089,8 @@ class Frame:
             return
         elif len(self.stack) == 1:
             self.stack.append(self.TOP)
+            if self.max_stack < 2:
+                self.max_stack = 2
         self.stack[-1], self.stack[-2] = self.stack[-2], self.stack[-1]
 
     # ------------------------------ Locals operations ------------------------------ #
@@ -806,8 +1107,8 @@ class Frame:
         # if old is not None:
         #     self.untracked.add(old)
 
-        self.locals[index] = entry
-        self.tracked.add(entry)
+        self._own_locals()[index] = entry
+        self._own_tracked().add(entry)
         index += 1
         if index > self.max_locals:
             self.max_locals = index
@@ -817,7 +1118,10 @@ class Frame:
         :param index: The index of the local to get.
         """
 
-        return self.locals.get(index, self.TOP)
+        entry = self._locals.get(index, self.TOP)
+        if self._pending & Frame._LOCALS:
+            return self._copy.translate(entry)
+        return entry
 
     # ------------------------------ Classes ------------------------------ #
 
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
 __all__ = (
-    "block", "edge",
+    "block", "edge", "peephole",
     "InsnBlock", "InsnReturnBlock", "InsnRethrowBlock",
     "InsnEdge", "FallthroughEdge", "JumpEdge",
     "JsrJumpEdge", "JsrFallthroughEdge", "RetEdge",
@@ -15,18 +15,21 @@ A control flow graph containing JVM instructions.
 
 import logging
 import typing
+from typing import Iterable
 
-from . import block, edge
+from . import block, edge, peephole
 from ._asm import assemble
 from ._dis import disassemble
 from .block import *
 from .edge import *
+from .peephole import PeepholeRule
 from ... import _argument, instructions, types
 from ...abc import Graph
 from ...instructions import Instruction, JsrInstruction
 from ...source import *
 
 if typing.TYPE_CHECKING:
+    from ..budget import Budget
     from ...classfile import MethodInfo
     from ...classfile.attributes import Code
 
@@ -63,6 +66,8 @@ class InsnGraph(Graph):
             keep_lvt: bool = True,
             keep_lvtt: bool = True,
             gen_source_map: bool = True,
+            keep_frames: bool = True,
+            budget: "Budget | None" = None,
     ) -> "InsnGraph":
         """
         Disassembles a method into a control flow graph.
@@ -73,11 +78,13 @@ class InsnGraph(Graph):
         :param keep_lvt: Should we keep the local variable table?
         :param keep_lvtt: Should we keep the local variable type table?
         :param gen_source_map: Should we generate a mapping of bytecode offset to block index?
+        :param keep_frames: Should we keep the frames from the stackmap table, so they can be reused when assembling?
+        :param budget: Limits on the time that can be spent, a BudgetExceededError is raised if they're hit.
         :return: The control flow graph.
         """
 
         self = cls(method)
-        disassemble(self, method, do_raise, keep_lnt, keep_lvt, keep_lvtt, gen_source_map)
+        disassemble(self, method, do_raise, keep_lnt, keep_lvt, keep_lvtt, gen_source_map, keep_frames, budget)
         return self
 
     def __init__(self, method: "MethodInfo") -> None:
@@ -157,28 +164,46 @@ class InsnGraph(Graph):
             compute_maxes: bool = True,
             compute_frames: bool = True,
             compress_frames: bool = True,
+            reuse_frames: bool = True,
             add_lnt: bool = True,
             add_lvt: bool = True,
             add_lvtt: bool = True,
             remove_dead_blocks: bool = True,
+            optimise_layout: bool = False,
+            lower_switches: bool = False,
+            budget: "Budget | None" = None,
     ) -> "Code":
         """
         Assembles this graph into the method's code attribute.
 
-        :param do_raise: Raise an exception if any errors occurred during assembling.
+        :param do_raise: Raise an exception if any errors occurred during assembling. Finding type conflicts requires
+                         a full trace, so without it, the maxes are computed with a lighter analysis if the frames
+                         aren't being computed.
         :param in_place: Modifies this graph in-place while assembling. Can improve performance.
         :param adjust_wides: Adds/removes wide instructions if necessary.
         :param adjust_ldcs: Substitutes ldc instructions for ldc_w instructions if necessary.
         :param adjust_jumps: Adjusts certain impossible jumps by generating new blocks if necessary.
         :param adjust_fallthroughs: Generates gotos if certain fallthroughs are impossible.
-        :param simplify_exception_ranges: Merges exception edges with the same priority in the exception table.
+        :param simplify_exception_ranges: Merges the ranges of exception edges with the same throwable and handler in the
+                                          exception table, where doing so preserves the priorities of the handlers.
         :param compute_maxes: Computes the maximum stack size and maximum local.
         :param compute_frames: Computes stack map frames and adds the attribute to the code.
         :param compress_frames: Compresses the stack map frames. Only for compute_frames.
+        :param reuse_frames: Reuses the original stack map frames of blocks that haven't changed since they were
+                             disassembled, rather than inferring them again. Only for compute_frames. If the method
+                             is unchanged, all the frames are reused and the types aren't traced at all, so type
+                             conflicts aren't raised, even with do_raise.
         :param add_lnt: Adds the line number table debug attribute.
         :param add_lvt: Adds the local variable table debug attribute.
         :param add_lvtt: Adds the local variable type table debug attribute.
         :param remove_dead_blocks: Removes blocks that will never be reached in execution.
+        :param optimise_layout: Reorders blocks so that fewer jumps need to be written, with exception handlers and blocks
+                                that always throw written last. Off by default, so blocks are written in label order
+                                and no jumps are rewritten.
+        :param lower_switches: Re-chooses between tableswitch and lookupswitch for each switch, using the same cost
+                               model as javac, and drops cases that go to the same block as the default. Off by
+                               default, so switches are written as they were disassembled.
+        :param budget: Limits on the amount of work that can be done, a BudgetExceededError is raised if they're hit.
         :return: The assembled Code attribute.
         """
 
@@ -188,11 +213,34 @@ class InsnGraph(Graph):
             adjust_wides, adjust_ldcs,
             adjust_jumps, adjust_fallthroughs,
             simplify_exception_ranges,
-            compute_maxes, compute_frames, compress_frames,
+            compute_maxes, compute_frames, compress_frames, reuse_frames,
             add_lnt, add_lvt, add_lvtt,
-            remove_dead_blocks,
+            remove_dead_blocks, optimise_layout, lower_switches,
+            budget,
         )
 
+    def optimise(
+            self,
+            rules: "Iterable[PeepholeRule] | None" = None,
+            *,
+            max_passes: int = 10,
+            compact: bool = True,
+            budget: "Budget | None" = None,
+    ) -> int:
+        """
+        Applies peephole optimisations to this graph, in place, until no more can be made.
+
+        :param rules: The peephole rules to apply, in order. Defaults to peephole.DEFAULT_RULES.
+        :param max_passes: The maximum number of passes over the graph, bounding the amount of work done.
+        :param compact: Compact the local variable slots afterwards, so that locals that are never live at the same
+                        time share slots, lowering the max locals.
+        :param budget: Limits on the amount of work that can be done, a BudgetExceededError is raised if they're hit.
+        :return: The total number of rewrites made. Local slots saved by compacting aren't counted, see
+                 peephole.compact_locals() to get those.
+        """
+
+        return peephole.optimise(self, rules, max_passes=max_passes, compact=compact, budget=budget)
+
     def strip(self, line_numbers: bool = True, local_variables: bool = True) -> None:
         """
         Strips debug information from this graph.
@@ -232,6 +280,17 @@ class InsnGraph(Graph):
                 edge_instruction = True
         return tuple(instructions_)
 
+    def _fingerprint(self, block: InsnBlock) -> int:
+        """
+        Computes a fingerprint of a block's instructions and in edges, so that we can tell if the block, or the way it's
+        reached, has been modified.
+        """
+
+        return hash((
+            tuple(map(str, block.instructions)),
+            tuple(sorted(map(str, self._backward_edges.get(block, ())))),
+        ))
+
     # ------------------------------ Edges ------------------------------ #
 
     def fallthrough(self, from_: InsnBlock, to: InsnBlock, overwrite: bool = False) -> FallthroughEdge:
@@ -8,16 +8,22 @@ __all__ = (
 The assembler.
 """
 
+import bisect
 import itertools
 import logging
 import operator
 import typing
 from collections import defaultdict
+from typing import Iterable
 
+from ._layout import INVERTED_JUMPS, apply_layout, layout_blocks
+from ._maxes import trace_maxes
+from ._ranges import merge_exception_ranges
+from ._switches import select_switches
 from .block import *
 from .debug import *
 from .edge import *
-from .. import Entry, Generifier, Trace
+from .. import Budget, Entry, Generifier, Trace
 from ... import instructions
 from ...abc import Class, Offset, Source
 from ...classfile import ConstantPool
@@ -32,7 +38,7 @@ from ...instructions import (
 )
 from ...source import InstructionInBlock
 from ...types import (
-    object_t, reserved_t, top_t, uninitialized_this_t,
+    object_t, reserved_t, throwable_t, top_t, uninitialized_this_t,
     Array, Class as ClassType, Primitive, Reference, Type, Uninitialized,
 )
 
@@ -49,12 +55,17 @@ def assemble(
         adjust_wides: bool, adjust_ldcs: bool,
         adjust_jumps: bool, adjust_fallthroughs: bool,
         simplify_exception_ranges: bool,
-        compute_maxes: bool, compute_frames: bool, compress_frames: bool,
+        compute_maxes: bool, compute_frames: bool, compress_frames: bool, reuse_frames: bool,
         add_lnt: bool, add_lvt: bool, add_lvtt: bool,
-        remove_dead_blocks: bool,
+        remove_dead_blocks: bool, optimise_layout: bool, lower_switches: bool,
+        budget: Budget | None,
 ) -> Code:
     logger.debug("Assembling method %r:" % str(method))
 
+    if budget is not None:
+        budget = budget.start()  # So that the trace doesn't get its own timeout, and shares the deadline with us.
+        budget.check()
+
     if not in_place:
         graph = graph.copy(deep=True)
 
@@ -71,18 +82,63 @@ def assemble(
         compute_frames = False
 
     trace: Trace | None = None
+    reached: Iterable[InsnBlock] | None = None  # The blocks that we know are reachable, if computed.
+
+    # The original stackmap frames that are still valid. If all of them are, we don't need to infer any frames at all,
+    # so the full trace can be skipped. Type conflicts aren't checked for then, which is fine as the code is unchanged,
+    # and the JVM verifies it against the same frames regardless.
+    reused_frames: dict[InsnBlock, tuple[tuple[Type, ...], tuple[Type, ...]]] = {}
+    reused_all = False
+
+    if compute_frames and reuse_frames and method is graph.method:
+        reused_frames, reused_all = _find_reusable_frames(graph)
+        if reused_frames:
+            logger.debug(" - reusing %i original stackmap frame(s)%s." % (
+                len(reused_frames), " (all)" if reused_all else "",
+            ))
+
+    if remove_dead_blocks:
+        # Removing dead blocks before tracing means that they don't have to be traced at all, which also removes their
+        # exception edges, so handlers that only they use are removed too.
+        removed = _remove_unreachable_blocks(graph)
+        if removed:
+            logger.debug(" - removed %i unreachable block(s)." % removed)
 
-    if compute_maxes or compute_frames:
+    if lower_switches:
+        tables, lookups = select_switches(graph)
+        if tables or lookups:
+            logger.debug(" - lowered %i switch(es) to tableswitches and %i to lookupswitches." % (tables, lookups))
+
+    # Type conflicts are only found by a full trace, so the lighter analysis for the maxes can't be used if they need to
+    # be raised. The exception is when all the original frames are being reused, see above.
+    full_trace = not reused_all if compute_frames else compute_maxes and do_raise
+
+    if full_trace:
         # As pointed out in comments in the trace code, we don't need to merge non-live locals for this as we're going
         # to replace those with `top`s so we can skip quite a bit of computation there.
-        trace = Trace.from_graph(graph, do_raise=do_raise, merge_non_live=False, make_params_live=True)
+        trace = Trace.from_graph(
+            graph, do_raise=do_raise, merge_non_live=False, make_params_live=True, budget=budget,
+        )
         if do_raise and trace.conflicts:
             raise TypeConflictError(trace.conflicts)
         code.max_stack = trace.max_stack
         code.max_locals = trace.max_locals
+        reached = trace.entries.keys()
 
         has_max_locals = True
 
+    elif compute_maxes or compute_frames:
+        # We don't need any type information if we're only computing the maxes, so a much lighter analysis will do.
+        code.max_stack, code.max_locals, reached = trace_maxes(graph, do_raise, budget)
+        has_max_locals = True
+
+    for stack, locals_ in reused_frames.values():
+        code.max_stack = max(code.max_stack, len(stack))
+        code.max_locals = max(code.max_locals, len(locals_))
+
+    if budget is not None:
+        budget.check()
+
     # ------------------------------------------------------------ #
     #          Compute block order and remove dead blocks          #
     # ------------------------------------------------------------ #
@@ -96,13 +152,10 @@ def assemble(
 
     for label, block in sorted(blocks.items(), key=operator.itemgetter(0)):
         is_entry_block = block is graph.entry_block
-        if remove_dead_blocks and not is_entry_block:
-            # If we have computed a trace then we will already know if the block is dead or not. Otherwise, we'll need
-            # to guess via how many in edges the block has.
-            # TODO: For dead blocks, a proper dominance-based approach, if there are no subroutines present? Though I'm 
-            #       guessing error verification will be on most of the time anyway.
-            is_dead_block = not backward_edges[block] if trace is None else not block in trace.entries
-            if is_dead_block:
+        if remove_dead_blocks and not is_entry_block and reached is not None:
+            # Unreachable blocks have already been removed, but the trace (or the maxes) can also find blocks that are
+            # only reachable via edges that are never taken, i.e. jsr fallthroughs where the subroutine doesn't return.
+            if not block in reached:
                 skipped.add(block)
                 continue
         # Check if we need to order the block. There are special conditions that need to be addressed, namely the entry
@@ -125,25 +178,16 @@ def assemble(
         if order_block:
             order.append(block)
 
-    # FIXME
-    # if trace is None:
-    #     # We also need to remove any blocks dominated by skipped blocks if we haven't computed a trace.
-    #     dominance = graph.dominance()
-    #     for block in skipped:
-    #         for dominated in dominance[block]:
-    #             dominated = blocks.pop(dominated.label, None)
-    #             if dominated is None:  # Wasn't added? Could be the same block?
-    #                 continue
-    #             skipped.add(dominated)
-    #             order.remove(dominated)
-    #             for edge in forward_edges[dominated]:
-    #                 backward_edges[edge.to].remove(edge)
-    #             for edge in backward_edges[dominated]:
-    #                 forward_edges[edge.from_].remove(edge)
-
     if skipped:
         logger.debug(" - skipped %i dead block(s)." % len(skipped))
 
+    if optimise_layout:
+        order = layout_blocks(graph, order)
+        removed_gotos, inverted_jumps = apply_layout(graph, order)
+        logger.debug(" - optimised block layout, removed %i goto(s) and inverted %i jump(s)." % (
+            removed_gotos, inverted_jumps,
+        ))
+
     # ------------------------------------------------------------ #
     #             Fix/adjust wide and ldc instructions             #
     # ------------------------------------------------------------ #
@@ -162,10 +206,13 @@ def assemble(
                 instruction = block.instructions[index]
                 index += 1
 
-                if adjust_ldcs and instruction == instructions.ldc:
+                if adjust_ldcs and (instruction == instructions.ldc or instruction == instructions.ldc_w):
                     cp_index = classfile.constant_pool.add(instruction.constant)
-                    if cp_index > 255:
-                        block.instructions[index] = instructions.ldc_w(instruction.constant)
+                    if cp_index > 255 and instruction == instructions.ldc:
+                        block.instructions[index - 1] = instructions.ldc_w(instruction.constant)
+                        adjusted_ldcs += 1
+                    elif cp_index <= 255 and instruction == instructions.ldc_w:
+                        block.instructions[index - 1] = instructions.ldc(instruction.constant)
                         adjusted_ldcs += 1
                     continue
 
@@ -307,11 +354,11 @@ def assemble(
                 new_jump_edge = JumpEdge(intermediary_block, target)
 
                 out_edges.add(new_fallthrough_edge)
-                in_edges.add(new_fallthrough_edge)
+                in_edges.add(new_jump_edge)
 
                 blocks[intermediary_block.label] = intermediary_block
                 forward_edges[intermediary_block] = {new_jump_edge}
-                backward_edges[target] = {new_jump_edge}
+                backward_edges[intermediary_block] = {new_fallthrough_edge}
 
                 generated_blocks += 1
 
@@ -320,6 +367,8 @@ def assemble(
                 # at this point. This should've been caught by the verifier, but obviously that can be disabled.
                 logger.debug(" - unable to adjust edge %s due to multiple jump edges." % fallthrough_edge)
 
+    if transformed_fallthroughs or generated_blocks:
+        graph.invalidate()  # The edges were modified directly.
     if transformed_fallthroughs:
         logger.debug(" - transformed %i fallthrough edge(s) into gotos." % transformed_fallthroughs)
     if generated_blocks:
@@ -331,8 +380,24 @@ def assemble(
 
     # TODO: May want to move the type inference to a separate file?
 
+    if budget is not None:
+        budget.check()
+
+    if compute_frames and trace is None and _needs_inferred_frames(graph, reused_frames, skipped):
+        # Optimising the layout (or adjusting fallthroughs) can mean that blocks which were only ever fallen through to,
+        # and so had no original frames, are now jumped to. We'll need to infer their frames after all.
+        logger.debug(" - original stackmap frames are insufficient for the new block layout.")
+        trace = Trace.from_graph(
+            graph, do_raise=do_raise, merge_non_live=False, make_params_live=True, budget=budget,
+        )
+        if do_raise and trace.conflicts:
+            raise TypeConflictError(trace.conflicts)
+        code.max_stack = max(code.max_stack, trace.max_stack)
+        code.max_locals = max(code.max_locals, trace.max_locals)
+
     environment = classfile.environment or DEFAULT
     frame_precalc: dict[InsnBlock, tuple[list[Type], list[Type]]] = {}
+    replaced: set[InsnBlock] = set()  # Dead blocks that have been replaced with an athrow, these always need frames.
 
     # Type hints... type hints... type hints...
     uninit_offset_blocks: dict[InsnBlock, dict[int, list[tuple[list[Type], int]]]] = {}
@@ -340,20 +405,30 @@ def assemble(
 
     if compute_frames:
         generifier = Generifier(environment)
-        # Caches the type inference for entries as it can be very expensive to compute, especially for larger methods
-        # with many exception handlers.
-        inference_cache: dict[Entry, set[Type]] = {}
 
         uninit_resolved = 0
 
         for block in blocks.values():
             if block in skipped:
                 continue
+            reused_frame = reused_frames.get(block)
+            if reused_frame is not None:
+                stack, locals_ = reused_frame
+                frame_precalc[block] = (list(stack), list(locals_))
+                continue
+            elif trace is None:  # Didn't have a frame originally, and as nothing was modified, doesn't need one now.
+                continue
             entries = trace.entries.get(block)
-            if not entries:  # FIXME: Determine entry constraints or nop instructions (probably will do the latter).
+            if not entries:
                 if block in (graph.entry_block, graph.return_block, graph.rethrow_block) or block.inline:
                     continue
-                raise NotImplementedError("Can't yet deal with dead blocks.")  # continue
+                # The block is dead, but hasn't been removed, so we don't know what its frame should be. Like ASM, we'll
+                # replace its code with an athrow, which verifies with only a throwable on the stack.
+                _replace_dead_block(graph, block)
+                replaced.add(block)
+                frame_precalc[block] = ([throwable_t], [])
+                code.max_stack = max(code.max_stack, 1)
+                continue
 
             skip = False
             live = trace.pre_liveness[block].copy()
@@ -388,12 +463,7 @@ def assemble(
 
             for frame in entries:
                 for index, entry in enumerate(frame.stack):
-                    inference = inference_cache.get(entry)
-                    if inference is None:
-                        inference = inference_cache.setdefault(entry, entry.inference(no_nullable=True))
-                        for merge in entry.adjacent:  # FIXME: Is this always valid? Are there any edge cases?
-                            inference_cache[merge] = inference
-                    stack[index].update(inference)
+                    stack[index].update(entry.inference(no_nullable=True))
 
                 for index in range(max_local):
                     if not index in live:
@@ -403,12 +473,7 @@ def assemble(
                     # this is the best we can do at this point is guess.
                     if entry is None:
                         continue
-                    inference = inference_cache.get(entry)
-                    if inference is None:
-                        inference = inference_cache.setdefault(entry, entry.inference(no_nullable=True))
-                        for merge in entry.adjacent:
-                            inference_cache[merge] = inference
-                    locals_[index].update(inference)
+                    locals_[index].update(entry.inference(no_nullable=True))
 
     # ------------------------------------------------------------ #
     #                      Type generification                     #
@@ -490,7 +555,7 @@ def assemble(
             uninit_resolved += len(uninitialised)
             frame_precalc[block] = (stack, locals_)
 
-        logger.debug(" - stackmap pre-generation (%i inference cache entries)" % len(inference_cache))
+        logger.debug(" - stackmap pre-generation (%i frame(s), %i reused)." % (len(frame_precalc), len(reused_frames)))
         if uninit_resolved:
             logger.debug("    - %i uninitialised type source(s) resolved." % uninit_resolved)
 
@@ -502,6 +567,8 @@ def assemble(
     # substituting jumps with wide jumps may actually cause other jump offsets to become too large, and in that case we
     # would need to do ANOTHER pass, we'll limit it to max 5 passes though.
     for pass_ in range(5):
+        if budget is not None:
+            budget.check()
         code.instructions.clear()
 
         written:  list[tuple[InsnBlock, int]] = []  # The order and offset of written blocks.
@@ -517,14 +584,19 @@ def assemble(
         line_numbers: dict[int, int] = {}
 
         inline_stack: list[InsnBlock] = []
+        inline_next: InsnBlock | None = None  # The block to inline next, before continuing on with the order.
 
         index = 0
         offset = 0
         wide = False
 
-        while index < len(order):  # Not a for loop as order can change during iteration.
-            block = order[index]
-            index += 1
+        while inline_next is not None or index < len(order):
+            if inline_next is not None:
+                block = inline_next
+                inline_next = None
+            else:
+                block = order[index]
+                index += 1
 
             dont_inline = not inline_stack or not block.inline   # Don't record offsets of inlined blocks
             if dont_inline:
@@ -591,6 +663,8 @@ def assemble(
                 # single one, and then modify that one.
 
                 if not pass_:  # We only need to add the placeholders on the first pass
+                    # Sorted by value so that the offsets are in a deterministic order, as the edges are in a set.
+                    switch_edges.sort(key=lambda edge_: -1 if edge_.value is None else edge_.value)
                     for edge in switch_edges:
                         edge.instruction = jump_instruction  # We shouldn't really be doing this tbh
                         if edge.value is None:
@@ -609,7 +683,7 @@ def assemble(
                 else:
                     inline_stack.append(block)
                     if not edge.to in inline_stack:
-                        order.insert(index, edge.to)
+                        inline_next = edge.to
                         if edge.instruction == jump_instruction:
                             jump_instruction = None  # Don't write the goto
                     else:
@@ -672,60 +746,71 @@ def assemble(
         if not adjust_jumps or max(code.instructions) <= 32767:
             break
 
-        substituted_jumps = 0
-        generated_blocks = 0
-
-        # Unconditional jumps are relatively easy to substitute
-        for offset, edge in unconditional_jumps.items():
-            instruction = code.instructions[offset]
-            if abs(instruction.offset) <= 32767 or instruction in (instructions.goto_w, instructions.jsr_w):
-                continue
+        # Rather than substituting only the jumps that overflowed in this pass and hoping that doing so doesn't cause
+        # any others to overflow, we'll work out all the jumps that need widening upfront from the offsets we have.
+        wide_unconditional, wide_conditional = _relax_jumps(
+            code.instructions, starting, switches, unconditional_jumps, conditional_jumps,
+        )
+        if not wide_unconditional and not wide_conditional:
+            logger.debug("   - no jumps substituted.")
+            break
 
-            if instruction == instructions.goto:
+        for edge in wide_unconditional:
+            if edge.instruction == instructions.goto:
                 edge.instruction = instructions.goto_w()
-            elif instruction == instructions.jsr:
+            elif edge.instruction == instructions.jsr:
                 edge.instruction = instructions.jsr_w()
             else:
-                raise ValueError("Unknown jump instruction: %s" % instruction)
-
-            substituted_jumps += 1
-
-        # Conditional jumps are more interesting. We'll generate intermediary blocks for the conditional to jump to, and
-        # the intermediary block will jump to the actual target, with a wide jump.
-        for offset, edge in conditional_jumps.items():
-            instruction = code.instructions[offset]
-            if abs(instruction.offset) <= 32767:
+                raise ValueError("Unknown jump instruction: %s" % edge.instruction)
+
+        # Conditional jumps are more interesting, as there are no wide variants. Instead, the condition is inverted so
+        # that it jumps over an intermediary block containing a wide jump to the actual target:
+        #   ifeq target          ifne fallthrough
+        # fallthrough:    ->   intermediary:
+        #   ...                  goto_w target
+        #                      fallthrough:
+        #                        ...
+        intermediaries: dict[InsnBlock, InsnBlock] = {}
+
+        for edge in wide_conditional:
+            fallthrough_edge = None
+            for edge_ in forward_edges[edge.from_]:
+                if type(edge_) is FallthroughEdge:
+                    fallthrough_edge = edge_
+                    break
+            inverted = INVERTED_JUMPS.get(type(edge.instruction))
+            if fallthrough_edge is None or inverted is None:
+                logger.debug(" - unable to substitute %s, no fallthrough edge or invertible condition." % edge)
                 continue
 
-            forward_edges[edge.from_].remove(edge)
-            backward_edges[edge.to].remove(edge)
-
             intermediary_block = graph.block()
-            # block.inline = True
-            order.insert(order.index(edge.to) + 1, intermediary_block)  # We want to write it immediately after
-
-            conditional_edge = edge.copy(to=intermediary_block, deep=False)
-            direct_edge = JumpEdge(intermediary_block, edge.to, instructions.goto_w())
-
-            forward_edges[edge.from_].add(conditional_edge)
-            backward_edges[intermediary_block].add(conditional_edge)
-            forward_edges[intermediary_block].add(direct_edge)
-            backward_edges[edge.to].add(direct_edge)
-
-            substituted_jumps += 1
-
-        if not substituted_jumps:
-            logger.debug("   - no jumps substituted.")
-            break
-        logger.debug("   - substituted %i jump(s) with wide jumps." % substituted_jumps)
-        if generated_blocks:
-            logger.debug("   - generated %i intermediary block(s)." % generated_blocks)
-
-        # We'll also remove the inline flag from all blocks, as we've already inserted them into the order, so we don't
-        # have to spend effort calculating that twice. We only need to do this on the first pass.
-        if not pass_:
-            for block in blocks.values():
-                block.inline = False
+            intermediaries[edge.from_] = intermediary_block
+
+            graph.disconnect(edge)
+            graph.disconnect(fallthrough_edge)
+            graph.connect(JumpEdge(edge.from_, fallthrough_edge.to, inverted()), check=False)
+            graph.connect(FallthroughEdge(edge.from_, intermediary_block), check=False)
+            graph.connect(JumpEdge(intermediary_block, edge.to, instructions.goto_w()), check=False)
+
+        logger.debug("   - substituted %i jump(s) with wide jumps." % (len(wide_unconditional) + len(wide_conditional)))
+        if intermediaries:
+            logger.debug("   - generated %i intermediary block(s)." % len(intermediaries))
+
+        # The new order is the order that the blocks were just written in, with the intermediary blocks written
+        # immediately after the blocks that fall through to them. This is built in one go, rather than inserting into
+        # the existing order.
+        new_order: list[InsnBlock] = []
+        for block, _ in written:
+            new_order.append(block)
+            intermediary_block = intermediaries.get(block)
+            if intermediary_block is not None:
+                new_order.append(intermediary_block)
+        order = new_order
+
+        # We'll also remove the inline flag from all blocks, as any blocks that were inlined are now in the order, so we
+        # don't have to spend effort calculating that twice.
+        for block in blocks.values():
+            block.inline = False
 
     else:
         raise ValueError("Code generation failed after 5 passes.")
@@ -736,94 +821,56 @@ def assemble(
 
     code.exception_table.clear()
 
-    split_handlers = 0
-    merged_edges = 0
-
-    handlers: dict[int, list[Code.ExceptionHandler]] = defaultdict(list)  # Handlers and their priority
-
-    # We'll iterate through the backward edges as it allows us to easily group and merge exception ranges that may span
-    # multiple blocks.
-    for block, in_edges in backward_edges.items():
-        if not simplify_exception_ranges:
-            # Generate an exception handler for every exception edge we find, it's wasteful but faster to compute.
-            for edge in in_edges:
-                if type(edge) is ExceptionEdge and not edge.from_ in skipped:
-                    handlers[edge.priority].append(Code.ExceptionHandler(
-                        starting[edge.from_], ending[edge.from_], starting[edge.to], ClassConstant(edge.throwable.name),
-                    ))
+    # The ranges covered by each exception edge, as (priority, start, end, throwable, handler offset). Blocks that have
+    # been inlined may have been written at multiple places, and if so, we'll need to cover each of them.
+    exception_ranges: list[tuple[int, int, int, Reference, int]] = []
+    # The end offsets of inlined blocks, by the block and the offset it was inlined at.
+    inline_ends: dict[tuple[InsnBlock, int], int] = {}
+    for block, (starts, ends) in inlined.items():
+        for start, end in zip(starts, ends):
+            inline_ends[block, start] = end
+
+    for block, out_edges in forward_edges.items():
+        if block in skipped:
+            continue
+        exception_edges = [edge for edge in out_edges if type(edge) is ExceptionEdge]
+        if not exception_edges:
             continue
 
-        # Otherwise, we will attempt to merge the ranges of exception edges which have the same priority and throwable.
-        exception_edges: dict[tuple[int, Reference | None], dict[int, tuple[int, ExceptionEdge]]] = defaultdict(dict)
-
-        for edge in in_edges:
-            if type(edge) is ExceptionEdge and not edge.from_ in skipped:
-                handler = (edge.priority, edge.throwable)
-                # We might have written this block at multiple places, and if so, we will need to generate an exception
-                # handler for each.
-                if edge.from_.inline:
-                    offsets = inlined.get(edge.from_)
-                    if offsets is not None:
-                        for _, end in zip(*offsets):
-                            exception_edges[handler][offset] = (end, edge)
-                    if not edge.from_ in starting:  # Since it's inlined, it may not have been written normally
-                        continue
-                exception_edges[handler][starting[edge.from_]] = (ending[edge.from_], edge)
-
-        # We need to check if the blocks in between the minimum and maximum range all lie within the actual exception
-        # range. Otherwise, we'll just have to split the exception range into multiple handlers.
-        for (priority, throwable), edges in exception_edges.items():
-            current_handlers = handlers[priority]
-            current_range: tuple[int, int] | None = None
-
-            for start, (end, edge) in sorted(edges.items(), key=operator.itemgetter(0)):
-                in_range = False
-
-                if current_range is None:
-                    current_range = (start, end)
-                    in_range = True
-                elif start == current_range[1]:
-                    current_range = (current_range[0], end)
-                    in_range = True
-
-                if not in_range:
-                    current_handlers.append(Code.ExceptionHandler(
-                        *current_range, starting[edge.to], ClassConstant(throwable.name),
-                    ))
-                    current_range = (start, end)
-                    split_handlers += 1
-                    continue
+        block_ranges: list[tuple[int, int]] = []
+        if block in starting:  # Since it's inlined, it may not have been written normally.
+            block_ranges.append((starting[block], ending[block]))
+        if block in inlined:
+            block_ranges.extend(zip(*inlined[block]))
 
-                # Might need to extend the current range if the edge has inline coverage.
+        for edge in exception_edges:
+            handler_offset = starting[edge.to]
+            for start, end in block_ranges:
+                # If the edge has inline coverage, it also covers any block that was inlined directly after this one.
                 if edge.inline_coverage:
-                    for edge_ in forward_edges[edge.from_]:
-                        if edge_.to.inline:
+                    for edge_ in out_edges:
+                        if type(edge_) is not ExceptionEdge and edge_.to is not None and edge_.to.inline:
+                            end = inline_ends.get((edge_.to, end), end)
                             break
-                    else:
-                        continue
+                exception_ranges.append((edge.priority, start, end, edge.throwable, handler_offset))
 
-                    for inline_block, (starts, ends) in inlined.items():
-                        index = starts.index(start)
-                        if index >= 0:  # Extend the range to the end of the inline block
-                            current_range = (current_range[0], ends[index])
-                            break
-
-                merged_edges += 1
-
-            if current_range is not None:
-                current_handlers.append(Code.ExceptionHandler(
-                    *current_range, starting[edge.to], ClassConstant(throwable.name),
-                ))
+    if simplify_exception_ranges:
+        # Merges the ranges of exception edges with the same throwable and handler, where doing so doesn't change which
+        # handler is used at any offset.
+        handlers = merge_exception_ranges(exception_ranges)
+    else:
+        # Generate an exception handler for every exception edge we find, it's wasteful but faster to compute.
+        handlers = sorted(
+            (range_ for range_ in exception_ranges if range_[1] < range_[2]), key=operator.itemgetter(0, 1),
+        )
 
-    for priority, handlers_ in sorted(handlers.items(), key=operator.itemgetter(0)):
-        code.exception_table.extend(handlers_)
+    for _, start, end, throwable, handler_offset in handlers:
+        code.exception_table.append(Code.ExceptionHandler(start, end, handler_offset, ClassConstant(throwable.name)))
 
-    if split_handlers:
-        logger.debug(" - split %i exception handler(s)." % split_handlers)
     if code.exception_table:
-        if merged_edges:
-            logger.debug(" - generated %i exception handler(s) from %i merged edge(s)." % (
-                len(code.exception_table), merged_edges,
+        if len(code.exception_table) != len(exception_ranges):
+            logger.debug(" - generated %i exception handler(s) from %i exception range(s)." % (
+                len(code.exception_table), len(exception_ranges),
             ))
         else:
             logger.debug(" - generated %i exception handler(s)." % len(code.exception_table))
@@ -839,6 +886,11 @@ def assemble(
         prev_offset = -1
         prev_locals = None
 
+        # The frames to compress, which is done all at once as the best choice of frame depends on the frames after it.
+        uncompressed_frames: list[tuple[int, tuple[Type, ...], tuple[Type, ...]]] = []
+        full_size = 0  # The size that the frames would've been, had they all been full frames.
+        verification_type_size = StackMapTable._get_verification_type_size
+
         # FIXME: Might not include blocks by the assembler and might mess up on inlined block. More info needed.
         for block, offset in written:
             offset_delta = offset - prev_offset
@@ -851,7 +903,8 @@ def assemble(
                     if not isinstance(edge, FallthroughEdge):
                         break
                 else:
-                    continue
+                    if not block in replaced:
+                        continue
 
                 # AKA a block with no instructions. We do have to be careful though as it may be the entry block, which
                 # we do want to have a frame for (though we don't need to write it as the first frame is implicit).
@@ -861,7 +914,7 @@ def assemble(
             prev_offset = offset
             offset_delta -= 1  # Another space-saving measure by the JVM.
 
-            stack, locals_ = frame_precalc[block]
+            stack, locals_ = _precalculated_frame(graph, block, frame_precalc)
 
             # Reserved types are implicit when dealing with the stack map table, so we need to remove all of them.
             # while reserved_t in locals_:
@@ -881,37 +934,25 @@ def assemble(
             # print("[", ", ".join(map(str, stack)), "]")
             # print("[", ", ".join(map(str, locals_)), "]")
 
-            stackmap_frame = None
+            full_size += 7 + sum(map(verification_type_size, locals_)) + sum(map(verification_type_size, stack))
 
             if not compress_frames:
                 stackmap_table.frames.append(StackMapTable.FullFrame(offset_delta, locals_, stack))
-                continue
+            else:
+                uncompressed_frames.append((offset_delta, locals_, stack))
 
-            locals_delta = len(locals_) - len(prev_locals)
-            same_locals = not locals_delta and locals_ == prev_locals
-
-            if same_locals:
-                if not stack:
-                    stackmap_frame = (
-                        StackMapTable.SameFrame(offset_delta)
-                        if offset_delta < 64 else
-                        StackMapTable.SameFrameExtended(offset_delta)
-                    )
-                elif len(stack) == 1:
-                    stackmap_frame = (
-                        StackMapTable.SameLocals1StackItemFrame(offset_delta, stack[0])
-                        if offset_delta < 64 else
-                        StackMapTable.SameLocals1StackItemFrameExtended(offset_delta, stack[0])
-                    )
-
-            elif not stack and locals_delta:
-                if locals_delta in range(-3, 1) and locals_ == prev_locals[:locals_delta]:
-                    stackmap_frame = StackMapTable.ChopFrame(offset_delta, -locals_delta)
-                elif locals_delta in range(0, 4) and locals_[:-locals_delta] == prev_locals:
-                    stackmap_frame = StackMapTable.AppendFrame(offset_delta, locals_[-locals_delta:])
-
-            prev_locals = locals_
-            stackmap_table.frames.append(stackmap_frame or StackMapTable.FullFrame(offset_delta, locals_, stack))
+        if uncompressed_frames:
+            stackmap_table.frames.extend(StackMapTable.encode_frames(prev_locals, uncompressed_frames))
+        # Kept on the table so that callers can see how much the frames were compressed by, see get_frame_counts() too.
+        stackmap_table.full_size = full_size
+
+        if uncompressed_frames:
+            logger.debug(" - generated %i stackmap frame(s), %i byte(s) compressed from %i byte(s)." % (
+                len(stackmap_table.frames), stackmap_table.get_size() - 2, full_size,
+            ))
+            logger.debug("   - %s." % ", ".join(
+                "%i %s(s)" % (count, kind) for kind, count in stackmap_table.get_frame_counts().items()
+            ))
 
         if not stackmap_table:
             code.stackmap_table = None
@@ -930,3 +971,207 @@ def assemble(
     # TODO: LVT and LVTT
 
     return code
+
+
+def _find_reusable_frames(
+        graph: "InsnGraph",
+) -> tuple[dict[InsnBlock, tuple[tuple[Type, ...], tuple[Type, ...]]], bool]:
+    """
+    Finds the blocks whose original stackmap frames are still valid. This is the case if neither the block, nor any
+    block that can reach it, nor any block that it can reach, has been modified since it was disassembled. The types
+    in a frame flow forwards, but which locals are live (and so not top) flows backwards.
+
+    :return: The reusable frames and whether all of the original frames could be reused (and no blocks modified).
+    """
+
+    # The implicit initial frame is only kept if the method had a stackmap table to begin with (older classes don't),
+    # in which case there's nothing to reuse and the frames will all need to be inferred.
+    entry_block = graph.entry_block
+    if entry_block._original is None or entry_block._original[1] is None:
+        return {}, False
+
+    modified = [
+        block for block in graph._blocks.values()
+        if block._original is None or block._original[0] != graph._fingerprint(block)
+    ]
+    # The return and rethrow blocks aren't disassembled, but don't need frames either.
+    modified = [block for block in modified if block is not graph.return_block and block is not graph.rethrow_block]
+    reused_all = not modified
+
+    dirty = set(modified)
+    for neighbours in (graph.successors, graph.predecessors):
+        reached = set(modified)
+        stack = modified.copy()
+        while stack:
+            for block in neighbours(stack.pop()):
+                if block is not None and not block in reached:
+                    reached.add(block)
+                    stack.append(block)
+        dirty.update(reached)
+
+    frames = {}
+    for block in graph._blocks.values():
+        if block in dirty or block._original is None or block._original[1] is None:
+            continue
+        stack, locals_ = block._original[1]
+        # Uninitialized types refer to the offsets of the new instructions, which may have moved.
+        for type_ in itertools.chain(stack, locals_):
+            if type(type_) is Uninitialized:
+                reused_all = False
+                break
+        else:
+            frames[block] = block._original[1]
+
+    return frames, reused_all
+
+
+def _remove_unreachable_blocks(graph: "InsnGraph") -> int:
+    """
+    Removes the blocks that can't be reached from the entry block, via any edge. These are exactly the blocks that
+    aren't in the dominator tree, so any blocks that are only dominated by unreachable blocks are removed too.
+
+    :return: The number of blocks that were removed.
+    """
+
+    blocks, reverse_postorder, _ = graph._dominance()
+    if len(reverse_postorder) == len(blocks):
+        return 0
+
+    reachable = {blocks[index] for index in reverse_postorder}
+    removed = 0
+    for block in blocks:
+        if not block in reachable and block is not graph.return_block and block is not graph.rethrow_block:
+            graph.remove(block)
+            removed += 1
+    return removed
+
+
+def _replace_dead_block(graph: "InsnGraph", block: InsnBlock) -> None:
+    """
+    Replaces the code in a dead block with a single athrow, so that its frame can be anything with a throwable on the
+    stack. Any edges out of the block are removed, as they're no longer taken.
+    """
+
+    for edge in graph.out_edges(block):
+        graph.disconnect(edge)
+    block.instructions.clear()
+    graph.throw(block)
+
+
+def _needs_inferred_frames(
+        graph: "InsnGraph",
+        reused_frames: dict[InsnBlock, tuple[tuple[Type, ...], tuple[Type, ...]]],
+        skipped: set[InsnBlock],
+) -> bool:
+    """
+    Checks if any block that is jumped to doesn't have a reusable frame, and so would need its frame inferred.
+    """
+
+    for block, in_edges in graph._backward_edges.items():
+        if block in reused_frames or block in skipped or block is graph.entry_block:
+            continue
+        elif block is graph.return_block or block is graph.rethrow_block:
+            continue
+        for edge in in_edges:
+            if not isinstance(edge, FallthroughEdge):
+                return True
+    return False
+
+
+def _precalculated_frame(
+        graph: "InsnGraph", block: InsnBlock, frame_precalc: dict[InsnBlock, tuple[list[Type], list[Type]]],
+) -> tuple[list[Type], list[Type]]:
+    """
+    Gets the precalculated stack and locals for a block. Intermediary blocks generated by the assembler won't have
+    been traced, but as they have no instructions and only jump to one other block, they have the same frame as that
+    block.
+    """
+
+    target = block
+    for _ in range(len(graph._blocks)):  # In case of a loop of empty blocks.
+        frame = frame_precalc.get(target)
+        if frame is not None:
+            return frame
+        successors = graph.successors(target)
+        if target.instructions or len(successors) != 1 or successors[0] is None:
+            break
+        target, = successors
+    return frame_precalc[block]
+
+
+def _relax_jumps(
+        instructions_: dict[int, Instruction],
+        starting: dict[InsnBlock, int],
+        switches: dict[int, list[SwitchEdge]],
+        unconditional_jumps: dict[int, JumpEdge],
+        conditional_jumps: dict[int, JumpEdge],
+) -> tuple[set[JumpEdge], set[JumpEdge]]:
+    """
+    Works out which jumps need to be widened so that all jump offsets fit, given the offsets from a code generation
+    pass. Widening a jump moves the code after it, which may cause other jumps to overflow, so this is repeated until
+    no new jumps need widening. Each iteration only recomputes the offsets (via the cumulative growth at each widened
+    jump and switch), rather than regenerating the code.
+
+    :param instructions_: The instructions that were written, and their offsets.
+    :param starting: The starting offsets of the written blocks.
+    :param switches: The offsets of the switch instructions.
+    :param unconditional_jumps: The offsets of the unconditional jumps and their edges.
+    :param conditional_jumps: The offsets of the conditional jumps and their edges.
+    :return: The unconditional and conditional jump edges that need widening.
+    """
+
+    # The narrow jumps and the switches, in the order they were written in. The switches are needed as their padding
+    # depends on their offset.
+    events: list[tuple[int, JumpEdge | None, bool]] = [(offset, None, False) for offset in switches]
+    for offset, edge in unconditional_jumps.items():
+        if instructions_[offset] in (instructions.goto, instructions.jsr):
+            events.append((offset, edge, False))
+        elif not instructions_[offset] in (instructions.goto_w, instructions.jsr_w):
+            raise ValueError("Unknown jump instruction: %s" % instructions_[offset])
+    for offset, edge in conditional_jumps.items():
+        events.append((offset, edge, True))
+    events.sort(key=operator.itemgetter(0))
+
+    wide_unconditional: set[JumpEdge] = set()
+    wide_conditional: set[JumpEdge] = set()
+
+    while True:
+        # The offsets at which the code grows and the total growth after each of them.
+        positions: list[int] = []
+        totals: list[int] = []
+        total = 0
+
+        for offset, edge, conditional in events:
+            if edge is None:
+                growth = (3 - (offset + total) % 4) - (3 - offset % 4)
+            elif edge in wide_conditional:
+                growth = 5  # The goto_w in the intermediary block, the inverted jump is the same size.
+            elif edge in wide_unconditional:
+                growth = 2
+            else:
+                continue
+            if growth:
+                total += growth
+                positions.append(offset)
+                totals.append(total)
+
+        changed = False
+        for offset, edge, conditional in events:
+            if edge is None or edge in wide_conditional or edge in wide_unconditional:
+                continue
+            target = starting[edge.to]
+            # The new offsets include the growth from everything strictly before them.
+            index = bisect.bisect_left(positions, offset)
+            source = offset + (totals[index - 1] if index else 0)
+            index = bisect.bisect_left(positions, target)
+            target += totals[index - 1] if index else 0
+            if -32768 <= target - source <= 32767:
+                continue
+            if conditional:
+                wide_conditional.add(edge)
+            else:
+                wide_unconditional.add(edge)
+            changed = True
+
+        if not changed:
+            return wide_unconditional, wide_conditional
@@ -16,13 +16,16 @@ from .block import InsnBlock
 from .debug import *
 from .edge import *
 from ... import instructions
+from ...classfile.attributes import StackMapTable
 from ...instructions import (
     AThrowInstruction, ConditionalJumpInstruction, JsrInstruction, JumpInstruction, RetInstruction, ReturnInstruction, SwitchInstruction,
 )
 from ...source import *
+from ...types import reserved_t, uninitialized_this_t, Type
 
 if typing.TYPE_CHECKING:
     from . import InsnGraph
+    from ..budget import Budget
     from ...classfile import MethodInfo
 
 logger = logging.getLogger("kirjava.analysis.graph._dis")
@@ -31,7 +34,8 @@ logger = logging.getLogger("kirjava.analysis.graph._dis")
 def disassemble(
         graph: "InsnGraph", method: "MethodInfo", do_raise: bool,
         keep_lnt: bool, keep_lvt: bool, keep_lvtt: bool,
-        gen_source_map: bool,
+        gen_source_map: bool, keep_frames: bool,
+        budget: "Budget | None",
 ) -> None:
     code = method.code
     if code is None:
@@ -39,6 +43,11 @@ def disassemble(
 
     logger.debug("Disassembling method %r:" % str(method))
 
+    # Only the deadline and cancellation are checked, as no blocks are traced here.
+    if budget is not None:
+        budget = budget.start()
+        budget.check()
+
     # ------------------------------------------------------------ #
     #        Find jump/handler targets and exception bounds        #
     # ------------------------------------------------------------ #
@@ -139,6 +148,9 @@ def disassemble(
             block.instructions.append(line_number)
 
         if is_new_block:
+            if budget is not None:
+                budget.check()
+
             ending[previous] = offset
             starting[offset] = block
 
@@ -324,6 +336,9 @@ def disassemble(
     # So why the rewrite? Well, with this new method we save 100ms on a 1900ms disassembly (on my laptop), which might
     # be worth the extra complexity.
     for index, handler in enumerate(code.exception_table):
+        if budget is not None:
+            budget.check()
+
         block = starting.get(handler.start_pc)
         if block is None:
             # Obviously this can't happen in valid bytecode, but we do want to be able to handle invalid bytecode
@@ -378,3 +393,81 @@ def disassemble(
                 "Found %i exception handler(s) with unbound target offsets! Use do_raise=False to ignore this." % unbound_targets,
             )
         logger.debug(" - %i exception handler(s) with unbound target offsets!" % unbound_targets)
+
+    # ------------------------------------------------------------ #
+    #                   Keep original stackmap frames              #
+    # ------------------------------------------------------------ #
+
+    if keep_frames:
+        frames = {}
+        if code.stackmap_table is not None:
+            try:
+                frames = _read_frames(method, code.stackmap_table)
+            except Exception as error:  # Invalid stackmap tables are fine, the frames will just be inferred.
+                logger.debug(" - couldn't read stackmap frames: %r" % error)
+
+        kept = 0
+        for offset, block in starting.items():
+            frame = frames.get(offset)
+            if frame is not None:
+                kept += 1
+            block._original = (graph._fingerprint(block), frame)
+        graph.entry_block._original = (graph._fingerprint(graph.entry_block), frames.get(-1))
+
+        if kept:
+            logger.debug(" - kept %i stackmap frame(s)." % kept)
+
+
+def _read_frames(
+        method: "MethodInfo", stackmap_table: StackMapTable,
+) -> dict[int, tuple[tuple[Type, ...], tuple[Type, ...]]]:
+    """
+    Reads the full frame at each offset in a stackmap table.
+
+    :return: The offset of each frame and its stack and locals, with the reserved types for wide types included. The
+             implicit initial frame is at offset -1.
+    """
+
+    locals_: list[Type] = []
+    if not method.is_static:
+        if method.name == "<init>":
+            locals_.append(uninitialized_this_t)
+        else:
+            locals_.append(method.class_.get_type())
+    for type_ in method.argument_types:
+        type_ = type_.as_vtype()
+        locals_.append(type_)
+        if type_.wide:
+            locals_.append(reserved_t)
+
+    frames = {-1: ((), tuple(locals_))}
+    offset = -1
+
+    for frame in stackmap_table.frames:
+        offset += frame.offset_delta + 1
+        stack: list[Type] = []
+
+        if isinstance(frame, (StackMapTable.SameLocals1StackItemFrame, StackMapTable.SameLocals1StackItemFrameExtended)):
+            stack.append(frame.stack_item)
+            if frame.stack_item.wide:
+                stack.append(reserved_t)
+        elif type(frame) is StackMapTable.ChopFrame:
+            for _ in range(frame.chopped):
+                if locals_.pop() is reserved_t:
+                    locals_.pop()
+        elif type(frame) is StackMapTable.AppendFrame:
+            for type_ in frame.locals:
+                locals_.append(type_)
+                if type_.wide:
+                    locals_.append(reserved_t)
+        elif type(frame) is StackMapTable.FullFrame:
+            locals_.clear()
+            for types, array in ((frame.locals, locals_), (frame.stack, stack)):
+                for type_ in types:
+                    array.append(type_)
+                    if type_.wide:
+                        array.append(reserved_t)
+
+        frames[offset] = (tuple(stack), tuple(locals_))
+
+    return frames
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+
+__all__ = (
+    "INVERTED_JUMPS",
+    "apply_layout", "layout_blocks",
+)
+
+"""
+Profile-free block layout, ordering blocks so that as few jumps as possible need to be written.
+"""
+
+import typing
+
+from .block import *
+from .edge import *
+from ... import instructions
+from ...instructions import ConditionalJumpInstruction, Instruction
+
+if typing.TYPE_CHECKING:
+    from . import InsnGraph
+
+# The conditional jumps with their inverted conditions.
+INVERTED_JUMPS: dict[type[Instruction], type[ConditionalJumpInstruction]] = {}
+for _jump_a, _jump_b in (
+        (instructions.ifeq, instructions.ifne),
+        (instructions.iflt, instructions.ifge),
+        (instructions.ifgt, instructions.ifle),
+        (instructions.if_icmpeq, instructions.if_icmpne),
+        (instructions.if_icmplt, instructions.if_icmpge),
+        (instructions.if_icmpgt, instructions.if_icmple),
+        (instructions.if_acmpeq, instructions.if_acmpne),
+        (instructions.ifnull, instructions.ifnonnull),
+):
+    INVERTED_JUMPS[_jump_a] = _jump_b
+    INVERTED_JUMPS[_jump_b] = _jump_a
+del _jump_a, _jump_b
+
+# The weights of each kind of edge, if their target is written immediately after their source. Fallthroughs save a
+# goto (and possibly an intermediary block), as do conditional jumps, though they need to be inverted, so these are
+# preferred slightly less. Gotos only save themselves.
+_FALLTHROUGH_WEIGHT = 4
+_INVERTED_WEIGHT = 3
+_GOTO_WEIGHT = 2
+_LOOP_FACTOR = 8  # Edges are weighted higher the deeper they are nested in loops.
+_MAX_DEPTH = 6
+_COLD_FACTOR = 1 / 1024
+
+
+class _Chains:
+    """
+    Union-find over the chains of blocks, used to avoid creating cycles.
+    """
+
+    __slots__ = ("parents",)
+
+    def __init__(self) -> None:
+        self.parents: dict[InsnBlock, InsnBlock] = {}
+
+    def find(self, block: InsnBlock) -> InsnBlock:
+        parents = self.parents
+        root = block
+        while True:
+            parent = parents.get(root, root)
+            if parent is root:
+                break
+            root = parent
+        while block is not root:  # Path compression
+            parent = parents.get(block, block)
+            parents[block] = root
+            block = parent
+        return root
+
+    def union(self, block: InsnBlock, other: InsnBlock) -> None:
+        self.parents[self.find(other)] = self.find(block)
+
+
+def _cold_blocks(graph: "InsnGraph", ordered: set[InsnBlock]) -> set[InsnBlock]:
+    """
+    Finds the blocks that are unlikely to be executed. These are exception handlers (and blocks only reachable via them),
+    as well as any blocks that always end up throwing an exception.
+    """
+
+    forward_edges = graph._forward_edges
+    backward_edges = graph._backward_edges
+
+    hot = {graph.entry_block}
+    stack = [graph.entry_block]
+    while stack:
+        for edge in forward_edges.get(stack.pop(), ()):
+            if type(edge) is not ExceptionEdge and edge.to is not None and not edge.to in hot:
+                hot.add(edge.to)
+                stack.append(edge.to)
+
+    cold = {block for block in ordered if not block in hot}
+
+    # Blocks are doomed to throw if all of their successors are, starting at the rethrow block. Blocks in loops that
+    # never exit aren't included, as they never resolve.
+    remaining: dict[InsnBlock, int] = {}
+    for block in graph._blocks.values():
+        successors = {edge.to for edge in forward_edges.get(block, ())}
+        remaining[block] = len(successors) if successors else -1  # Blocks with no successors aren't doomed.
+
+    stack = [graph.rethrow_block]
+    while stack:
+        # Multiple edges from the same block only count once, as the successors were counted without duplicates too.
+        for block in {edge.from_ for edge in backward_edges.get(stack.pop(), ())}:
+            count = remaining.get(block, 0)
+            if count <= 0:
+                continue
+            remaining[block] = count - 1
+            if count == 1:
+                stack.append(block)
+                cold.add(block)
+
+    cold.discard(graph.entry_block)
+    return cold
+
+
+def _order_keys(graph: "InsnGraph") -> dict[InsnBlock, tuple[int, ...]]:
+    """
+    Computes a key for each block, such that sorting by them gives a reverse postorder in which the blocks of each loop
+    are contiguous. These are the positions of the headers of the loops that the block is in, from outermost to
+    innermost, followed by the block's own position.
+    """
+
+    forward_edges = graph._forward_edges
+
+    # The reverse postorder is computed here, rather than using the dominance one, as edges are stored in sets, and the
+    # layout needs to be deterministic. Successors are visited in label order, with exception handlers last.
+    postorder: list[InsnBlock] = []
+    visited = {graph.entry_block}
+    stack = [(graph.entry_block, iter(_successors(forward_edges, graph.entry_block)))]
+    while stack:
+        block, successors = stack[-1]
+        for successor in successors:
+            if not successor in visited:
+                visited.add(successor)
+                stack.append((successor, iter(_successors(forward_edges, successor))))
+                break
+        else:
+            stack.pop()
+            postorder.append(block)
+
+    positions = {block: position for position, block in enumerate(reversed(postorder))}
+    keys = {block: (position,) for block, position in positions.items()}
+
+    loops = list(graph.loops())
+    while loops:  # Outermost loops first, so that the inner loops override them.
+        loop = loops.pop(0)
+        header = positions[loop.header]
+        prefix = keys[loop.header][:-1] + (header,)
+        for block in loop.blocks:
+            position = positions.get(block)
+            if position is not None:
+                keys[block] = prefix + (position,)
+        loops.extend(loop.children)
+
+    return keys
+
+
+def _successors(forward_edges: dict[InsnBlock, set[InsnEdge]], block: InsnBlock) -> list[InsnBlock]:
+    """
+    Gets the successors of a block in a deterministic order.
+    """
+
+    edges = sorted(
+        (edge for edge in forward_edges.get(block, ()) if edge.to is not None),
+        key=lambda edge: (type(edge) is ExceptionEdge, edge.to.label),
+    )
+    return [edge.to for edge in edges]
+
+
+def layout_blocks(graph: "InsnGraph", order: list[InsnBlock]) -> list[InsnBlock]:
+    """
+    Orders blocks to minimise the number of jumps that need to be written, without profiling information.
+
+    Blocks are chained together, greedily, along the edges that would save the most jumps if their target were written
+    immediately after their source. Edges are weighted by their kind and by how deeply they're nested in loops, and
+    edges to cold blocks (exception handlers and blocks that always throw) are weighted the lowest. The chains are then
+    ordered by a reverse postorder in which loops are contiguous, with cold chains last.
+    Note that conditional jumps may be chained to their jump targets, rather than their fallthroughs, in which case the
+    conditions need to be inverted.
+
+    :param graph: The graph that the blocks are in.
+    :param order: The blocks to order, with the entry block first.
+    :return: The new order of the blocks.
+    """
+
+    if len(order) <= 2:
+        return order
+
+    entry_block = graph.entry_block
+    forward_edges = graph._forward_edges
+    ordered = set(order)
+    cold = _cold_blocks(graph, ordered)
+
+    depths: dict[InsnBlock, int] = {}
+    loops = list(graph.loops())
+    while loops:
+        loop = loops.pop()
+        for block in loop.blocks:
+            if depths.get(block, 0) < loop.depth:
+                depths[block] = loop.depth
+        loops.extend(loop.children)
+
+    # The candidate edges, as (weight, index, from, to). The index is only for a deterministic order.
+    candidates: list[tuple[float, int, InsnBlock, InsnBlock]] = []
+    for block in order:
+        fallthrough_edge: FallthroughEdge | None = None
+        jump_edges: list[JumpEdge] = []
+        for edge in forward_edges.get(block, ()):
+            if isinstance(edge, FallthroughEdge):
+                fallthrough_edge = edge
+            elif isinstance(edge, JumpEdge):
+                jump_edges.append(edge)
+
+        targets: list[tuple[InsnBlock, float]] = []
+        if type(fallthrough_edge) is JsrFallthroughEdge:
+            # The target must be written immediately after the jsr, as the subroutine returns to that offset.
+            targets.append((fallthrough_edge.to, float("inf")))
+        elif fallthrough_edge is not None:
+            targets.append((fallthrough_edge.to, _FALLTHROUGH_WEIGHT))
+            if len(jump_edges) == 1 and type(jump_edges[0].instruction) in INVERTED_JUMPS:
+                targets.append((jump_edges[0].to, _INVERTED_WEIGHT))
+        elif len(jump_edges) == 1 and jump_edges[0].instruction in (instructions.goto, instructions.goto_w):
+            targets.append((jump_edges[0].to, _GOTO_WEIGHT))
+
+        for target, weight in targets:
+            if target is block or target is entry_block or not target in ordered:
+                continue
+            weight *= _LOOP_FACTOR ** min(depths.get(block, 0), depths.get(target, 0), _MAX_DEPTH)
+            if target in cold and not block in cold:
+                weight *= _COLD_FACTOR
+            candidates.append((weight, len(candidates), block, target))
+
+    candidates.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+
+    successors: dict[InsnBlock, InsnBlock] = {}
+    predecessors: dict[InsnBlock, InsnBlock] = {}
+    chains = _Chains()
+
+    for _, _, block, target in candidates:
+        if block in successors or target in predecessors:
+            continue
+        if chains.find(block) is chains.find(target):  # Would create a cycle.
+            continue
+        successors[block] = target
+        predecessors[target] = block
+        chains.union(block, target)
+
+    keys = _order_keys(graph)
+    heads = [block for block in order if not block in predecessors]
+    heads.sort(key=lambda head: (head is not entry_block, head in cold, keys.get(head, (len(keys),))))
+
+    new_order: list[InsnBlock] = []
+    for head in heads:
+        block = head
+        while block is not None:
+            new_order.append(block)
+            block = successors.get(block)
+
+    return new_order
+
+
+def apply_layout(graph: "InsnGraph", order: list[InsnBlock]) -> tuple[int, int]:
+    """
+    Modifies the edges of the blocks to take advantage of their new order. Gotos to the block written immediately after
+    are turned into fallthroughs, and conditional jumps to the block written immediately after are inverted, so that
+    they fall through to it instead.
+
+    :param graph: The graph that the blocks are in.
+    :param order: The new order of the blocks, as given by layout_blocks().
+    :return: The number of gotos removed and the number of conditional jumps inverted.
+    """
+
+    forward_edges = graph._forward_edges
+    removed = 0
+    inverted = 0
+
+    for block, next_block in zip(order, order[1:]):
+        fallthrough_edge: FallthroughEdge | None = None
+        jump_edges: list[JumpEdge] = []
+        for edge in forward_edges.get(block, ()):
+            if isinstance(edge, FallthroughEdge):
+                fallthrough_edge = edge
+            elif isinstance(edge, JumpEdge):
+                jump_edges.append(edge)
+
+        if len(jump_edges) != 1 or jump_edges[0].to is not next_block:
+            continue
+        jump_edge, = jump_edges
+
+        if fallthrough_edge is None:
+            if jump_edge.instruction in (instructions.goto, instructions.goto_w):
+                graph.disconnect(jump_edge)
+                graph.connect(FallthroughEdge(block, next_block), check=False)
+                removed += 1
+
+        elif type(fallthrough_edge) is FallthroughEdge and fallthrough_edge.to is not next_block:
+            inverted_jump = INVERTED_JUMPS.get(type(jump_edge.instruction))
+            if inverted_jump is not None:
+                graph.disconnect(jump_edge)
+                graph.disconnect(fallthrough_edge)
+                graph.connect(JumpEdge(block, fallthrough_edge.to, inverted_jump()), check=False)
+                graph.connect(FallthroughEdge(block, next_block), check=False)
+                inverted += 1
+
+    return removed, inverted
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+
+__all__ = (
+    "trace_maxes",
+)
+
+"""
+A lightweight stack depth analysis, used to compute the maxes without a full trace.
+"""
+
+import logging
+import typing
+from typing import Callable
+
+from .block import *
+from .edge import *
+from .. import Trace
+from ... import instructions
+from ...error import MergeDepthError
+from ...instructions import *
+from ...instructions import _ReservedInstruction
+from ...types import void_t
+
+if typing.TYPE_CHECKING:
+    from . import InsnGraph
+    from ..budget import Budget
+
+logger = logging.getLogger("kirjava.analysis.graph._maxes")
+
+
+def _fixed_effect(class_: type[Instruction]) -> tuple[int, int] | None:
+    """
+    Works out the stack effect (in words) of an instruction class, if it doesn't depend on the instruction's operands.
+
+    :return: The number of words popped and pushed, or None if the effect isn't fixed.
+    """
+
+    # Checked in order, subclasses first.
+    if issubclass(class_, LoadConstantInstruction):
+        return 0, 1 + class_.wide
+    elif issubclass(class_, FixedConstantInstruction):
+        return 0, 1 + class_.constant.type.wide
+    elif issubclass(class_, ConstantInstruction):
+        return 0, 1
+
+    elif issubclass(class_, LoadLocalInstruction):
+        return 0, 1 + class_.type.wide
+    elif issubclass(class_, StoreLocalInstruction):
+        return 1 + class_.type.wide, 0
+    elif issubclass(class_, IncrementLocalInstruction):
+        return 0, 0
+
+    elif issubclass(class_, ArrayLoadInstruction):
+        return 2, 1 + class_.type.element.wide
+    elif issubclass(class_, ArrayStoreInstruction):
+        return 3 + class_.type.element.wide, 0
+    elif issubclass(class_, ArrayLengthInstruction):
+        return 1, 1
+
+    elif issubclass(class_, Pop2Instruction):
+        return 2, 0
+    elif issubclass(class_, PopInstruction):
+        return 1, 0
+    elif issubclass(class_, DupX1Instruction):
+        return 2, 3
+    elif issubclass(class_, DupX2Instruction):
+        return 3, 4
+    elif issubclass(class_, DupInstruction):
+        return 1, 2
+    elif issubclass(class_, Dup2X1Instruction):
+        return 3, 5
+    elif issubclass(class_, Dup2X2Instruction):
+        return 4, 6
+    elif issubclass(class_, Dup2Instruction):
+        return 2, 4
+    elif issubclass(class_, SwapInstruction):
+        return 2, 2
+
+    elif issubclass(class_, ComparisonInstruction):
+        return 2 + class_.type.wide * 2, 1
+    elif issubclass(class_, BinaryOperationInstruction):
+        return 2 + class_.type_a.wide + class_.type_b.wide, 1 + class_.type_b.wide
+    elif issubclass(class_, UnaryOperationInstruction):
+        return 1 + class_.type.wide, 1 + class_.type.wide
+
+    elif issubclass(class_, ConversionInstruction):
+        return 1 + class_.type_in.wide, 1 + class_.type_out.wide
+    elif issubclass(class_, (CheckCastInstruction, InstanceOfInstruction)):
+        return 1, 1
+
+    elif issubclass(class_, UnaryComparisonJumpInstruction):
+        return 1 + class_.type.wide, 0
+    elif issubclass(class_, BinaryComparisonJumpInstruction):
+        return 2 + class_.type.wide * 2, 0
+    elif issubclass(class_, JsrInstruction):
+        return 0, 1
+    elif issubclass(class_, SwitchInstruction):
+        return 1, 0
+    elif issubclass(class_, JumpInstruction):  # goto, goto_w and ret
+        return 0, 0
+
+    elif issubclass(class_, ReturnInstruction):
+        return (0 if class_.type is void_t else 1 + class_.type.wide), 0
+    elif issubclass(class_, AThrowInstruction):
+        return 1, 1  # Clears the stack too, but this is only ever at the end of a block.
+    elif issubclass(class_, (MonitorEnterInstruction, MonitorExitInstruction)):
+        return 1, 0
+
+    elif issubclass(class_, NewInstruction):
+        return 0, 1
+    elif issubclass(class_, (NewArrayInstruction, ANewArrayInstruction)):
+        return 1, 1
+
+    elif issubclass(class_, (FieldInstruction, InvokeInstruction, MultiANewArrayInstruction)):
+        return None
+
+    return 0, 0  # nop, wide, breakpoint and impdeps.
+
+
+def _field_effect(instruction: FieldInstruction) -> tuple[int, int]:
+    words = 1 + instruction.reference.field_type.wide
+    if isinstance(instruction, GetFieldInstruction):
+        return (0 if instruction.static else 1), words
+    return words + (0 if instruction.static else 1), 0
+
+
+def _invoke_effect(instruction: InvokeInstruction) -> tuple[int, int]:
+    reference = instruction.reference
+    pops = 0 if isinstance(instruction, InvokeStaticInstruction) else 1  # Also covers invokedynamic.
+    for argument_type in reference.argument_types:
+        pops += 1 + argument_type.wide
+    return pops, (0 if reference.return_type is void_t else 1 + reference.return_type.wide)
+
+
+def _multianewarray_effect(instruction: MultiANewArrayInstruction) -> tuple[int, int]:
+    return instruction.dimension, 1
+
+
+# The stack effects of each instruction, by opcode. Where the effect depends on the operands of the instruction (i.e.
+# descriptors), a function is used to compute it instead.
+_EFFECTS: dict[int, tuple[int, int]] = {
+    _ReservedInstruction.opcode: (0, 0),  # Line numbers and local variables.
+}
+_VARIABLE_EFFECTS: dict[int, Callable[[Instruction], tuple[int, int]]] = {}
+
+for _class in instructions.INSTRUCTIONS:
+    _effect = _fixed_effect(_class)
+    if _effect is not None:
+        _EFFECTS[_class.opcode] = _effect
+    elif issubclass(_class, FieldInstruction):
+        _VARIABLE_EFFECTS[_class.opcode] = _field_effect
+    elif issubclass(_class, InvokeInstruction):
+        _VARIABLE_EFFECTS[_class.opcode] = _invoke_effect
+    else:
+        _VARIABLE_EFFECTS[_class.opcode] = _multianewarray_effect
+
+del _class, _effect
+
+
+def _local_words(instruction: Instruction) -> int:
+    """
+    :return: The number of locals that an instruction requires, 0 if it doesn't access any.
+    """
+
+    if isinstance(instruction, (LoadLocalInstruction, StoreLocalInstruction)):
+        return instruction.index + 1 + instruction.type.wide
+    elif isinstance(instruction, (IncrementLocalInstruction, RetInstruction)):
+        return instruction.index + 1
+    return 0
+
+
+def trace_maxes(
+        graph: "InsnGraph", do_raise: bool = True, budget: "Budget | None" = None,
+) -> tuple[int, int, set[InsnBlock]]:
+    """
+    Computes the max stack and max locals of a graph in a single pass, without any type information. Graphs with
+    subroutines fall back to a full trace.
+
+    :param graph: The graph to compute the maxes for.
+    :param do_raise: Raise an exception if the stack depths are inconsistent.
+    :param budget: Limits on the amount of work that can be done, a BudgetExceededError is raised if they're hit. Only
+                   the blocks, time and cancellation are checked, as no entries are created.
+    :return: The max stack, max locals and the blocks that were reached.
+    """
+
+    if budget is not None:
+        budget = budget.start()
+
+    logger.debug("Computing maxes for %s:" % graph.method)
+
+    # The depth after a subroutine returns depends on where its ret is reached from, which may well be the jsr's own
+    # fallthrough block (common in obfuscated and older code), so subroutines can only be handled by a full trace.
+    for edges in graph._forward_edges.values():
+        for edge in edges:
+            if type(edge) is JsrJumpEdge:
+                logger.debug(" - found subroutines, using a full trace instead.")
+                trace = Trace.from_graph(graph, do_raise=do_raise, retain=Trace.RETAIN_ENTRIES, budget=budget)
+                return trace.max_stack, trace.max_locals, set(trace.entries)
+
+    method = graph.method
+    max_stack = 0
+    max_locals = 0 if method.is_static else 1
+    for argument_type in method.argument_types:
+        max_locals += 1 + argument_type.wide
+
+    effects = _EFFECTS
+    variable_effects = _VARIABLE_EFFECTS
+
+    depths: dict[InsnBlock, int] = {graph.entry_block: 0}
+    stack = [graph.entry_block]
+    traced = 0
+
+    while stack:
+        block = stack.pop()
+        depth = depths[block]
+
+        traced += 1
+        if budget is not None:
+            budget.check(traced)
+
+        for instruction in block.instructions:
+            effect = effects.get(instruction.opcode)
+            if effect is None:
+                effect = variable_effects[instruction.opcode](instruction)
+            depth += effect[1] - effect[0]
+            if effect[1] and depth > max_stack:  # Pops happen before pushes, so only check the peak here.
+                max_stack = depth
+            if depth < 0:  # Not valid, but we'll be lenient as this isn't a verifier.
+                depth = 0
+
+            words = _local_words(instruction)
+            if words > max_locals:
+                max_locals = words
+
+        end_depth = depth
+        out_edges = graph.out_edges(block)
+
+        # Only one (kind of) instruction can be in the out edges of a block, and it's traced before any of the jumps
+        # are taken, so we'll work out the depth after it first.
+        for edge in out_edges:
+            instruction = edge.instruction
+            if instruction is None or type(edge) is ExceptionEdge:
+                continue
+            effect = effects.get(instruction.opcode)
+            if effect is None:
+                effect = variable_effects[instruction.opcode](instruction)
+            depth = max(0, end_depth + effect[1] - effect[0])
+            if depth > max_stack:
+                max_stack = depth
+            words = _local_words(instruction)
+            if words > max_locals:
+                max_locals = words
+            break
+
+        for edge in out_edges:
+            to = edge.to
+            if to is None:  # Opaque edge, ignore.
+                continue
+
+            edge_type = type(edge)
+            if edge_type is ExceptionEdge:
+                new_depth = 1  # The stack is cleared and the exception is pushed.
+                if new_depth > max_stack:
+                    max_stack = new_depth
+            else:
+                new_depth = depth
+
+            if to is graph.return_block or to is graph.rethrow_block:
+                depths.setdefault(to, new_depth)
+                continue
+
+            old_depth = depths.get(to)
+            if old_depth is None:
+                depths[to] = new_depth
+                stack.append(to)
+            elif old_depth != new_depth and do_raise:
+                raise MergeDepthError(edge, new_depth, old_depth)
+
+    logger.debug(" - max stack %i, max locals %i, reached %i block(s)." % (max_stack, max_locals, len(depths)))
+
+    return max_stack, max_locals, set(depths)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+__all__ = (
+    "merge_exception_ranges",
+)
+
+"""
+Exception range merging, used to generate smaller exception tables.
+"""
+
+import operator
+from typing import Any, Iterable, Iterator
+
+
+class _Range:
+    """
+    A range of offsets covered by an exception handler.
+    """
+
+    __slots__ = ("start", "end", "priority", "throwable", "handler", "low", "high", "group")
+
+    def __init__(self, priority: int, start: int, end: int, throwable: Any, handler: int) -> None:
+        self.start = start
+        self.end = end
+        self.priority = priority
+        self.throwable = throwable
+        self.handler = handler
+
+        # The lowest and highest priorities that this range could end up with, depending on which ranges it's merged
+        # with. Ranges that overlap must keep their relative order, which is guaranteed as long as these don't overlap.
+        self.low = priority
+        self.high = priority
+
+        self.group: _Group | None = None
+
+
+class _Group:
+    """
+    A group of merged ranges, with the same throwable and handler, that are written as a single exception handler.
+    """
+
+    __slots__ = ("start", "end", "priority", "ranges")
+
+    def __init__(self, range_: _Range) -> None:
+        self.start = range_.start
+        self.end = range_.end
+        self.priority = range_.priority
+        self.ranges = [range_]
+
+        range_.group = self
+
+
+class _IntervalTree:
+    """
+    A (static) centered interval tree, for finding which ranges overlap a given range.
+    """
+
+    __slots__ = ("center", "by_start", "by_end", "left", "right")
+
+    def __init__(self, ranges: list[_Range]) -> None:
+        """
+        :param ranges: The ranges to store in the tree, must not be empty, and none of them may be empty.
+        """
+
+        ranges = sorted(ranges, key=operator.attrgetter("start"))
+        self.center = ranges[len(ranges) // 2].start
+
+        left = []
+        right = []
+        middle = []
+
+        for range_ in ranges:
+            if range_.end <= self.center:
+                left.append(range_)
+            elif range_.start > self.center:
+                right.append(range_)
+            else:
+                middle.append(range_)
+
+        self.by_start = middle  # Already sorted.
+        self.by_end = sorted(middle, key=operator.attrgetter("end"), reverse=True)
+        self.left = _IntervalTree(left) if left else None
+        self.right = _IntervalTree(right) if right else None
+
+    def overlapping(self, start: int, end: int) -> Iterator[_Range]:
+        """
+        Yields all the ranges that overlap the range [start, end).
+        """
+
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            # All the ranges in this node contain the center, so we only need to check one of their bounds, unless the
+            # query range also contains it, in which case they all overlap.
+            if end <= node.center:
+                for range_ in node.by_start:
+                    if range_.start >= end:
+                        break
+                    yield range_
+                if node.left is not None:
+                    nodes.append(node.left)
+            elif start > node.center:
+                for range_ in node.by_end:
+                    if range_.end <= start:
+                        break
+                    yield range_
+                if node.right is not None:
+                    nodes.append(node.right)
+            else:
+                yield from node.by_start
+                if node.left is not None:
+                    nodes.append(node.left)
+                if node.right is not None:
+                    nodes.append(node.right)
+
+
+def _can_move(tree: _IntervalTree, start: int, end: int, low: int, high: int, group: _Group, range_: _Range) -> bool:
+    """
+    Checks if the ranges in [start, end) can be moved anywhere between the priorities low and high (inclusive), without
+    changing their order relative to any overlapping ranges other than the group and range being merged.
+    """
+
+    for other in tree.overlapping(start, end):
+        if other is range_ or other.group is group:
+            continue
+        if other.low <= high and other.high >= low:
+            return False
+    return True
+
+
+def merge_exception_ranges(
+        ranges: Iterable[tuple[int, int, int, Any, int]],
+) -> list[tuple[int, int, int, Any, int]]:
+    """
+    Merges exception ranges into as few handlers as possible.
+
+    Ranges with the same throwable and handler are merged when they're contiguous (or overlap). If they have different
+    priorities, the merged range has to take one of them, which is only allowed if no other range overlapping the part
+    that has changed priority sits in between the two, otherwise the order of the handlers at those offsets would
+    change. Overlapping ranges are found using an interval tree, so this scales to the (many) thousands of overlapping
+    handlers that some obfuscators generate.
+
+    :param ranges: The priority, start offset, end offset, throwable and handler offset of each range.
+    :return: The merged ranges, in the order they should be written to the exception table.
+    """
+
+    ranges_ = [_Range(*range_) for range_ in ranges if range_[1] < range_[2]]
+    if not ranges_:
+        return []
+
+    tree = _IntervalTree(ranges_)
+
+    by_handler: dict[tuple[Any, int], list[_Range]] = {}
+    for range_ in ranges_:
+        by_handler.setdefault((range_.throwable, range_.handler), []).append(range_)
+
+    groups: list[_Group] = []
+
+    for (throwable, handler), handler_ranges in by_handler.items():
+        handler_ranges.sort(key=operator.attrgetter("start", "priority"))
+        group: _Group | None = None
+
+        for range_ in handler_ranges:
+            if group is None or range_.start > group.end:
+                group = _Group(range_)
+                groups.append(group)
+                continue
+
+            if range_.priority != group.priority:
+                low = min(range_.priority, group.priority)
+                high = max(range_.priority, group.priority)
+                # Either this range takes the group's priority, or the group takes this range's priority, with
+                # preference given to the former, as it moves less.
+                if _can_move(tree, range_.start, range_.end, low, high, group, range_):
+                    moved = (range_,)
+                elif _can_move(tree, group.start, group.end, low, high, group, range_):
+                    moved = group.ranges
+                    group.priority = range_.priority
+                else:
+                    group = _Group(range_)
+                    groups.append(group)
+                    continue
+
+                for moved_range in moved:
+                    moved_range.low = min(moved_range.low, low)
+                    moved_range.high = max(moved_range.high, high)
+
+            group.ranges.append(range_)
+            range_.group = group
+            if range_.end > group.end:
+                group.end = range_.end
+
+    groups.sort(key=operator.attrgetter("priority", "start"))
+    return [
+        (group.priority, group.start, group.end, group.ranges[0].throwable, group.ranges[0].handler)
+        for group in groups
+    ]
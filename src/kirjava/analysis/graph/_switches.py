@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+__all__ = (
+    "select_switches",
+)
+
+"""
+Switch lowering, choosing between tableswitch and lookupswitch instructions.
+"""
+
+import typing
+
+from .block import *
+from .edge import *
+from ... import instructions
+from ...instructions import LookupSwitchInstruction, TableSwitchInstruction
+
+if typing.TYPE_CHECKING:
+    from . import InsnGraph
+
+
+def _use_table(low: int, high: int, count: int) -> bool:
+    """
+    Checks if a tableswitch should be used over a lookupswitch, using the same cost model that javac does, where the
+    space cost is in words and the time cost is in comparisons, weighted 3 to 1.
+
+    :param low: The lowest case value.
+    :param high: The highest case value.
+    :param count: The number of cases, excluding the default.
+    """
+
+    if not count:
+        return False
+
+    table_space_cost = 4 + (high - low + 1)
+    table_time_cost = 3
+    lookup_space_cost = 3 + 2 * count
+    lookup_time_cost = count
+
+    return table_space_cost + 3 * table_time_cost <= lookup_space_cost + 3 * lookup_time_cost
+
+
+def select_switches(graph: "InsnGraph") -> tuple[int, int]:
+    """
+    Re-chooses between tableswitch and lookupswitch for every switch in the graph. Cases that go to the same block as
+    the default are dropped, so sparse tableswitches may also be shrunk.
+
+    :param graph: The graph to lower the switches in, in place.
+    :return: The number of switches that are now tableswitches, and the number that are now lookupswitches, out of the
+             ones that were changed.
+    """
+
+    forward_edges = graph._forward_edges
+    tables = 0
+    lookups = 0
+
+    for block in tuple(graph._blocks.values()):
+        default_edge: SwitchEdge | None = None
+        case_edges: list[SwitchEdge] = []
+        for edge in forward_edges.get(block, ()):
+            if type(edge) is SwitchEdge:
+                if edge.value is None:
+                    default_edge = edge
+                else:
+                    case_edges.append(edge)
+
+        if default_edge is None:  # Either not a switch, or a malformed one that we shouldn't touch.
+            continue
+        elif default_edge.to is None or any(edge.to is None for edge in case_edges):
+            continue
+        instruction = default_edge.instruction
+
+        # The values of the edges of a tableswitch are indices into its jump table, rather than the case values.
+        if isinstance(instruction, TableSwitchInstruction):
+            offset = instruction.low
+        elif isinstance(instruction, LookupSwitchInstruction):
+            offset = 0
+        else:
+            continue
+
+        cases: dict[int, InsnBlock] = {}
+        for edge in case_edges:
+            if edge.to is not default_edge.to:
+                cases[edge.value + offset] = edge.to
+
+        low = min(cases, default=0)
+        high = max(cases, default=-1)
+
+        if _use_table(low, high, len(cases)):
+            if (
+                isinstance(instruction, TableSwitchInstruction) and
+                instruction.low == low and instruction.high == high and
+                len(case_edges) == high - low + 1
+            ):
+                continue
+            new_instruction = instructions.tableswitch(None, low, high, {})
+            new_cases = {value - low: cases.get(value, default_edge.to) for value in range(low, high + 1)}
+            tables += 1
+
+        else:
+            if isinstance(instruction, LookupSwitchInstruction) and len(case_edges) == len(cases):
+                continue
+            new_instruction = instructions.lookupswitch(None, {})
+            new_cases = cases
+            lookups += 1
+
+        graph.disconnect(default_edge)
+        for edge in case_edges:
+            graph.disconnect(edge)
+
+        graph.connect(SwitchEdge(block, default_edge.to, new_instruction, None), check=False)
+        for value, to in new_cases.items():
+            graph.connect(SwitchEdge(block, to, new_instruction, value), check=False)
+
+    return tables, lookups
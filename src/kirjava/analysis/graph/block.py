@@ -8,6 +8,7 @@ import typing
 from typing import Any, Iterable, Iterator
 
 from .debug import *
+from .._dispatch import TRACERS
 from ... import instructions
 from ...abc import Block, RethrowBlock, ReturnBlock
 from ...instructions import Instruction, JumpInstruction, ReturnInstruction
@@ -16,6 +17,7 @@ from ...source import InstructionInBlock
 if typing.TYPE_CHECKING:
     from .. import Context
     from ..frame import Frame
+    from ...types import Type
 
 
 class InsnBlock(Block):
@@ -23,7 +25,7 @@ class InsnBlock(Block):
     A block containing Java instructions.
     """
 
-    __slots__ = ("instructions", "inline", "_hash")
+    __slots__ = ("instructions", "inline", "_sources", "_original", "_hash")
 
     def __init__(self, label: int, instructions_: Iterable[Instruction] | "InsnBlock" | None = None) -> None:
         """
@@ -36,6 +38,12 @@ class InsnBlock(Block):
         self.instructions: list[Instruction] = []
         self.inline = False  # Can this block be inlined?
 
+        # Cached sources for each instruction in this block, so that they aren't recreated every time it's traced.
+        self._sources: list[InstructionInBlock] = []
+        # The fingerprint of this block when it was disassembled and its frame from the original stackmap table (as
+        # the stack and locals), if it had one. Used by the assembler to reuse frames of blocks that haven't changed.
+        self._original: tuple[int, tuple[tuple[Type, ...], tuple[Type, ...]] | None] | None = None
+
         if instructions_ is not None:
             self.instructions.extend(instructions_)
 
@@ -90,6 +98,7 @@ class InsnBlock(Block):
     def copy(self, label: int | None = None, deep: bool = True) -> "InsnBlock":
         block = InsnBlock(label or self.label)
         block.inline = self.inline
+        block._original = self._original
 
         if not deep:
             block.instructions.extend(self.instructions)
@@ -107,9 +116,16 @@ class InsnBlock(Block):
         :param context: The trace context to use.
         """
 
-        for index, instruction in enumerate(self.instructions):
-            context.source = InstructionInBlock(index, self, instruction)
-            instruction.trace(context)
+        tracers = TRACERS
+
+        for source in self._get_sources():
+            context.source = source
+            instruction = source.instruction
+            tracer = tracers.get(type(instruction))
+            if tracer is not None:
+                tracer(instruction, context)
+            else:
+                instruction.trace(context)
 
     def trace_iter(self, context: "Context") -> Iterator["Context"]:
         """
@@ -118,13 +134,39 @@ class InsnBlock(Block):
         :param context: The trace context to use.
         """
 
-        for index, instruction in enumerate(self.instructions):
-            context.source = InstructionInBlock(index, self, instruction)
-            instruction.trace(context)
+        tracers = TRACERS
+
+        for source in self._get_sources():
+            context.source = source
+            instruction = source.instruction
+            tracer = tracers.get(type(instruction))
+            if tracer is not None:
+                tracer(instruction, context)
+            else:
+                instruction.trace(context)
             yield context
 
     # ------------------------------ Utility ------------------------------ #
 
+    def _get_sources(self) -> list[InstructionInBlock]:
+        """
+        :return: The sources for each instruction in this block, recreating any that are out of date.
+        """
+
+        # The instructions list can be modified directly, so we do need to check that the cache is valid every time,
+        # though this is still a lot cheaper than creating new sources.
+        instructions_ = self.instructions
+        sources = self._sources
+
+        del sources[len(instructions_):]
+        for index, instruction in enumerate(instructions_):
+            if index == len(sources):
+                sources.append(InstructionInBlock(index, self, instruction))
+            elif sources[index].instruction is not instruction:
+                sources[index] = InstructionInBlock(index, self, instruction)
+
+        return sources
+
     def _check_instruction(self, instruction: Instruction) -> None:
         """
         Checks that an instruction can be added to this block. Throws if not the case.
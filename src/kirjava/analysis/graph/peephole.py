@@ -0,0 +1,947 @@
+#!/usr/bin/env python3
+
+__all__ = (
+    "PeepholeRule",
+    "NopRule", "PopRule", "LoadStoreRule", "DeadStoreRule", "ConstantFoldRule", "ConstantBranchRule", "JumpThreadRule",
+    "DEFAULT_RULES",
+    "optimise", "compact_locals",
+)
+
+"""
+Peephole optimisations for instruction graphs.
+"""
+
+import logging
+import typing
+from typing import Iterable
+
+from .block import *
+from .debug import LocalVariable
+from .edge import *
+from .. import Budget, Trace
+from ... import instructions, types
+from ...constants import Double, Float, Integer, Long, Null, String
+from ...instructions import (
+    Instruction,
+    AdditionInstruction, SubtractionInstruction, MultiplicationInstruction,
+    DivisionInstruction, RemainderInstruction, NegationInstruction,
+    ShiftLeftInstruction, ShiftRightInstruction, UnsignedShiftRightInstruction,
+    BitwiseAndInstruction, BitwiseOrInstruction, BitwiseXorInstruction,
+    BinaryOperationInstruction, ComparisonInstruction, ConstantInstruction, ConversionInstruction, TruncationInstruction,
+    ConditionalJumpInstruction, UnaryComparisonJumpInstruction, BinaryComparisonJumpInstruction,
+    IncrementLocalInstruction, LoadLocalInstruction, StoreLocalInstruction,
+)
+from ...source import InstructionInBlock
+
+if typing.TYPE_CHECKING:
+    from . import InsnGraph
+
+logger = logging.getLogger("kirjava.analysis.graph.peephole")
+
+
+class PeepholeRule:
+    """
+    A peephole optimisation rule, which rewrites a single block (and its out edges) at a time.
+    """
+
+    __slots__ = ()
+
+    liveness: bool = False  # Does this rule need local liveness information from a trace?
+
+    def __repr__(self) -> str:
+        return "<%s() at %x>" % (type(self).__name__, id(self))
+
+    def apply(self, graph: "InsnGraph", block: InsnBlock, trace: Trace | None) -> int:
+        """
+        Applies this rule to a block.
+
+        :param graph: The graph that the block is in.
+        :param block: The block to apply this rule to.
+        :param trace: A trace of the graph, only provided if this rule needs liveness information. Note that this may
+                      be stale, as other rules may have modified the graph since it was computed, though as the default
+                      rules only ever remove local uses, the liveness information is conservative.
+        :return: The number of rewrites made, 0 if nothing was changed.
+        """
+
+        ...
+
+
+# ---------------------------------------- Rules ---------------------------------------- #
+
+class NopRule(PeepholeRule):
+    """
+    Removes nop instructions.
+    """
+
+    __slots__ = ()
+
+    def apply(self, graph: "InsnGraph", block: InsnBlock, trace: Trace | None) -> int:
+        instructions_ = block.instructions
+        nop = instructions.nop
+        count = len(instructions_)
+        instructions_[:] = [instruction for instruction in instructions_ if type(instruction) is not nop]
+        return count - len(instructions_)
+
+
+class PopRule(PeepholeRule):
+    """
+    Removes values that are pushed to the stack and then immediately popped, as well as dup/pop and swap/swap pairs.
+    """
+
+    __slots__ = ()
+
+    def apply(self, graph: "InsnGraph", block: InsnBlock, trace: Trace | None) -> int:
+        instructions_ = block.instructions
+        count = 0
+        index = 0
+
+        while index < len(instructions_) - 1:
+            first = instructions_[index]
+            second = instructions_[index + 1]
+            type_ = type(second)
+
+            if type_ is instructions.pop:
+                removable = _pushes(first) == 1 or type(first) is instructions.dup
+            elif type_ is instructions.pop2:
+                removable = _pushes(first) == 2 or type(first) is instructions.dup2
+            elif type_ is instructions.swap:
+                removable = type(first) is instructions.swap
+            else:
+                removable = False
+
+            if not removable:
+                index += 1
+                continue
+
+            del instructions_[index:index + 2]
+            count += 1
+            if index:  # The instructions either side may now form a pair too, i.e. iconst_0, dup, pop, pop.
+                index -= 1
+
+        return count
+
+
+class LoadStoreRule(PeepholeRule):
+    """
+    Removes loads that are immediately stored back to the same local, and stores that are immediately loaded from the
+    same local, if the local isn't live afterwards.
+    """
+
+    __slots__ = ()
+
+    liveness = True
+
+    def apply(self, graph: "InsnGraph", block: InsnBlock, trace: Trace | None) -> int:
+        if trace is None or not block in trace.post_liveness:  # Not traced, i.e. unreachable.
+            return 0
+
+        instructions_ = block.instructions
+        count = 0
+        index = 0
+
+        while index < len(instructions_) - 1:
+            first = instructions_[index]
+            second = instructions_[index + 1]
+
+            if isinstance(first, LoadLocalInstruction) and isinstance(second, StoreLocalInstruction):
+                removable = first.index == second.index and first.type == second.type
+            elif isinstance(first, StoreLocalInstruction) and isinstance(second, LoadLocalInstruction):
+                removable = (
+                    first.index == second.index and
+                    first.type == second.type and
+                    not _is_live(graph, block, trace, index + 2, first.index, first.type.wide)
+                )
+            else:
+                removable = False
+
+            if not removable:
+                index += 1
+                continue
+
+            del instructions_[index:index + 2]
+            count += 1
+            if index:
+                index -= 1
+
+        return count
+
+
+class DeadStoreRule(PeepholeRule):
+    """
+    Replaces stores to locals that are never read afterwards with pops, which the PopRule can then remove entirely if
+    the value being stored has no side effects.
+    """
+
+    __slots__ = ()
+
+    liveness = True
+
+    def apply(self, graph: "InsnGraph", block: InsnBlock, trace: Trace | None) -> int:
+        if trace is None or not block in trace.post_liveness:
+            return 0
+
+        instructions_ = block.instructions
+        count = 0
+        index = 0
+
+        while index < len(instructions_):
+            instruction = instructions_[index]
+            index += 1
+            if not isinstance(instruction, StoreLocalInstruction):
+                continue
+            wide = instruction.type.wide
+            if _is_live(graph, block, trace, index, instruction.index, wide):
+                continue
+
+            instructions_[index - 1] = instructions.pop2() if wide else instructions.pop()
+            if index > 1 and type(instructions_[index - 2]) is instructions.wide:
+                index -= 1
+                del instructions_[index - 1]
+            count += 1
+
+        return count
+
+
+class ConstantFoldRule(PeepholeRule):
+    """
+    Folds integer and long arithmetic, comparisons and conversions between them on constants.
+    """
+
+    __slots__ = ()
+
+    def apply(self, graph: "InsnGraph", block: InsnBlock, trace: Trace | None) -> int:
+        instructions_ = block.instructions
+        count = 0
+        index = 0
+
+        while index < len(instructions_):
+            instruction = instructions_[index]
+            folded: Instruction | None = None
+            start = index
+
+            if isinstance(instruction, BinaryOperationInstruction) and index >= 2:
+                value_a = _constant(instructions_[index - 2])
+                value_b = _constant(instructions_[index - 1])
+                if value_a is not None and value_b is not None:
+                    if isinstance(instruction, ComparisonInstruction):  # lcmp, the others are floating point.
+                        if value_a[1] == value_b[1] == instruction.type == types.long_t:
+                            folded = _push((value_a[0] > value_b[0]) - (value_a[0] < value_b[0]), types.int_t)
+                    # The top value (b) is popped first, and is of type_a, as per the tracing.
+                    elif value_a[1] == instruction.type_b and value_b[1] == instruction.type_a:
+                        folded = _fold_binary(instruction, value_a[0], value_b[0])
+                    start = index - 2
+
+            elif (
+                isinstance(instruction, (NegationInstruction, ConversionInstruction, TruncationInstruction)) and
+                index >= 1
+            ):
+                value = _constant(instructions_[index - 1])
+                if value is not None:
+                    folded = _fold_unary(instruction, *value)
+                    start = index - 1
+
+            if folded is None:
+                index += 1
+                continue
+
+            instructions_[start:index + 1] = [folded]
+            count += 1
+            index = start  # The folded constant may be an operand to the next instruction.
+
+        return count
+
+
+class ConstantBranchRule(PeepholeRule):
+    """
+    Resolves conditional jumps on constants, either to a goto or to the fallthrough.
+    """
+
+    __slots__ = ()
+
+    def apply(self, graph: "InsnGraph", block: InsnBlock, trace: Trace | None) -> int:
+        instructions_ = block.instructions
+        if not instructions_:
+            return 0
+
+        jump_edge: JumpEdge | None = None
+        fallthrough_edge: FallthroughEdge | None = None
+        for edge in graph._forward_edges.get(block, ()):
+            if type(edge) is JumpEdge and isinstance(edge.instruction, ConditionalJumpInstruction):
+                jump_edge = edge
+            elif type(edge) is FallthroughEdge:
+                fallthrough_edge = edge
+        if jump_edge is None or fallthrough_edge is None:
+            return 0
+
+        instruction = jump_edge.instruction
+        comparison = instruction.comparison
+
+        if isinstance(instruction, UnaryComparisonJumpInstruction):
+            operands = 1
+            if instruction.type == types.int_t:
+                value = _constant(instructions_[-1])
+                if value is None or value[1] != types.int_t:
+                    return 0
+                taken = _compare(comparison, value[0], 0)
+            elif type(instructions_[-1]) is instructions.aconst_null:
+                taken = comparison == ConditionalJumpInstruction.EQ  # ifnull
+            else:
+                return 0
+
+        elif isinstance(instruction, BinaryComparisonJumpInstruction) and instruction.type == types.int_t:
+            if len(instructions_) < 2:
+                return 0
+            operands = 2
+            value_a = _constant(instructions_[-2])
+            value_b = _constant(instructions_[-1])
+            if value_a is None or value_b is None or value_a[1] != types.int_t or value_b[1] != types.int_t:
+                return 0
+            taken = _compare(comparison, value_a[0], value_b[0])
+
+        else:
+            return 0
+
+        del instructions_[-operands:]
+        graph.disconnect(jump_edge)
+        if taken:
+            graph.disconnect(fallthrough_edge)
+            graph.connect(JumpEdge(block, jump_edge.to, instructions.goto()), check=False)
+
+        return 1
+
+
+class JumpThreadRule(PeepholeRule):
+    """
+    Threads jumps (and fallthroughs) through empty blocks that only jump elsewhere, so that they go directly to the
+    final target. Gotos to empty blocks that only return or throw are replaced with the return or throw itself.
+    """
+
+    __slots__ = ()
+
+    def apply(self, graph: "InsnGraph", block: InsnBlock, trace: Trace | None) -> int:
+        forward_edges = graph._forward_edges
+        backward_edges = graph._backward_edges
+        count = 0
+
+        out_edges = forward_edges.get(block, ())
+        has_exceptions = False
+        jumps = 0
+        for edge in out_edges:
+            if type(edge) is ExceptionEdge:
+                has_exceptions = True
+            elif isinstance(edge, JumpEdge):
+                jumps += 1
+
+        for edge in tuple(out_edges):
+            type_ = type(edge)
+            if type_ is FallthroughEdge or type_ is SwitchEdge:
+                unconditional = type_ is FallthroughEdge and not jumps
+            elif type_ is JumpEdge:
+                unconditional = edge.instruction in (instructions.goto, instructions.goto_w)
+            else:
+                continue
+
+            bypassed: list[InsnBlock] = []
+            target = edge.to
+            while True:
+                next_edge = _sole_jump(graph, target)
+                if next_edge is None or next_edge.to is None or next_edge.to is graph.entry_block:
+                    break
+                elif next_edge.to is target or next_edge.to in bypassed:  # A loop of empty blocks.
+                    break
+                elif type(next_edge) is not JumpEdge or next_edge.instruction in (instructions.goto, instructions.goto_w):
+                    bypassed.append(target)
+                    target = next_edge.to
+                elif (
+                    unconditional and
+                    (next_edge.to is graph.return_block or next_edge.to is graph.rethrow_block) and
+                    not has_exceptions and
+                    not any(type(edge_) is ExceptionEdge for edge_ in forward_edges.get(target, ()))
+                ):
+                    # Exception handlers that cover the block would now cover the return or throw too, so this is only
+                    # done if neither block has any.
+                    bypassed.append(target)
+                    target = None
+                    break
+                else:
+                    break
+
+            if not bypassed:
+                continue
+
+            graph.disconnect(edge)
+            if target is None:
+                return_edge = _sole_jump(graph, bypassed[-1])
+                graph.connect(JumpEdge(block, return_edge.to, return_edge.instruction.copy()), check=False)
+            elif type_ is SwitchEdge:
+                graph.connect(edge.copy(to=target, deep=False), check=False)
+            else:
+                graph.connect(type_(block, target, edge.instruction), check=False)
+            count += 1
+
+            # Blocks that are no longer reachable at all are removed, to save later passes (and analyses) the effort.
+            for bypassed_block in bypassed:
+                if bypassed_block is not graph.entry_block and not backward_edges.get(bypassed_block):
+                    graph.remove(bypassed_block)
+
+        return count
+
+
+DEFAULT_RULES: tuple[PeepholeRule, ...] = (
+    NopRule(), ConstantFoldRule(), ConstantBranchRule(), DeadStoreRule(), PopRule(), LoadStoreRule(), JumpThreadRule(),
+)
+
+
+def optimise(
+        graph: "InsnGraph",
+        rules: Iterable[PeepholeRule] | None = None,
+        *,
+        max_passes: int = 10,
+        compact: bool = True,
+        budget: Budget | None = None,
+) -> int:
+    """
+    Applies peephole optimisation rules to every block in a graph, repeating until no more rewrites can be made (or
+    the maximum number of passes is reached).
+
+    :param graph: The graph to optimise, in place.
+    :param rules: The rules to apply, in order. Defaults to DEFAULT_RULES.
+    :param max_passes: The maximum number of passes over the graph.
+    :param compact: Compact the local variable slots afterwards, see compact_locals().
+    :param budget: Limits on the amount of work that can be done, checked after each pass and when tracing.
+    :return: The total number of rewrites made, not including any local slots saved by compacting.
+    """
+
+    logger.debug("Optimising graph %r:" % graph)
+
+    rules = DEFAULT_RULES if rules is None else tuple(rules)
+    if budget is not None:
+        budget = budget.start()
+
+    blocks = graph._blocks
+    total = 0
+
+    for pass_ in range(max_passes):
+        trace: Trace | None = None
+        rewrites = 0
+
+        for rule in rules:
+            # Rules that need liveness share a single trace per pass. Rewrites by the default rules only remove local
+            # uses (or dead definitions), so the liveness is still conservative even once it's stale. Opaque edges (i.e.
+            # unresolved rets) hide where locals are read, so liveness can't be trusted at all if there are any.
+            if rule.liveness and trace is None and not _has_opaque_edges(graph):
+                trace = Trace.from_graph(graph, do_raise=False, retain=0, budget=budget)
+
+            count = 0
+            for block in tuple(blocks.values()):
+                if block is graph.return_block or block is graph.rethrow_block:
+                    continue
+                elif blocks.get(block.label) is not block:  # Removed by a rule.
+                    continue
+                count += rule.apply(graph, block, trace if rule.liveness else None)
+
+            if count:
+                logger.debug(" - (pass %i) %s made %i rewrite(s)." % (pass_ + 1, type(rule).__name__, count))
+            rewrites += count
+
+        total += rewrites
+        if not rewrites:
+            break
+        if budget is not None:
+            budget.check()
+
+    else:
+        logger.debug(" - stopped after %i pass(es), more rewrites may be possible." % max_passes)
+
+    saved = 0
+    if compact:
+        saved = compact_locals(graph, budget=budget)
+
+    # Compacting replaces the local instructions, so the source map needs updating even if there were no rewrites.
+    if total or saved:
+        _update_source_map(graph)
+
+    logger.debug(" - %i rewrite(s) in total, saved %i local slot(s)." % (total, saved))
+    return total
+
+
+def compact_locals(graph: "InsnGraph", trace: Trace | None = None, *, budget: Budget | None = None) -> int:
+    """
+    Renumbers the locals in a graph so that locals which are never live at the same time share slots, lowering the
+    max locals. The parameters keep their slots, and all loads, stores, iincs, rets and local variable debug info are
+    remapped.
+    Graphs with opaque edges, overlapping wide locals or that are only partially traced are left untouched.
+
+    :param graph: The graph to compact the locals of, in place.
+    :param trace: An up-to-date trace of the graph, if one has already been computed.
+    :param budget: Limits on the amount of work that can be done when tracing.
+    :return: The number of local slots that were saved.
+    """
+
+    method = graph.method
+    parameters = 0 if method.is_static else 1
+    for argument_type in method.argument_types:
+        parameters += 1 + argument_type.wide
+
+    blocks = graph._blocks
+    forward_edges = graph._forward_edges
+
+    if _has_opaque_edges(graph):
+        return 0
+
+    # Each slot above the parameters belongs to a single "unit", either on its own or as part of a wide pair, and the
+    # units are what are renumbered. Slots that are accessed as parts of two different pairs can't be separated.
+    slots: set[int] = set()
+    wides: set[int] = set()
+
+    for block in blocks.values():
+        for instruction in block.instructions:
+            if isinstance(instruction, (LoadLocalInstruction, StoreLocalInstruction)):
+                slots.add(instruction.index)
+                if instruction.type.wide:
+                    wides.add(instruction.index)
+            elif isinstance(instruction, (IncrementLocalInstruction, LocalVariable)):
+                slots.add(instruction.index)
+        for edge in forward_edges.get(block, ()):
+            if type(edge) is RetEdge:
+                slots.add(edge.instruction.index)
+
+    units: dict[int, int] = {}  # Slot -> the base slot of its unit.
+    widths: dict[int, int] = {}
+    for base in sorted(wides):
+        if base + 1 in wides or base - 1 in wides or base < parameters <= base + 1:
+            return 0
+        if base >= parameters:
+            units[base] = units[base + 1] = base
+            widths[base] = 2
+    for slot in sorted(slots):
+        if slot >= parameters and not slot in units:
+            units[slot] = slot
+            widths[slot] = 1
+
+    if not units:
+        return 0
+
+    if trace is None:
+        trace = Trace.from_graph(graph, do_raise=False, retain=0, budget=budget)
+    pre_liveness = trace.pre_liveness
+    post_liveness = trace.post_liveness
+
+    # Blocks that are reachable but weren't given any liveness information would need to be treated as if every local
+    # is live, which defeats the point, so it's easier to just give up.
+    visited = {graph.entry_block}
+    stack = [graph.entry_block]
+    while stack:
+        block = stack.pop()
+        if not block in post_liveness and block is not graph.return_block and block is not graph.rethrow_block:
+            return 0
+        for edge in forward_edges.get(block, ()):
+            if not edge.to in visited:
+                visited.add(edge.to)
+                stack.append(edge.to)
+
+    # Build the interference graph. Every definition interferes with the units that are live immediately after it.
+    interference: dict[int, set[int]] = {base: set() for base in widths}
+
+    def _units(live: Iterable[int]) -> set[int]:
+        return {units[slot] for slot in live if slot in units}
+
+    def _define(unit: int, live: set[int]) -> None:
+        for other in live:
+            if other != unit:
+                interference[unit].add(other)
+                interference[other].add(unit)
+
+    for block in visited:
+        if not block in post_liveness:
+            continue
+
+        handlers: set[int] = set()
+        live = _units(post_liveness[block])
+        for edge in forward_edges.get(block, ()):
+            if type(edge) is ExceptionEdge:
+                handlers |= _units(pre_liveness.get(edge.to, ()))
+            elif type(edge) is RetEdge:
+                live.add(units[edge.instruction.index])
+        live |= handlers
+
+        for instruction in reversed(block.instructions):
+            if isinstance(instruction, StoreLocalInstruction):
+                unit = units.get(instruction.index)
+                if unit is None:
+                    continue
+                _define(unit, live)
+                if 1 + instruction.type.wide == widths[unit]:  # Otherwise only part of the unit is overwritten.
+                    live.discard(unit)
+                    live |= handlers
+            elif isinstance(instruction, LoadLocalInstruction):
+                unit = units.get(instruction.index)
+                if unit is not None:
+                    live.add(unit)
+            elif isinstance(instruction, IncrementLocalInstruction):
+                unit = units.get(instruction.index)
+                if unit is not None:
+                    _define(unit, live)
+                    live.add(unit)
+
+    # Any units that are live on entry to the method (i.e. read before they're written) all interfere with each other.
+    entry_live = _units(pre_liveness.get(graph.entry_block, ()))
+    for unit in entry_live:
+        _define(unit, entry_live)
+
+    # Greedily assign the new slots, in the order of the original ones, to keep the output stable.
+    mapping: dict[int, int] = {}
+    for base, width in sorted(widths.items()):
+        taken: set[int] = set()
+        for other in interference[base]:
+            new_base = mapping.get(other)
+            if new_base is not None:
+                taken.update(range(new_base, new_base + widths[other]))
+        new_base = parameters
+        while new_base in taken or (width == 2 and new_base + 1 in taken):
+            new_base += 1
+        mapping[base] = new_base
+
+    old_max = max(base + width for base, width in widths.items())
+    new_max = max(mapping[base] + width for base, width in widths.items())
+    if new_max >= old_max:
+        return 0
+
+    def _remap(index: int) -> int:
+        base = units.get(index)
+        if base is None:
+            return index
+        return mapping[base] + index - base
+
+    for block in blocks.values():
+        instructions_ = block.instructions
+        index = 0
+        while index < len(instructions_):
+            instruction = instructions_[index]
+            index += 1
+
+            if isinstance(instruction, (LoadLocalInstruction, StoreLocalInstruction)):
+                new_index = _remap(instruction.index)
+                if new_index == instruction.index:
+                    continue
+                generic, fixed = _LOCAL_INSTRUCTIONS[type(instruction)]
+                instructions_[index - 1] = fixed[new_index]() if new_index < len(fixed) else generic(new_index)
+                wide = new_index > 255
+            elif isinstance(instruction, IncrementLocalInstruction):
+                new_index = _remap(instruction.index)
+                if new_index == instruction.index:
+                    continue
+                instructions_[index - 1] = instructions.iinc(new_index, instruction.value)
+                wide = new_index > 255 or not -128 <= instruction.value <= 127
+            elif type(instruction) is LocalVariable:
+                new_index = _remap(instruction.index)
+                if new_index != instruction.index:
+                    instructions_[index - 1] = LocalVariable(
+                        new_index, instruction.name, instruction.descriptor, instruction.signature,
+                    )
+                continue
+            else:
+                continue
+
+            # Wide prefixes that are no longer needed are removed, as the fixed instructions can't be widened.
+            if not wide and index > 1 and type(instructions_[index - 2]) is instructions.wide:
+                index -= 1
+                del instructions_[index - 1]
+
+        for edge in tuple(forward_edges.get(block, ())):
+            if type(edge) is RetEdge:
+                new_index = _remap(edge.instruction.index)
+                if new_index != edge.instruction.index:
+                    graph.disconnect(edge)
+                    graph.connect(RetEdge(block, edge.to, instructions.ret(new_index)), check=False)
+                    if new_index <= 255 and instructions_ and type(instructions_[-1]) is instructions.wide:
+                        instructions_.pop()
+
+    logger.debug(" - compacted %i local slot(s) into %i." % (old_max - parameters, new_max - parameters))
+    return old_max - new_max
+
+
+# ---------------------------------------- Helpers ---------------------------------------- #
+
+def _pushes(instruction: Instruction) -> int:
+    """
+    :return: The size of the value pushed by the instruction, if it has no side effects, otherwise 0.
+    """
+
+    if isinstance(instruction, ConstantInstruction):
+        type_ = type(instruction.constant)
+        if type_ is Integer or type_ is Float or type_ is String or type_ is Null:
+            return 1
+        elif type_ is Long or type_ is Double:
+            return 2
+    elif isinstance(instruction, LoadLocalInstruction):
+        return 1 + instruction.type.wide
+    return 0
+
+
+def _constant(instruction: Instruction) -> tuple[int, types.Type] | None:
+    """
+    :return: The value and type of an integer or long constant pushed by the instruction, if any.
+    """
+
+    if isinstance(instruction, ConstantInstruction):
+        type_ = type(instruction.constant)
+        if type_ is Integer:
+            return _to_int(instruction.constant.value), types.int_t
+        elif type_ is Long:
+            return _to_long(instruction.constant.value), types.long_t
+    return None
+
+
+def _to_int(value: int) -> int:
+    value &= 0xffffffff
+    return value - 0x100000000 if value & 0x80000000 else value
+
+
+def _to_long(value: int) -> int:
+    value &= 0xffffffffffffffff
+    return value - 0x10000000000000000 if value & 0x8000000000000000 else value
+
+
+def _push(value: int, type_: types.Type) -> Instruction:
+    """
+    :return: The smallest instruction that pushes the given integer or long constant.
+    """
+
+    if type_ == types.long_t:
+        if value == 0:
+            return instructions.lconst_0()
+        elif value == 1:
+            return instructions.lconst_1()
+        return instructions.ldc2_w(Long(value))
+
+    if -1 <= value <= 5:
+        return _ICONSTS[value + 1]()
+    elif -128 <= value <= 127:
+        return instructions.bipush(value)
+    elif -32768 <= value <= 32767:
+        return instructions.sipush(value)
+    return instructions.ldc(Integer(value))
+
+
+_ICONSTS = (
+    instructions.iconst_m1, instructions.iconst_0, instructions.iconst_1, instructions.iconst_2,
+    instructions.iconst_3, instructions.iconst_4, instructions.iconst_5,
+)
+
+
+# The generic and fixed forms of the load and store instructions, for renumbering locals.
+_LOCAL_INSTRUCTIONS: dict[type[Instruction], tuple[type[Instruction], tuple[type[Instruction], ...]]] = {}
+for _generic, _fixed in (
+        (instructions.iload, (instructions.iload_0, instructions.iload_1, instructions.iload_2, instructions.iload_3)),
+        (instructions.lload, (instructions.lload_0, instructions.lload_1, instructions.lload_2, instructions.lload_3)),
+        (instructions.fload, (instructions.fload_0, instructions.fload_1, instructions.fload_2, instructions.fload_3)),
+        (instructions.dload, (instructions.dload_0, instructions.dload_1, instructions.dload_2, instructions.dload_3)),
+        (instructions.aload, (instructions.aload_0, instructions.aload_1, instructions.aload_2, instructions.aload_3)),
+        (instructions.istore, (
+            instructions.istore_0, instructions.istore_1, instructions.istore_2, instructions.istore_3,
+        )),
+        (instructions.lstore, (
+            instructions.lstore_0, instructions.lstore_1, instructions.lstore_2, instructions.lstore_3,
+        )),
+        (instructions.fstore, (
+            instructions.fstore_0, instructions.fstore_1, instructions.fstore_2, instructions.fstore_3,
+        )),
+        (instructions.dstore, (
+            instructions.dstore_0, instructions.dstore_1, instructions.dstore_2, instructions.dstore_3,
+        )),
+        (instructions.astore, (
+            instructions.astore_0, instructions.astore_1, instructions.astore_2, instructions.astore_3,
+        )),
+):
+    for _instruction in (_generic,) + _fixed:
+        _LOCAL_INSTRUCTIONS[_instruction] = (_generic, _fixed)
+del _generic, _fixed, _instruction
+
+
+def _fold_binary(instruction: BinaryOperationInstruction, value_a: int, value_b: int) -> Instruction | None:
+    """
+    Folds a binary operation on two constants, following the JVM's semantics.
+
+    :return: The instruction that pushes the result, or None if it can't be folded.
+    """
+
+    type_ = instruction.type_b
+    if type_ == types.int_t:
+        wrap = _to_int
+        shift_mask = 0x1f
+        mask = 0xffffffff
+    elif type_ == types.long_t:
+        wrap = _to_long
+        shift_mask = 0x3f
+        mask = 0xffffffffffffffff
+    else:
+        return None
+
+    if isinstance(instruction, AdditionInstruction):
+        result = value_a + value_b
+    elif isinstance(instruction, SubtractionInstruction):
+        result = value_a - value_b
+    elif isinstance(instruction, MultiplicationInstruction):
+        result = value_a * value_b
+    elif isinstance(instruction, (DivisionInstruction, RemainderInstruction)):
+        if not value_b:  # Throws an ArithmeticException, so must be kept.
+            return None
+        # Division rounds towards zero, unlike Python's floor division.
+        quotient = abs(value_a) // abs(value_b)
+        if (value_a < 0) != (value_b < 0):
+            quotient = -quotient
+        result = quotient if isinstance(instruction, DivisionInstruction) else value_a - value_b * quotient
+    elif isinstance(instruction, ShiftLeftInstruction):
+        result = value_a << (value_b & shift_mask)
+    elif isinstance(instruction, UnsignedShiftRightInstruction):
+        result = (value_a & mask) >> (value_b & shift_mask)
+    elif isinstance(instruction, ShiftRightInstruction):
+        result = value_a >> (value_b & shift_mask)
+    elif isinstance(instruction, BitwiseAndInstruction):
+        result = value_a & value_b
+    elif isinstance(instruction, BitwiseOrInstruction):
+        result = value_a | value_b
+    elif isinstance(instruction, BitwiseXorInstruction):
+        result = value_a ^ value_b
+    else:
+        return None
+
+    return _push(wrap(result), type_)
+
+
+def _fold_unary(instruction: Instruction, value: int, type_: types.Type) -> Instruction | None:
+    """
+    Folds a negation, conversion or truncation of a constant.
+
+    :return: The instruction that pushes the result, or None if it can't be folded.
+    """
+
+    if isinstance(instruction, NegationInstruction):
+        if instruction.type != type_:
+            return None
+        return _push((_to_long if type_ == types.long_t else _to_int)(-value), type_)
+
+    elif isinstance(instruction, TruncationInstruction):
+        if type_ != types.int_t:
+            return None
+        if instruction == instructions.i2b:
+            return _push(((value & 0xff) ^ 0x80) - 0x80, type_)
+        elif instruction == instructions.i2c:
+            return _push(value & 0xffff, type_)
+        return _push(((value & 0xffff) ^ 0x8000) - 0x8000, type_)
+
+    elif isinstance(instruction, ConversionInstruction) and instruction.type_in == type_:
+        if instruction.type_out == types.long_t:
+            return _push(value, types.long_t)
+        elif instruction.type_out == types.int_t:
+            return _push(_to_int(value), types.int_t)
+
+    return None
+
+
+def _compare(comparison: int, value_a: int, value_b: int) -> bool:
+    if comparison == ConditionalJumpInstruction.EQ:
+        return value_a == value_b
+    elif comparison == ConditionalJumpInstruction.NE:
+        return value_a != value_b
+    elif comparison == ConditionalJumpInstruction.LT:
+        return value_a < value_b
+    elif comparison == ConditionalJumpInstruction.GE:
+        return value_a >= value_b
+    elif comparison == ConditionalJumpInstruction.GT:
+        return value_a > value_b
+    return value_a <= value_b
+
+
+def _sole_jump(graph: "InsnGraph", block: InsnBlock) -> InsnEdge | None:
+    """
+    :return: The only (non-exception) out edge of an empty block, if it has exactly one, otherwise None.
+    """
+
+    if block.instructions or block is graph.entry_block:
+        return None
+
+    sole_edge: InsnEdge | None = None
+    for edge in graph._forward_edges.get(block, ()):
+        if type(edge) is ExceptionEdge:
+            continue
+        elif sole_edge is not None or (type(edge) is not JumpEdge and type(edge) is not FallthroughEdge):
+            return None
+        sole_edge = edge
+    return sole_edge
+
+
+def _has_opaque_edges(graph: "InsnGraph") -> bool:
+    for edges in graph._forward_edges.values():
+        for edge in edges:
+            if edge.to is None:
+                return True
+    return False
+
+
+def _update_source_map(graph: "InsnGraph") -> None:
+    """
+    Updates the source map of a graph after it has been optimised. Instructions that have moved are given their new
+    indices, and any instructions or edges that have been removed are removed from the map too.
+    """
+
+    blocks = graph._blocks
+    forward_edges = graph._forward_edges
+    indices: dict[InsnBlock, dict[int, int]] = {}
+
+    for offset, source in tuple(graph.source_map.items()):
+        if type(source) is InstructionInBlock:
+            block = source.block
+            if blocks.get(block.label) is block:
+                block_indices = indices.get(block)
+                if block_indices is None:
+                    block_indices = indices[block] = {
+                        id(instruction): index for index, instruction in enumerate(block.instructions)
+                    }
+                index = block_indices.get(id(source.instruction))
+                if index == source.index:
+                    continue
+                elif index is not None:
+                    graph.source_map[offset] = InstructionInBlock(index, block, source.instruction)
+                    continue
+        elif source in forward_edges.get(source.from_, ()):
+            continue
+        del graph.source_map[offset]
+
+
+def _is_live(graph: "InsnGraph", block: InsnBlock, trace: Trace, start: int, index: int, wide: bool) -> bool:
+    """
+    Checks if a local is live before the instruction at the given index in a block.
+
+    :param start: The index of the instruction.
+    :param index: The index of the local.
+    :param wide: Is the value in the local wide?
+    """
+
+    end = index + 1 + wide
+
+    for edge in graph._forward_edges.get(block, ()):
+        # Exceptions could be thrown at any point, so any locals that the handlers use are always live.
+        if type(edge) is ExceptionEdge:
+            live = trace.pre_liveness.get(edge.to, ())
+            if index in live or (wide and index + 1 in live):
+                return True
+        elif type(edge) is RetEdge and index <= edge.instruction.index < end:
+            return True
+
+    for instruction in block.instructions[start:]:
+        if isinstance(instruction, StoreLocalInstruction):
+            if instruction.index == index and instruction.type.wide == wide:
+                return False  # Overwritten before it's read.
+            elif instruction.index < end and instruction.index + 1 + instruction.type.wide > index:
+                return True  # Partially overwritten, we'll assume the worst.
+        elif isinstance(instruction, LoadLocalInstruction):
+            if instruction.index < end and instruction.index + 1 + instruction.type.wide > index:
+                return True
+        elif isinstance(instruction, IncrementLocalInstruction):
+            if index <= instruction.index < end:
+                return True
+
+    live = trace.post_liveness.get(block, ())
+    return index in live or (wide and index + 1 in live)
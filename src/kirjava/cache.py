@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+
+__all__ = (
+    "method_key",
+    "Cache", "MemoryCache", "DiskCache",
+)
+
+"""
+Caching of disassembly and trace results, keyed on the contents of a method.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import typing
+from collections import OrderedDict
+from io import BytesIO
+from typing import Any
+
+from .classfile._constant import ConstantPool
+from .classfile._instructions import write_instructions
+from .constants import Dynamic
+from .instructions import ldc, ConstantInstruction, InvokeDynamicInstruction
+from .types import descriptor
+from .version import Version
+
+if typing.TYPE_CHECKING:
+    from .classfile import MethodInfo
+
+logger = logging.getLogger("kirjava.cache")
+
+
+class _Canonical:
+    """
+    Stands in for a class file when writing a method's code for its key. Constants are added to a new constant pool, in
+    the order they're used in, so the bytes don't depend on the layout of the class's own constant pool.
+    """
+
+    __slots__ = ("version", "constant_pool")
+
+    def __init__(self, version: Version | None) -> None:
+        self.version = version
+        self.constant_pool = ConstantPool()
+
+
+def method_key(method: "MethodInfo", *extra: Any) -> str:
+    """
+    Computes a key for a method based on its contents, such that methods with identical code (in the same context) have
+    the same key, regardless of which class they're in. The key covers the bytes of the code, its exception table, line
+    number table and stackmap table, with the constant pool indices remapped so that they don't depend on the class.
+
+    :param method: The method to compute the key for.
+    :param extra: Any extra values to mix into the key (via their repr), i.e. the options used when disassembling.
+    :return: The key, as a hex digest.
+    """
+
+    code = method.code
+    class_ = method.class_
+
+    lines = [
+        "%i.%i" % (class_.version.major, class_.version.minor) if class_ is not None else "",
+        descriptor.to_descriptor(method.argument_types, method.return_type),
+        "static" if method.is_static else "virtual",
+        # The type of the this local depends on the class, and is uninitialised in constructors.
+        class_.name if class_ is not None and not method.is_static else "",
+        "<init>" if method.name == "<init>" else "",
+    ]
+
+    data = b""
+    if code is not None:
+        # The code is written out again rather than using the bytes it was read from, as it may have been modified since,
+        # and its constant pool indices are only meaningful in the class it was read from. Instead, the indices refer to
+        # a new constant pool, which is written out after the code.
+        canonical = _Canonical(class_.version if class_ is not None else None)
+        # ldc can only refer to the first 256 constants, so its constants are added first to make sure they fit.
+        for instruction in code.instructions.values():
+            if type(instruction) is ldc:
+                canonical.constant_pool.add(instruction.constant)
+
+        buffer = BytesIO()
+        write_instructions(code.instructions, canonical, buffer)
+
+        for handler in code.exception_table:
+            handler.write(canonical, buffer)
+        line_number_table = code.line_number_table  # These end up in the graph too.
+        if line_number_table is not None:
+            line_number_table.write(canonical, buffer)
+        # The original frames are kept in the graph, so that they can be reused when it's assembled.
+        stackmap_table = code.stackmap_table
+        buffer.write(b"\x00" if stackmap_table is None else b"\x01")
+        if stackmap_table is not None:
+            stackmap_table.write(canonical, buffer)
+
+        canonical.constant_pool.write(canonical, buffer)
+        data = buffer.getvalue()
+
+        for instruction in code.instructions.values():
+            # Bootstrap methods are stored per class, and are only referred to by their index.
+            if (
+                isinstance(instruction, InvokeDynamicInstruction) or
+                (isinstance(instruction, ConstantInstruction) and type(instruction.constant) is Dynamic)
+            ):
+                if class_ is not None:
+                    lines.append(class_.name)
+                break
+
+    lines.extend(map(repr, extra))
+
+    hash_ = hashlib.sha256("\n".join(lines).encode("utf-8", "surrogatepass"))
+    hash_.update(b"\x00")
+    hash_.update(data)
+    return hash_.hexdigest()
+
+
+class Cache:
+    """
+    A cache for disassembly and trace results.
+    """
+
+    __slots__ = ("hits", "misses")
+
+    # Does this cache persist across processes? If so, only plain data (i.e. method summaries) can be stored in it, so it
+    # can only be used with trace_all(). Graphs and traces refer to live objects.
+    persistent = False
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any | None:
+        """
+        Gets a value from this cache.
+
+        :param key: The key to look up.
+        :return: The cached value, or None if it isn't in this cache.
+        """
+
+        ...
+
+    def put(self, key: str, value: Any) -> None:
+        """
+        Puts a value into this cache.
+
+        :param key: The key to store the value under.
+        :param value: The value to store.
+        """
+
+        ...
+
+    def clear(self) -> None:
+        """
+        Removes all values from this cache.
+        """
+
+        ...
+
+
+class MemoryCache(Cache):
+    """
+    An in-memory, least recently used cache.
+    """
+
+    __slots__ = ("max_size", "_values", "_lock")
+
+    def __init__(self, max_size: int = 1024) -> None:
+        """
+        :param max_size: The maximum number of values to keep.
+        """
+
+        super().__init__()
+
+        self.max_size = max_size
+
+        self._values: OrderedDict[str, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return "<MemoryCache(size=%i, max_size=%i, hits=%i, misses=%i) at %x>" % (
+            len(self._values), self.max_size, self.hits, self.misses, id(self),
+        )
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            value = self._values.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._values.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class DiskCache(Cache):
+    """
+    A cache that pickles values to files in a directory, so that results persist across runs. Only trace_all() can use
+    this, disassemble() and trace() raise a TypeError if they're given one.
+    """
+
+    __slots__ = ("directory",)
+
+    persistent = True
+
+    def __init__(self, directory: str) -> None:
+        """
+        :param directory: The directory to store the cached values in, created if it doesn't exist.
+        """
+
+        super().__init__()
+
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def __repr__(self) -> str:
+        return "<DiskCache(directory=%r, hits=%i, misses=%i) at %x>" % (self.directory, self.hits, self.misses, id(self))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".pickle")
+
+    def get(self, key: str) -> Any | None:
+        try:
+            with open(self._path(key), "rb") as stream:
+                value = pickle.load(stream)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as error:  # Corrupt or from an incompatible version, so just treat it as a miss.
+            logger.debug("Couldn't load cached value %r: %r" % (key, error))
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Written to a temporary file first so that concurrent readers never see a partially written value.
+        temp_path = "%s.%i.tmp" % (path, os.getpid())
+        with open(temp_path, "wb") as stream:
+            pickle.dump(value, stream, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+    def clear(self) -> None:
+        for directory, _, files in os.walk(self.directory):
+            for file in files:
+                if file.endswith(".pickle"):
+                    os.remove(os.path.join(directory, file))
@@ -13,19 +13,21 @@ Java classfile parsing and manipulation.
 
 import logging
 import time
+import typing
 from io import BytesIO
-from typing import IO, Iterable, Union
+from typing import Any, IO, Iterable, Union
 
 from ._constant import *
 from .attributes import *
-from .. import _argument, constants, environment, types
+from .. import _argument, constants, environment, instructions, types
 from .._struct import *
 from ..abc import Class, Source
 from ..environment import Environment
 from ..error import ClassFormatError
 from ..version import Version
 
-# if typing.TYPE_CHECKING:
+if typing.TYPE_CHECKING:
+    from ..analysis import InsnGraph
 
 logger = logging.getLogger("kirjava.classfile")
 
@@ -549,6 +551,48 @@ class ClassFile(Class, Source):
             self._fields.remove(name_or_field)
         return name_or_field
 
+    # ------------------------------ Assembling ------------------------------ #
+
+    def merge_and_assemble(self, graphs: Iterable["InsnGraph"], **kwargs: Any) -> list[Code]:
+        """
+        Merges the ldc constants of multiple methods' graphs into the constant pool, then assembles the graphs and sets
+        the code attributes of the methods.
+
+        Each method's ldc constants are collected into a local table first, in the order of the block labels, and the
+        tables are then merged into the constant pool in a single pass, in the order of the graphs, before any of them
+        are assembled. The layout of the pool, and so the choice between ldc and ldc_w, then only depends on the graphs
+        and their order, rather than on the order that each method's blocks end up being written in.
+        This is not any faster than assembling the graphs one by one.
+
+        :param graphs: The graphs to assemble, which must all belong to methods in this class.
+        :param kwargs: Any extra arguments to pass to the assemble method (see InsnGraph.assemble()).
+        :return: The assembled code attributes, in the same order as the graphs.
+        """
+
+        graphs = list(graphs)
+        methods = set(map(id, self._methods))
+        for graph in graphs:
+            if not id(graph.method) in methods:
+                raise ValueError("Method %r does not belong to this class." % str(graph.method))
+
+        start = time.perf_counter_ns()
+
+        if self.constant_pool is None:
+            self.constant_pool = ConstantPool()
+        if kwargs.get("adjust_ldcs", True):
+            for table in map(_ldc_constants, graphs):
+                for constant in table:
+                    self.constant_pool.add(constant)
+
+        codes = [graph.assemble(**kwargs) for graph in graphs]
+        for graph, code in zip(graphs, codes):
+            graph.method.code = code
+
+        logger.debug("Assembled %i method(s) in %r in %.1fms." % (
+            len(graphs), self.name, (time.perf_counter_ns() - start) / 1_000_000,
+        ))
+        return codes
+
     # ------------------------------ IO ------------------------------ #
 
     def write(self, buffer: IO[bytes]) -> None:
@@ -598,6 +642,19 @@ class ClassFile(Class, Source):
         logger.debug("Wrote classfile %r in %.1fms." % (self.name, (time.perf_counter_ns() - start) / 1_000_000))
 
 
+def _ldc_constants(graph: "InsnGraph") -> dict[constants.ConstantInfo, None]:
+    """
+    Collects the constants loaded by the ldc and ldc_w instructions in a graph, in a deterministic order.
+    """
+
+    constants_: dict[constants.ConstantInfo, None] = {}
+    for block in sorted(graph, key=lambda block: block.label):
+        for instruction in block.instructions:
+            if instruction == instructions.ldc or instruction == instructions.ldc_w:
+                constants_[instruction.constant] = None
+    return constants_
+
+
 from . import attributes, members
 from ._provider import *
 from .members import FieldInfo, MethodInfo
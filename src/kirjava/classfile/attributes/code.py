@@ -9,8 +9,9 @@ Attributes found exclusively in the Code attribute.
 """
 
 import logging
+import operator
 import typing
-from typing import Any, IO, Iterable, Optional
+from typing import Any, IO, Iterable, Iterator, Optional
 
 from . import AttributeInfo
 from ... import types
@@ -40,7 +41,7 @@ class StackMapTable(AttributeInfo):
     Contains information about stack frames, used for inference verification.
     """
 
-    __slots__ = ("frames",)
+    __slots__ = ("frames", "full_size")
 
     name_ = "StackMapTable"
     since = JAVA_6
@@ -119,6 +120,126 @@ class StackMapTable(AttributeInfo):
         else:
             raise TypeError("Invalid verification type %r." % type_)
 
+    @classmethod
+    def _get_verification_type_size(cls, type_: Verification) -> int:
+        """
+        Gets the size, in bytes, of a verification type info.
+        """
+
+        if isinstance(type_, ClassType) or type(type_) is Array or type(type_) is Uninitialized:
+            return 3
+        return 1
+
+    @classmethod
+    def _frame_encodings(
+            cls,
+            offset_delta: int,
+            previous: tuple[Verification, ...],
+            locals_: tuple[Verification, ...],
+            stack: tuple[Verification, ...],
+    ) -> Iterator[tuple[int, tuple[Verification, ...], "StackMapTable.StackMapFrame"]]:
+        """
+        Yields the different ways a frame can be encoded, given the previous frame.
+
+        :param offset_delta: The offset delta of the frame.
+        :param previous: The locals of the previous frame, as they were declared.
+        :param locals_: The locals in the frame, without any trailing tops.
+        :param stack: The stack in the frame.
+        :return: The size of each encoding, the locals as they'd be declared and the encoded frame.
+        """
+
+        size_of = cls._get_verification_type_size
+
+        trimmed = len(previous)
+        while trimmed and previous[trimmed - 1] is top_t:
+            trimmed -= 1
+
+        if previous[:trimmed] == locals_:
+            if not stack:
+                if offset_delta < 64:
+                    yield 1, previous, StackMapTable.SameFrame(offset_delta)
+                else:
+                    yield 3, previous, StackMapTable.SameFrameExtended(offset_delta)
+            elif len(stack) == 1:
+                if offset_delta < 64:
+                    yield 1 + size_of(stack[0]), previous, StackMapTable.SameLocals1StackItemFrame(offset_delta, stack[0])
+                else:
+                    yield 3 + size_of(stack[0]), previous, StackMapTable.SameLocals1StackItemFrameExtended(
+                        offset_delta, stack[0],
+                    )
+
+        stack_size = sum(map(size_of, stack))
+        locals_size = sum(map(size_of, locals_))
+
+        # Trailing tops are implicit, but declaring some anyway can allow later frames to be appended to this one.
+        for tops in range(4):
+            declared = locals_ + (top_t,) * tops
+            yield 7 + locals_size + tops + stack_size, declared, StackMapTable.FullFrame(offset_delta, declared, stack)
+
+            if stack:
+                continue
+            appended = len(declared) - len(previous)
+            if 0 < appended <= 3 and declared[:len(previous)] == previous:
+                yield (
+                    3 + sum(map(size_of, declared[-appended:])),
+                    declared,
+                    StackMapTable.AppendFrame(offset_delta, declared[-appended:]),
+                )
+
+        if stack:
+            return
+        for chopped in range(1, min(3, len(previous)) + 1):
+            kept = previous[:-chopped]
+            trimmed = len(kept)
+            while trimmed and kept[trimmed - 1] is top_t:
+                trimmed -= 1
+            if kept[:trimmed] == locals_:
+                yield 3, kept, StackMapTable.ChopFrame(offset_delta, chopped)
+
+    @classmethod
+    def encode_frames(
+            cls,
+            initial: tuple[Verification, ...],
+            frames: Iterable[tuple[int, tuple[Verification, ...], tuple[Verification, ...]]],
+    ) -> list["StackMapTable.StackMapFrame"]:
+        """
+        Encodes frames using the smallest stack map frames possible.
+        As chop and append frames are relative to the locals that the previous frame declared, which can include
+        trailing tops (as they are otherwise implicit), the encoding that's smallest for each frame on its own isn't
+        necessarily the smallest overall. Instead, we'll keep track of the cheapest way to reach each set of declared
+        locals, of which there are only a few per frame.
+
+        :param initial: The locals of the implicit initial frame, not including reserved types.
+        :param frames: The offset delta, locals and stack of each frame, not including reserved types.
+        :return: The encoded frames.
+        """
+
+        # The declared locals to the cheapest total size of the frames so far that results in them, and the frames.
+        states: dict[tuple[Verification, ...], tuple[int, tuple | None]] = {initial: (0, None)}
+
+        for offset_delta, locals_, stack in frames:
+            trimmed = len(locals_)
+            while trimmed and locals_[trimmed - 1] is top_t:
+                trimmed -= 1
+            locals_ = locals_[:trimmed]
+
+            new_states: dict[tuple[Verification, ...], tuple[int, tuple | None]] = {}
+            for previous, (size, encoded) in states.items():
+                for frame_size, declared, frame in cls._frame_encodings(offset_delta, previous, locals_, stack):
+                    best = new_states.get(declared)
+                    if best is None or size + frame_size < best[0]:
+                        new_states[declared] = (size + frame_size, (frame, encoded))
+            states = new_states
+
+        _, encoded = min(states.values(), key=operator.itemgetter(0))
+        encoded_frames = []
+        while encoded is not None:
+            frame, encoded = encoded
+            encoded_frames.append(frame)
+        encoded_frames.reverse()
+
+        return encoded_frames
+
     def __init__(self, parent: "Code", frames: Iterable["StackMapTable.StackMapFrame"] | None = None) -> None:
         """
         :param frames: The stackmap frames in this table.
@@ -129,6 +250,8 @@ class StackMapTable(AttributeInfo):
         self.frames: list[StackMapTable.StackMapFrame] = []
         if frames is not None:
             self.frames.extend(frames)
+        # The size that the frames would take up if they were all full frames, only known if they were generated.
+        self.full_size: int | None = None
 
     def __repr__(self) -> str:
         return "<StackMapTable(%r) at %x>" % (self.frames, id(self))
@@ -165,6 +288,24 @@ class StackMapTable(AttributeInfo):
         for stack_frame in self.frames:
             stack_frame.write(class_file, buffer)
 
+    def get_size(self) -> int:
+        """
+        :return: The size of this table's data, in bytes.
+        """
+
+        return 2 + sum(frame.get_size() for frame in self.frames)
+
+    def get_frame_counts(self) -> dict[str, int]:
+        """
+        :return: The number of frames of each kind in this table, by the name of the frame's class.
+        """
+
+        counts: dict[str, int] = {}
+        for frame in self.frames:
+            name = type(frame).__name__
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+
     # ------------------------------ Stack frame types ------------------------------ #
 
     class StackMapFrame:
@@ -223,6 +364,13 @@ class StackMapTable(AttributeInfo):
 
             ...
 
+        def get_size(self) -> int:
+            """
+            :return: The size of this stack map frame, in bytes.
+            """
+
+            ...
+
         def to_frame(self, previous: Frame, code: Optional["Code"] = None) -> Frame:
             """
             Converts this stack map frame to a frame.
@@ -250,6 +398,9 @@ class StackMapTable(AttributeInfo):
         def write(self, class_file: "ClassFile", buffer: IO[bytes]) -> None:
             buffer.write(bytes((self.offset_delta,)))
 
+        def get_size(self) -> int:
+            return 1
+
         def to_frame(self, previous: Frame, code: Optional["Code"] = None) -> Frame:
             frame = previous.copy()
             frame.pop(len(frame.stack))
@@ -289,6 +440,9 @@ class StackMapTable(AttributeInfo):
             buffer.write(bytes((self.offset_delta + 64,)))
             StackMapTable._write_verification_type(self.stack_item, class_file, buffer)
 
+        def get_size(self) -> int:
+            return 1 + StackMapTable._get_verification_type_size(self.stack_item)
+
         def to_frame(self, previous: Frame, code: Optional["Code"] = None) -> Frame:
             frame = previous.copy()
             frame.pop(len(frame.stack))
@@ -334,6 +488,9 @@ class StackMapTable(AttributeInfo):
             buffer.write(pack_H(self.offset_delta))
             StackMapTable._write_verification_type(self.stack_item, class_file, buffer)
 
+        def get_size(self) -> int:
+            return 3 + StackMapTable._get_verification_type_size(self.stack_item)
+
         def to_frame(self, previous: Frame, code: Optional["Code"] = None) -> Frame:
             frame = previous.copy()
             frame.pop(len(frame.stack))
@@ -373,6 +530,9 @@ class StackMapTable(AttributeInfo):
             buffer.write(bytes((251 - self.chopped,)))
             buffer.write(pack_H(self.offset_delta))
 
+        def get_size(self) -> int:
+            return 3
+
         def to_frame(self, previous: Frame, code: Optional["Code"] = None) -> Frame:
             frame = previous.copy()
             frame.pop(len(frame.stack))
@@ -406,6 +566,9 @@ class StackMapTable(AttributeInfo):
             buffer.write(bytes((251,)))
             buffer.write(pack_H(self.offset_delta))
 
+        def get_size(self) -> int:
+            return 3
+
         def to_frame(self, previous: Frame, code: Optional["Code"] = None) -> Frame:
             frame = previous.copy()
             frame.pop(len(frame.stack))
@@ -449,6 +612,9 @@ class StackMapTable(AttributeInfo):
             for local in self.locals:
                 StackMapTable._write_verification_type(local, class_file, buffer)
 
+        def get_size(self) -> int:
+            return 3 + sum(map(StackMapTable._get_verification_type_size, self.locals))
+
         def to_frame(self, previous: Frame, code: Optional["Code"] = None) -> Frame:
             frame = previous.copy()
             frame.pop(len(frame.stack))
@@ -516,6 +682,13 @@ class StackMapTable(AttributeInfo):
             for state in self.stack:
                 StackMapTable._write_verification_type(state, class_file, buffer)
 
+        def get_size(self) -> int:
+            return (
+                7 +
+                sum(map(StackMapTable._get_verification_type_size, self.locals)) +
+                sum(map(StackMapTable._get_verification_type_size, self.stack))
+            )
+
         def to_frame(self, previous: Frame, code: Optional["Code"] = None) -> Frame:
             frame = previous.copy()
             frame.pop(len(frame.stack))
@@ -8,6 +8,8 @@ __all__ = (
     "MergeDepthError",
     "MergeMissingLocalError",
     "UnresolvableSubroutineError",
+    "BudgetExceededError",
+    "CancelledError",
 )
 
 """
@@ -190,3 +192,31 @@ class NotASubroutineError(UnresolvableSubroutineError):
         )
 
         self.origin = origin
+
+
+# ---------------------------------------- Budget errors ---------------------------------------- #
+
+class BudgetExceededError(ValueError):
+    """
+    Raised when an analysis exceeds one of the limits in its budget.
+    """
+
+    def __init__(self, limit: str, value: int | float, message: str | None = None) -> None:
+        """
+        :param limit: The name of the limit that was hit.
+        :param value: The value of the limit.
+        """
+
+        super().__init__(message or "Budget exceeded: hit %s limit of %s." % (limit, value))
+
+        self.limit = limit
+        self.value = value
+
+
+class CancelledError(BudgetExceededError):
+    """
+    Raised when an analysis is cancelled via its cancellation token.
+    """
+
+    def __init__(self) -> None:
+        super().__init__("cancelled", True, message="Analysis was cancelled.")
@@ -373,8 +373,8 @@ fconst_2 = new_instruction(0x0d, "fconst_2", FixedConstantInstruction, constant=
 dconst_0 = new_instruction(0x0e, "dconst_0", FixedConstantInstruction, constant=Double(0))
 dconst_1 = new_instruction(0x0f, "dconst_1", FixedConstantInstruction, constant=Double(1))
 # Other constants
-bipush = new_instruction(0x10, "bipush", IntegerConstantInstruction, {"_value": ">B"})
-sipush = new_instruction(0x11, "sipush", IntegerConstantInstruction, {"_value": ">H"})
+bipush = new_instruction(0x10, "bipush", IntegerConstantInstruction, {"_value": ">b"})
+sipush = new_instruction(0x11, "sipush", IntegerConstantInstruction, {"_value": ">h"})
 ldc = new_instruction(0x12, "ldc", LoadConstantInstruction, {"_index": ">B"})
 ldc_w = new_instruction(0x13, "ldc_w", ldc, {"_index": ">H"})
 ldc2_w = new_instruction(0x14, "ldc2_w", ldc, {"_index": ">H"}, wide=True)
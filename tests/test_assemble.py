@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the transforms done when assembling graphs.
+"""
+
+import unittest
+
+from kirjava import instructions
+from kirjava.analysis import InsnGraph
+from kirjava.analysis.graph.block import InsnBlock
+from kirjava.analysis.graph.edge import ExceptionEdge, FallthroughEdge, JumpEdge, SwitchEdge
+from kirjava.classfile import ClassFile, ConstantPool
+from kirjava.constants import String
+from kirjava.instructions import Instruction, LookupSwitchInstruction
+
+
+class TestAssemble(unittest.TestCase):
+
+    def setUp(self) -> None:
+        # Methods only hold weak references to their classes.
+        self.class_file = ClassFile("Test", is_public=True)
+        self.class_file.constant_pool = ConstantPool()
+
+    def _graph(self, descriptor: str = "(I)I") -> InsnGraph:
+        name = "test%i" % len(self.class_file.methods)
+        return InsnGraph(self.class_file.add_method(name, descriptor, is_static=True))
+
+    def _returns(self, graph: InsnGraph, *instructions_: Instruction) -> InsnBlock:
+        block = graph.block()
+        block.instructions.extend(instructions_)
+        graph.connect(JumpEdge(block, graph.return_block, instructions.ireturn()))
+        return block
+
+    def _switch(self, graph: InsnGraph, instruction: Instruction, cases: dict[int, int | None]) -> None:
+        """
+        Adds a switch to the entry block, where the cases map the values (or indices, for tableswitches) to the constants
+        that are returned, or None to go to the default, which returns -1.
+        """
+
+        graph.entry_block.append(instructions.iload_0())
+        default = self._returns(graph, instructions.iconst_m1())
+        graph.connect(SwitchEdge(graph.entry_block, default, instruction))
+        targets = {None: default}
+        for value, constant in cases.items():
+            to = targets.get(constant)
+            if to is None:
+                to = targets[constant] = self._returns(graph, instructions.bipush(constant))
+            graph.connect(SwitchEdge(graph.entry_block, to, instruction, value))
+
+    def test_merge_and_assemble(self) -> None:
+        graphs = []
+        for name in ("b", "a"):
+            method = self.class_file.add_method(name, "()Ljava/lang/Object;", is_static=True)
+            graph = InsnGraph(method)
+            graph.entry_block.append(instructions.ldc(String(name)))
+            graph.connect(JumpEdge(graph.entry_block, graph.return_block, instructions.areturn()))
+            graphs.append(graph)
+
+        codes = self.class_file.merge_and_assemble(graphs)
+        self.assertEqual([graph.method.code for graph in graphs], codes)
+        # The constants are added in the order of the graphs, before any are assembled.
+        self.assertLess(
+            self.class_file.constant_pool.add(String("b")), self.class_file.constant_pool.add(String("a")),
+        )
+
+        other = ClassFile("Other", is_public=True)
+        method = other.add_method("c", "()V", is_static=True)
+        with self.assertRaises(ValueError):
+            self.class_file.merge_and_assemble([InsnGraph(method)])
+
+    def test_remove_dead_blocks(self) -> None:
+        graph = self._graph()
+        graph.entry_block.append(instructions.iload_0())
+        graph.connect(JumpEdge(graph.entry_block, graph.return_block, instructions.ireturn()))
+
+        # The handler is only used by the dead block, so is removed with it.
+        dead = self._returns(graph, instructions.iconst_0(), instructions.iconst_0(), instructions.idiv())
+        handler = self._returns(graph, instructions.pop(), instructions.iconst_m1())
+        graph.connect(ExceptionEdge(dead, handler, 0))
+
+        code = graph.assemble()
+        self.assertEqual(len(code.instructions), 2)
+        self.assertFalse(code.exception_table)
+        self.assertIn(dead, graph.blocks)  # Not in place, so the graph itself is unchanged.
+
+        code = graph.assemble(remove_dead_blocks=False)
+        self.assertGreater(len(code.instructions), 2)
+
+    def test_layout_handlers_last(self) -> None:
+        graph = self._graph()
+        handler = self._returns(graph, instructions.pop(), instructions.iconst_m1())
+        taken = self._returns(graph, instructions.iconst_4())
+        not_taken = self._returns(graph, instructions.iconst_5())
+
+        graph.entry_block.append(instructions.iconst_1())
+        graph.entry_block.append(instructions.iload_0())
+        graph.entry_block.append(instructions.idiv())
+        graph.connect(JumpEdge(graph.entry_block, taken, instructions.ifeq()))
+        graph.connect(FallthroughEdge(graph.entry_block, not_taken))
+        graph.connect(ExceptionEdge(graph.entry_block, handler, 0))
+
+        # By default, blocks are written in label order, so the handler is written first.
+        code = graph.assemble()
+        handler_pc = code.exception_table[0].handler_pc
+        self.assertLess(handler_pc, max(code.instructions))
+
+        code = graph.assemble(optimise_layout=True)
+        handler_pc = code.exception_table[0].handler_pc
+        for offset, instruction in code.instructions.items():
+            if instruction == instructions.iconst_4 or instruction == instructions.iconst_5:
+                self.assertLess(offset, handler_pc)
+
+    def test_lower_switches(self) -> None:
+        # A dense lookupswitch is smaller as a tableswitch.
+        graph = self._graph()
+        self._switch(graph, instructions.lookupswitch(None, {}), {value: value for value in range(8)})
+
+        switches = [type(instruction) for instruction in graph.assemble().instructions.values()]
+        self.assertIn(instructions.lookupswitch, switches)  # Not lowered by default.
+        switches = [type(instruction) for instruction in graph.assemble(lower_switches=True).instructions.values()]
+        self.assertIn(instructions.tableswitch, switches)
+
+        # And a sparse tableswitch is smaller as a lookupswitch, the filler cases go to the default.
+        graph = self._graph()
+        self._switch(graph, instructions.tableswitch(None, 0, 99, {}), {
+            index: 1 if index in (0, 99) else None for index in range(100)
+        })
+
+        switches = [type(instruction) for instruction in graph.assemble().instructions.values()]
+        self.assertIn(instructions.tableswitch, switches)
+        code = graph.assemble(lower_switches=True)
+        switch = next(
+            instruction for instruction in code.instructions.values() if isinstance(instruction, LookupSwitchInstruction)
+        )
+        self.assertEqual(sorted(switch.offsets), [0, 99])
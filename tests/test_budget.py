@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""
+Tests for limiting analyses with budgets.
+"""
+
+import os
+import unittest
+
+import kirjava
+from kirjava import instructions
+from kirjava.analysis import Budget, CancellationToken, InsnGraph, Trace
+from kirjava.analysis.graph._maxes import trace_maxes
+from kirjava.analysis.graph.edge import FallthroughEdge, JumpEdge
+from kirjava.classfile import ClassFile
+from kirjava.error import BudgetExceededError, CancelledError
+
+TESTS = os.path.dirname(__file__)
+
+
+def _read(*path: str) -> ClassFile:
+    with open(os.path.join(TESTS, *path), "rb") as stream:
+        return ClassFile.read(stream)
+
+
+class TestBudget(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.class_file = _read("samples", "warsaw_crackme.class")
+        cls.method = max(
+            (method for method in cls.class_file.methods if method.code is not None),
+            key=lambda method: len(method.code.instructions),
+        )
+
+    def _cancelled(self) -> Budget:
+        token = CancellationToken()
+        token.cancel()
+        return Budget(token=token)
+
+    def test_error(self) -> None:
+        self.assertTrue(issubclass(BudgetExceededError, ValueError))
+        with self.assertRaises(ValueError):
+            Trace.from_graph(kirjava.disassemble(self.method), budget=self._cancelled())
+
+    def test_disassemble(self) -> None:
+        with self.assertRaises(CancelledError):
+            kirjava.disassemble(self.method, budget=self._cancelled())
+        with self.assertRaises(BudgetExceededError):
+            InsnGraph.disassemble(self.method, budget=Budget(timeout=-1))
+        InsnGraph.disassemble(self.method, budget=Budget(timeout=60))
+
+    def test_maxes(self) -> None:
+        graph = kirjava.disassemble(self.method)
+        with self.assertRaises(CancelledError):
+            trace_maxes(graph, True, self._cancelled())
+        with self.assertRaises(BudgetExceededError):
+            trace_maxes(graph, True, Budget(max_blocks=1))
+        with self.assertRaises(CancelledError):
+            graph.assemble(compute_frames=False, budget=self._cancelled())
+
+    def test_entries(self) -> None:
+        class_file = ClassFile("Test", is_public=True)
+        method = class_file.add_method("test", "(IIIIIIII)I", is_static=True)
+
+        # The merge block is deep copied, so the entries in it are all shared with its predecessors.
+        graph = InsnGraph(method)
+        merge = graph.block()
+        graph.entry_block.append(instructions.iload_0())
+        graph.connect(JumpEdge(graph.entry_block, merge, instructions.ifeq()))
+        graph.connect(FallthroughEdge(graph.entry_block, merge))
+        merge.append(instructions.iload_1())
+        graph.connect(JumpEdge(merge, graph.return_block, instructions.ireturn()))
+
+        trace = Trace.from_graph(graph)
+        shared = sum(len(frame.stack) + len(frame.locals) for frame in trace.entries[merge])
+        with self.assertRaises(BudgetExceededError) as context:
+            Trace.from_graph(graph, budget=Budget(max_entries=shared + len(method.argument_types)))
+        self.assertEqual(context.exception.limit, "entries")
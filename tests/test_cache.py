@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the disassembly and trace caches.
+"""
+
+import os
+import tempfile
+import unittest
+
+import kirjava
+from kirjava import instructions, types
+from kirjava.analysis import InsnGraph
+from kirjava.analysis.graph.edge import JumpEdge
+from kirjava.cache import method_key, DiskCache, MemoryCache
+from kirjava.classfile import ClassFile, MethodInfo
+from kirjava.classfile.attributes.code import StackMapTable
+from kirjava.constants import String
+
+TESTS = os.path.dirname(__file__)
+
+
+def _read(*path: str) -> ClassFile:
+    with open(os.path.join(TESTS, *path), "rb") as stream:
+        return ClassFile.read(stream)
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        # Methods only hold weak references to their classes.
+        self.class_files: list[ClassFile] = []
+
+    def _method(self, class_name: str, constant: str, name: str = "test") -> MethodInfo:
+        class_file = ClassFile(class_name, is_public=True)
+        self.class_files.append(class_file)
+        method = class_file.add_method(name, "()Ljava/lang/Object;", is_static=True)
+
+        graph = InsnGraph(method)
+        graph.entry_block.append(instructions.ldc(String(constant)))
+        graph.connect(JumpEdge(graph.entry_block, graph.return_block, instructions.areturn()))
+        kirjava.assemble(graph)
+
+        return method
+
+    def test_key(self) -> None:
+        self.assertEqual(method_key(self._method("A", "a")), method_key(self._method("B", "a")))
+        self.assertNotEqual(method_key(self._method("A", "a")), method_key(self._method("A", "b")))
+        self.assertNotEqual(method_key(self._method("A", "a"), 1), method_key(self._method("A", "a"), 2))
+
+        # The layout of the class's own constant pool doesn't matter.
+        class_file = self.class_files[0]
+        for index in range(300):
+            class_file.constant_pool.add(String("padding %i" % index))
+        self.assertEqual(method_key(self._method("A", "a")), method_key(class_file.get_method("test")))
+
+    def test_key_read(self) -> None:
+        class_files = [_read("samples", "warsaw_crackme.class") for _ in range(2)]
+        for method_a, method_b in zip(class_files[0].methods, class_files[1].methods):
+            with self.subTest(method=str(method_a)):
+                self.assertEqual(method_key(method_a), method_key(method_b))
+
+    def test_key_frames(self) -> None:
+        class_files = [_read("classes", "local", "LiveLocals.class") for _ in range(2)]
+        method_a, method_b = (class_file.get_method("main") for class_file in class_files)
+        self.assertEqual(method_key(method_a), method_key(method_b))
+
+        # The original frames are reused when assembling, so graphs with different frames can't be shared.
+        frame = method_b.code.stackmap_table[0]
+        method_b.code.stackmap_table[0] = StackMapTable.FullFrame(
+            frame.offset_delta, (*frame.locals, types.int_t), (*frame.stack,),
+        )
+        self.assertNotEqual(method_key(method_a), method_key(method_b))
+
+    def test_trace(self) -> None:
+        cache = MemoryCache()
+        method_a = self._method("A", "a")
+        method_b = self._method("B", "a")
+
+        trace_a = kirjava.trace(method_a, cache=cache)
+        trace_b = kirjava.trace(method_b, cache=cache)
+        self.assertIs(trace_a.graph.method, method_a)
+        self.assertIs(trace_b.graph.method, method_b)
+        self.assertIs(kirjava.trace(method_a, cache=cache), trace_a)
+
+        # The graph is shared between them though, as graphs are copied.
+        self.assertIs(kirjava.disassemble(method_a, cache=cache).method, method_a)
+        self.assertIs(kirjava.disassemble(method_b, cache=cache).method, method_b)
+        self.assertGreater(cache.hits, 0)
+
+    def test_persistent(self) -> None:
+        method = self._method("A", "a")
+        with tempfile.TemporaryDirectory() as directory:
+            cache = DiskCache(directory)
+            with self.assertRaises(TypeError):
+                kirjava.disassemble(method, cache=cache)
+            with self.assertRaises(TypeError):
+                kirjava.trace(method, cache=cache)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+"""
+Tests for generating stackmap frames.
+"""
+
+import os
+import unittest
+from io import BytesIO
+
+import kirjava
+from kirjava import instructions
+from kirjava.classfile import ClassFile
+
+TESTS = os.path.dirname(__file__)
+
+
+def _read(*path: str) -> ClassFile:
+    with open(os.path.join(TESTS, *path), "rb") as stream:
+        return ClassFile.read(stream)
+
+
+class TestFrames(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        # Methods only hold weak references to their classes.
+        cls.class_files = [
+            _read("classes", "exception", "SimpleExceptionTest.class"),
+            _read("classes", "local", "LiveLocals.class"),
+            _read("classes", "loop", "SimpleLoop.class"),
+        ]
+
+    def test_sizes(self) -> None:
+        methods = [method for class_file in self.class_files for method in class_file.methods]
+        for method in methods:
+            if method.code is None or method.code.stackmap_table is None:
+                continue
+            # Tables that are read rather than generated don't know their full size.
+            self.assertIsNone(method.code.stackmap_table.full_size)
+
+            with self.subTest(method=str(method)):
+                code = kirjava.disassemble(method).assemble()
+
+                self.assertIsNotNone(code.stackmap_table.full_size)
+                self.assertLessEqual(code.stackmap_table.get_size() - 2, code.stackmap_table.full_size)
+                self.assertEqual(sum(code.stackmap_table.get_frame_counts().values()), len(code.stackmap_table))
+
+                uncompressed = kirjava.disassemble(method).assemble(compress_frames=False)
+                self.assertEqual(uncompressed.stackmap_table.get_size() - 2, uncompressed.stackmap_table.full_size)
+                self.assertEqual(uncompressed.stackmap_table.full_size, code.stackmap_table.full_size)
+
+    def test_reuse(self) -> None:
+        class_file = _read("classes", "local", "LiveLocals.class")
+        graph = kirjava.disassemble(class_file.get_method("main"))
+
+        # Local 4 is dead in the original frame at the loop header, so its predecessors' frames can't be reused either.
+        graph[3].instructions[1] = instructions.iload(4)
+        reused = graph.assemble()
+        inferred = graph.assemble(reuse_frames=False)
+
+        reused_data = BytesIO()
+        reused.stackmap_table.write(class_file, reused_data)
+        inferred_data = BytesIO()
+        inferred.stackmap_table.write(class_file, inferred_data)
+        self.assertEqual(reused_data.getvalue(), inferred_data.getvalue())
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""
+Tests for computing the maxes without a full trace.
+"""
+
+import os
+import unittest
+
+import kirjava
+from kirjava.analysis import Trace
+from kirjava.analysis.graph._maxes import trace_maxes
+from kirjava.classfile import ClassFile
+from kirjava.error import TypeConflictError
+
+TESTS = os.path.dirname(__file__)
+
+
+def _read(*path: str) -> ClassFile:
+    with open(os.path.join(TESTS, *path), "rb") as stream:
+        return ClassFile.read(stream)
+
+
+class TestMaxes(unittest.TestCase):
+
+    def _check(self, class_file: ClassFile, name: str) -> None:
+        method = class_file.get_method(name)
+        graph = kirjava.disassemble(method)
+        trace = Trace.from_graph(graph)
+
+        max_stack, max_locals, reached = trace_maxes(graph, True)
+        self.assertEqual(max_stack, trace.max_stack)
+        self.assertEqual(max_locals, trace.max_locals)
+        self.assertEqual(reached, set(trace.entries))
+
+        code = graph.assemble(compute_frames=False)
+        self.assertEqual(code.max_stack, trace.max_stack)
+        # The maxes are only computed without a full trace if conflicts aren't being raised.
+        code = graph.assemble(compute_frames=False, do_raise=False)
+        self.assertEqual(code.max_stack, trace.max_stack)
+
+    def test_simple(self) -> None:
+        for name in os.listdir(os.path.join(TESTS, "classes", "simple")):
+            if name.endswith(".class"):
+                class_file = _read("classes", "simple", name)
+                for method in class_file.methods:
+                    if method.code is not None:
+                        with self.subTest(name=name, method=method.name):
+                            self._check(class_file, method.name)
+
+    def test_jsr_fallthrough(self) -> None:
+        # The subroutines here return to blocks that are reached from elsewhere with a different depth.
+        for name in ("JSRTest2.class", "JSRTest3.class"):
+            with self.subTest(name=name):
+                self._check(_read("classes", "jsr", name), "main")
+
+    def test_warsaw_main(self) -> None:
+        self._check(_read("samples", "warsaw_crackme.class"), "main")
+
+    def test_conflicts(self) -> None:
+        # Type conflicts are only found by a full trace, so the maxes alone still need one if they're to be raised.
+        for directory, name, method_name in (
+                ("local", "InvalidDeadLocal.class", "main"),
+                ("new", "UninitSuperFieldTest.class", "<init>"),
+        ):
+            class_file = _read("classes", directory, name)
+            graph = kirjava.disassemble(class_file.get_method(method_name))
+            with self.subTest(name=name):
+                with self.assertRaises(TypeConflictError):
+                    graph.assemble(compute_frames=False)
+                graph.assemble(compute_frames=False, do_raise=False)
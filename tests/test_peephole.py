@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the peephole optimisations and local compaction.
+"""
+
+import unittest
+
+from kirjava import instructions
+from kirjava.analysis import InsnGraph, Trace
+from kirjava.analysis.graph.block import InsnBlock
+from kirjava.analysis.graph.edge import ExceptionEdge, JumpEdge
+from kirjava.analysis.graph.peephole import ConstantFoldRule, DeadStoreRule, _constant, compact_locals
+from kirjava.classfile import ClassFile
+from kirjava.constants import Integer, Long
+from kirjava.instructions import Instruction
+from kirjava.source import InstructionInBlock
+
+
+class TestPeephole(unittest.TestCase):
+
+    def setUp(self) -> None:
+        # Methods only hold weak references to their classes.
+        self.class_file = ClassFile("Test", is_public=True)
+
+    def _graph(self, descriptor: str, *instructions_: Instruction, return_: Instruction) -> InsnGraph:
+        method = self.class_file.add_method("test%i" % len(self.class_file.methods), descriptor, is_static=True)
+        graph = InsnGraph(method)
+        graph.entry_block.instructions.extend(instructions_)
+        graph.connect(JumpEdge(graph.entry_block, graph.return_block, return_))
+        return graph
+
+    def _handler(self, graph: InsnGraph, *instructions_: Instruction) -> InsnBlock:
+        handler = graph.block()
+        handler.append(instructions.pop())
+        handler.instructions.extend(instructions_)
+        graph.connect(ExceptionEdge(graph.entry_block, handler, 0))
+        graph.connect(JumpEdge(handler, graph.return_block, instructions.ireturn()))
+        return handler
+
+    def _fold(self, *instructions_: Instruction) -> int:
+        block = InsnBlock(0, list(instructions_))
+        ConstantFoldRule().apply(None, block, None)
+        self.assertEqual(len(block.instructions), 1, block.instructions)
+        value, _ = _constant(block.instructions[0])
+        return value
+
+    def test_fold(self) -> None:
+        int_min = instructions.ldc(Integer(-2 ** 31))
+        long_min = instructions.ldc2_w(Long(-2 ** 63))
+
+        # Overflows wrap around rather than throwing.
+        self.assertEqual(self._fold(int_min, instructions.iconst_m1(), instructions.idiv()), -2 ** 31)
+        self.assertEqual(self._fold(int_min, instructions.iconst_m1(), instructions.irem()), 0)
+        self.assertEqual(self._fold(int_min, instructions.ineg()), -2 ** 31)
+        self.assertEqual(self._fold(long_min, instructions.ldc2_w(Long(-1)), instructions.ldiv()), -2 ** 63)
+
+        # Division rounds towards zero, so the remainder takes the sign of the dividend.
+        self.assertEqual(self._fold(instructions.bipush(-7), instructions.iconst_2(), instructions.idiv()), -3)
+        self.assertEqual(self._fold(instructions.bipush(-7), instructions.iconst_2(), instructions.irem()), -1)
+        self.assertEqual(self._fold(instructions.bipush(7), instructions.bipush(-2), instructions.irem()), 1)
+
+        # Only the low bits of the shift distance are used.
+        self.assertEqual(self._fold(instructions.iconst_1(), instructions.bipush(33), instructions.ishl()), 2)
+        self.assertEqual(self._fold(instructions.iconst_m1(), instructions.bipush(60), instructions.iushr()), 15)
+        self.assertEqual(self._fold(instructions.lconst_1(), instructions.bipush(65), instructions.lshl()), 2)
+        self.assertEqual(self._fold(instructions.iconst_m1(), instructions.bipush(-1), instructions.ishr()), -1)
+
+        self.assertEqual(self._fold(instructions.sipush(200), instructions.i2b()), -56)
+        self.assertEqual(self._fold(instructions.iconst_m1(), instructions.i2c()), 0xffff)
+        self.assertEqual(self._fold(instructions.ldc(Integer(0x18000)), instructions.i2s()), -0x8000)
+        self.assertEqual(self._fold(long_min, instructions.l2i()), 0)
+
+        # Division by zero throws, so isn't folded.
+        block = InsnBlock(0, [instructions.iconst_1(), instructions.iconst_0(), instructions.idiv()])
+        self.assertEqual(ConstantFoldRule().apply(None, block, None), 0)
+
+    def test_dead_store(self) -> None:
+        def _graph() -> InsnGraph:
+            return self._graph(
+                "()I",
+                instructions.iconst_1(), instructions.istore_0(),
+                instructions.iconst_2(), instructions.istore_0(),
+                instructions.iload_0(),
+                return_=instructions.ireturn(),
+            )
+
+        graph = _graph()
+        self.assertEqual(graph.optimise([DeadStoreRule()], compact=False), 1)
+        self.assertIsInstance(graph.entry_block.instructions[1], instructions.pop)
+
+        # The handler could be entered between the two stores, so the first isn't dead.
+        graph = _graph()
+        self._handler(graph, instructions.iload_0())
+        self.assertEqual(graph.optimise([DeadStoreRule()], compact=False), 0)
+        self.assertIsInstance(graph.entry_block.instructions[1], instructions.istore_0)
+
+    def test_compact_wide(self) -> None:
+        graph = self._graph(
+            "()J",
+            instructions.iconst_1(), instructions.istore_0(), instructions.iload_0(), instructions.pop(),
+            instructions.lconst_1(), instructions.lstore_3(), instructions.lload_3(),
+            return_=instructions.lreturn(),
+        )
+        self.assertEqual(compact_locals(graph), 3)
+        self.assertIsInstance(graph.entry_block.instructions[5], instructions.lstore_0)
+        self.assertIsInstance(graph.entry_block.instructions[6], instructions.lload_0)
+        self.assertEqual(Trace.from_graph(graph).max_locals, 2)
+
+        # Slots that are also used on their own are moved with the wide pair that they're part of.
+        graph = self._graph(
+            "()J",
+            instructions.iconst_1(), instructions.istore_3(),
+            instructions.lconst_1(), instructions.lstore_2(), instructions.lload_2(),
+            return_=instructions.lreturn(),
+        )
+        self.assertEqual(compact_locals(graph), 2)
+        self.assertIsInstance(graph.entry_block.instructions[1], instructions.istore_1)
+        self.assertIsInstance(graph.entry_block.instructions[3], instructions.lstore_0)
+
+        # Overlapping wide pairs can't be separated, so nothing is renumbered.
+        graph = self._graph(
+            "()J",
+            instructions.lconst_0(), instructions.lstore_3(),
+            instructions.lconst_1(), instructions.lstore_2(), instructions.lload_2(),
+            return_=instructions.lreturn(),
+        )
+        self.assertEqual(compact_locals(graph), 0)
+
+    def test_compact_handler(self) -> None:
+        def _graph() -> InsnGraph:
+            return self._graph(
+                "()I",
+                instructions.iconst_1(), instructions.istore_0(),
+                instructions.iconst_2(), instructions.istore_1(), instructions.iload_1(),
+                return_=instructions.ireturn(),
+            )
+
+        graph = _graph()
+        self.assertEqual(compact_locals(graph), 1)
+        self.assertIsInstance(graph.entry_block.instructions[3], instructions.istore_0)
+
+        # Local 0 is read by the handler, so it's live for the whole block and can't share a slot with local 1.
+        graph = _graph()
+        self._handler(graph, instructions.iload_0())
+        self.assertEqual(compact_locals(graph), 0)
+        self.assertIsInstance(graph.entry_block.instructions[3], instructions.istore_1)
+
+    def test_optimise_compact(self) -> None:
+        graph = self._graph(
+            "()I",
+            instructions.iconst_1(), instructions.istore_1(), instructions.iload_1(),
+            return_=instructions.ireturn(),
+        )
+        source = graph.entry_block.instructions[1]
+        graph.source_map[1] = InstructionInBlock(1, graph.entry_block, source)
+
+        # Compacting isn't a rewrite, but the source map is still updated as the store is replaced.
+        self.assertEqual(graph.optimise([], compact=True), 0)
+        self.assertIsInstance(graph.entry_block.instructions[1], instructions.istore_0)
+        self.assertNotIn(1, graph.source_map)
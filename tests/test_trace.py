@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+"""
+Tests for updating and summarising traces.
+"""
+
+import logging
+import os
+import unittest
+
+import kirjava
+from kirjava import instructions, types
+from kirjava.analysis import Entry, Frame, InsnGraph, Trace
+from kirjava.analysis.graph.edge import FallthroughEdge, JumpEdge
+from kirjava.classfile import ClassFile
+
+logger = logging.getLogger("kirjava.analysis._trace")
+
+TESTS = os.path.dirname(__file__)
+CLASSES = (
+    ("depth", "StackDepth.class"),
+    ("exception", "SimpleExceptionTest.class"),
+    ("local", "InvalidDeadLocal.class"),
+    ("local", "LiveLocals.class"),
+    ("loop", "MultiEntryLoop.class"),
+    ("loop", "SimpleLoop.class"),
+    ("phi", "LessSimplePhiTest.class"),
+    ("jsr", "JSRTest2.class"),
+    ("jsr", "JSRTest4.class"),
+)
+
+
+def _frame(frame: Frame) -> tuple:
+    return (
+        tuple(str(entry.generic) for entry in frame.stack),
+        tuple(sorted((index, str(entry.generic)) for index, entry in frame.locals.items())),
+    )
+
+
+def _summary(trace: Trace) -> tuple:
+    entries = {block: sorted(map(_frame, frames)) for block, frames in trace.entries.items() if frames}
+    liveness = {block: (trace.pre_liveness.get(block), trace.post_liveness.get(block)) for block in entries}
+    conflicts = sorted((str(conflict.expected), str(conflict.source)) for conflict in trace.conflicts)
+    return trace.max_stack, trace.max_locals, entries, liveness, conflicts, len(trace.returned)
+
+
+def _block_summary(summary: Trace.Summary) -> tuple:
+    return (
+        summary.block.label,
+        summary.frames,
+        tuple(tuple(sorted(map(str, types))) for types in summary.stack),
+        tuple(sorted((index, tuple(sorted(map(str, types)))) for index, types in summary.locals.items())),
+        len(summary.conflicts),
+    )
+
+
+def _read(directory: str, name: str) -> ClassFile:
+    with open(os.path.join(TESTS, "classes", directory, name), "rb") as stream:
+        return ClassFile.read(stream)
+
+
+class TestUpdate(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        # Methods only hold weak references to their classes.
+        cls.class_files = {name: _read(directory, name) for directory, name in CLASSES}
+
+    def _graphs(self) -> list[InsnGraph]:
+        graphs = []
+        for class_file in self.class_files.values():
+            for method in class_file.methods:
+                if method.code is not None:
+                    graphs.append(kirjava.disassemble(method, do_raise=False))
+        return graphs
+
+    def _blocks(self, graph: InsnGraph) -> list:
+        return [
+            block for block in graph.blocks
+            if not block in (graph.entry_block, graph.return_block, graph.rethrow_block)
+        ]
+
+    def _check(self, trace: Trace, graph: InsnGraph) -> None:
+        self.assertEqual(_summary(trace), _summary(Trace.from_graph(graph, do_raise=False)))
+
+    def test_insert(self) -> None:
+        for graph in self._graphs():
+            for block in self._blocks(graph):
+                with self.subTest(method=str(graph.method), block=str(block)):
+                    graph_ = graph.copy()
+                    trace = Trace.from_graph(graph_, do_raise=False)
+                    block_ = graph_.get(block.label)
+                    block_.instructions[0:0] = [instructions.iconst_0(), instructions.pop()]
+                    trace.update({block_})
+                    self._check(trace, graph_)
+
+    def test_new_local(self) -> None:
+        for graph in self._graphs():
+            trace = Trace.from_graph(graph, do_raise=False)
+            for block in self._blocks(graph):
+                with self.subTest(method=str(graph.method), block=str(block)):
+                    index = graph.method.code.max_locals + block.label
+                    block.instructions[0:0] = [instructions.aconst_null(), instructions.astore(index)]
+                    trace.update({block})
+                    self._check(trace, graph)
+
+    def test_unchanged(self) -> None:
+        for graph in self._graphs():
+            with self.subTest(method=str(graph.method)):
+                trace = Trace.from_graph(graph, do_raise=False)
+                trace.update(())
+                self._check(trace, graph)
+
+    def test_partial(self) -> None:
+        graph = kirjava.disassemble(self.class_files["SimpleLoop.class"].get_method("main"))
+        trace = Trace.from_graph(graph)
+        full = trace.blocks_traced
+
+        block = graph.return_block
+        for edge in graph.in_edges(graph.return_block):
+            block = edge.from_
+        block.instructions[0:0] = [instructions.iconst_0(), instructions.pop()]
+        self.assertTrue(trace.update({block}))
+        self.assertLess(trace.blocks_traced, full)
+        self._check(trace, graph)
+
+
+class TestSummaries(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.class_files = {name: _read(directory, name) for directory, name in CLASSES}
+
+    def _diamonds(self, count: int) -> InsnGraph:
+        class_file = ClassFile("Diamonds", is_public=True)
+        self.class_files[class_file.name] = class_file
+        graph = InsnGraph(class_file.add_method("test", "(I)V", is_static=True))
+
+        previous = graph.entry_block
+        for index in range(count):
+            block = graph.block()
+            previous.instructions.extend((
+                instructions.iload_0(), instructions.istore(1 + index % 8),
+                instructions.aconst_null(), instructions.astore(9 + index % 8),
+                instructions.iload_0(),
+            ))
+            graph.connect(JumpEdge(previous, block, instructions.ifeq()))
+            graph.connect(FallthroughEdge(previous, block))
+            previous = block
+        graph.connect(JumpEdge(previous, graph.return_block, instructions.return_()))
+
+        return graph
+
+    def test_callback(self) -> None:
+        for class_file in self.class_files.values():
+            for method in class_file.methods:
+                if method.code is None:
+                    continue
+                with self.subTest(method=str(method)):
+                    graph = kirjava.disassemble(method, do_raise=False)
+                    trace = Trace.from_graph(graph, do_raise=False, retain=Trace.RETAIN_ALL | Trace.RETAIN_SUMMARIES)
+                    summaries = []
+                    Trace.from_graph(graph, do_raise=False, retain=0, callback=summaries.append)
+
+                    self.assertEqual(
+                        sorted(map(_block_summary, trace.summaries.values())), sorted(map(_block_summary, summaries)),
+                    )
+
+    def test_released_early(self) -> None:
+        graph = self._diamonds(20)
+        blocks = []
+
+        def callback(summary: Trace.Summary) -> None:
+            blocks.append(summary.block)
+            logger.debug("released %s" % summary.block)
+
+        with self.assertLogs(logger, "DEBUG") as logs:
+            trace = Trace.from_graph(graph, retain=0, callback=callback)
+
+        # All but the last few blocks should have been summarised before the first pass finished.
+        finished = next(index for index, line in enumerate(logs.output) if "(pass 1)" in line or "done in" in line)
+        self.assertGreater(sum("released" in line for line in logs.output[:finished]), 15)
+        self.assertEqual(set(blocks), {block for block in graph.blocks if block is not graph.rethrow_block})
+        self.assertEqual(len(blocks), len(set(blocks)))
+        self.assertFalse(trace.entries)
+
+
+class TestEntry(unittest.TestCase):
+
+    def test_merges(self) -> None:
+        entry_a, entry_b, entry_c = (Entry(types.int_t) for _ in range(3))
+        self.assertEqual(entry_a.merges, frozenset())
+
+        entry_a.merge(entry_b)
+        entry_b.merge(entry_c)
+        self.assertEqual(entry_a.merges, {entry_b, entry_c})
+        self.assertEqual(entry_c.merges, {entry_a, entry_b})
+        self.assertEqual(set(entry_a.merges), set(entry_a.adjacent))
+
+        with self.assertRaises(AttributeError):
+            entry_a.merges = set()